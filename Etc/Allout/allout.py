@@ -33,97 +33,416 @@ Report bugs or suggestions to François Pinard <pinard@iro.umontreal.ca>.
 
 __metaclass__ = type
 
+import array
+import itertools
+import re
 import sys
 string = str, str
 
 class UsageError(Exception):
     pass
 
-def read(input=sys.stdin):
-    # Lire INPUT, qui est soit un fichier déjà ouvert, soit le nom d'un
-    # fichier à lire, puis retourner un arbre représentant la structure
-    # `allout' de ce fichier, ou None dans le cas d'un fichier vide.
-    # L'arbre produit est une liste contenant récursivement d'autres listes.
-    # Chaque liste débute par une chaîne donnant le libellé d'un noeud, et
-    # contient ensuite dans l'ordre une chaîne par ligne ordinaire dans ce
-    # noeud ou une sous-liste pour un sous-noeud dans ce noeud.
-
-    # LEVEL vaut 0 pour la hiérarchie super-englobante, 1 pour la hiérarchie
-    # `*', 2 pour la hiérarchie `..', etc.  STACK[LEVEL] contient la liste
-    # des hiérarchies tout-à-fait complétées au niveau LEVEL.  Si
-    # STACK[LEVEL+1] existe, STACK[LEVEL] devra nécessairement recevoir un
-    # nouvel élément au plus tard à la rencontre de la fin de fichier.
-
-    def collapse():
+# Événements produits par `events'.  ENTER débute un noeud et porte son
+# libellé, TEXT porte une ligne de texte, LEAVE termine le noeud courant.
+ENTER, TEXT, LEAVE = 'enter', 'text', 'leave'
+
+# Reconnaît une marque de structure, sa longueur donne le niveau.
+marker = re.compile(r'(\*|\. *[-*+@#.:,;])').match
+
+
+class _Topic:
+    # Un noeud ouvert pendant la lecture.  LINES accumule les lignes de
+    # texte tant que le premier sous-noeud n'est pas vu, et MARGIN est la
+    # plus petite marge parmi les lignes non-blanches de LINES.  Un noeud
+    # sans libellé garde ses événements dans BUFFER tant qu'on ne sait pas
+    # s'il sera remplacé par son unique élément.  PENDING est vrai si
+    # BUFFER contient des lignes venues de sous-noeuds remplacés, dont la
+    # marge à enlever n'est pas encore connue.
+    __slots__ = ('label', 'lines', 'margin', 'children', 'buffer', 'pending')
+
+    def __init__(self, label):
+        self.label = label
+        self.lines = []
+        self.margin = None
+        self.children = 0
+        self.pending = False
+        if label:
+            self.buffer = None
+        else:
+            self.buffer = []
+
+
+def events(input=sys.stdin):
+    """\
+Lire INPUT, qui est soit un fichier déjà ouvert ou tout itérable de lignes,
+soit le nom d'un fichier à lire, et produire un à un les événements (ENTER,
+LIBELLÉ), (TEXT, LIGNE) et (LEAVE, None) décrivant la structure `allout',
+avec les mêmes simplifications que `read'.  Seules les lignes de texte d'un
+même noeud, avant son premier sous-noeud, sont gardées en mémoire.
+"""
+    if isinstance(input, string):
+        input = open(input)
+    # STACK[LEVEL] est le noeud ouvert au niveau LEVEL, la hiérarchie
+    # super-englobante étant au niveau 0.  OUT reçoit les événements prêts.
+    stack = []
+    out = []
+
+    def target(index):
+        # Retourner la liste qui reçoit les événements à l'intérieur du
+        # noeud STACK[INDEX], ou OUT pour l'extérieur de la racine.
+        while index >= 0:
+            buffer = stack[index].buffer
+            if buffer is not None:
+                return buffer
+            index -= 1
+        return out
+
+    def decide(index):
+        # Le noeud sans libellé STACK[INDEX] reçoit un second élément: il
+        # ne sera pas remplacé, produire ce qui était retenu.
+        topic = stack[index]
+        if topic.pending:
+            settle(topic.buffer, index)
+        events = target(index - 1)
+        events.append((ENTER, ''))
+        events += topic.buffer
+        topic.buffer = None
+
+    def flush(index, closing):
+        # Produire les lignes retenues dans STACK[INDEX], sans leur marge
+        # commune.  En fin de noeud, les lignes blanches finales tombent.
+        topic = stack[index]
+        lines = topic.lines
+        if closing and index > 0:
+            while lines and not lines[-1]:
+                del lines[-1]
+        if not lines:
+            return
+        margin = topic.margin
+        if not margin or index == 0:
+            margin = 0
+        events = target(index)
+        for line in lines:
+            events.append((TEXT, line[margin:]))
+        topic.lines = []
+
+    def strip(line, index):
+        # Retourner LINE, qui rejoint le texte de STACK[INDEX], sans la
+        # marge de ce noeud, mais sans excéder la marge propre à LINE.  La
+        # ligne compte ensuite dans la marge du noeud, comme toute autre.
+        # Le texte de la racine garde sa marge.
+        if index == 0:
+            return line
+        topic = stack[index]
+        count = len(line) - len(line.lstrip(' '))
+        if topic.margin is None or topic.margin > count:
+            topic.margin = count
+        return line[topic.margin:]
+
+    def settle(events, index):
+        # Les lignes en attente dans EVENTS rejoignent le texte de
+        # STACK[INDEX]: leur enlever la marge de ce noeud.  Une ligne en
+        # attente est notée (TEXT, LIGNE, None).
+        for position, event in enumerate(events):
+            if len(event) == 3:
+                events[position] = TEXT, strip(event[1], index)
+
+    def close():
+        # Fermer le noeud le plus profond.
+        index = len(stack) - 1
+        topic = stack[index]
+        if topic.buffer is not None:
+            elements = len(topic.lines) + topic.children
+            if index > 0:
+                while topic.lines and not topic.lines[-1]:
+                    del topic.lines[-1]
+                    elements -= 1
+            if elements == 1:
+                # Remplacer le noeud par son unique élément.  Une ligne
+                # rejoint le texte du parent, dont la marge est déjà
+                # produite: n'enlever que ce qui n'excède pas cette marge.
+                # Si le parent peut lui-même être remplacé, la ligne attend
+                # de savoir quel noeud la reçoit vraiment.
+                events = target(index - 1)
+                parent = stack[index - 1]
+                waiting = index > 1 and parent.buffer is not None
+                if topic.lines:
+                    if waiting:
+                        events.append((TEXT, topic.lines[0], None))
+                        parent.pending = True
+                    else:
+                        events.append(
+                            (TEXT, strip(topic.lines[0], index - 1)))
+                else:
+                    if topic.pending:
+                        if waiting:
+                            parent.pending = True
+                        else:
+                            settle(topic.buffer, index - 1)
+                    events += topic.buffer
+                stack.pop()
+                return
+            decide(index)
+        flush(index, True)
+        target(index - 1).append((LEAVE, None))
+        stack.pop()
+
+    def element(index):
+        # Un élément non-blanc s'ajoute à STACK[INDEX].
+        topic = stack[index]
+        if (topic.buffer is not None
+                and (topic.lines or topic.children)):
+            decide(index)
+
+    def collapse(level):
         # Rapetisser (ou allonger) la pile STACK pour lui donner exactement
-        # la longueur LEVEL, tout en déclarant que les structures empilées
-        # au-delà ont terminé leur croissance: on peut donc immédiatement
-        # imbriquer ces structures dans l'arbre en construction.
-        while len(stack) < level:
-            stack.append([''])
+        # la longueur LEVEL.
         while len(stack) > level:
-            structure = stack.pop()
-            while len(structure) > 1 and structure[-1] == '':
-                del structure[-1]
-            if len(structure) == 2 and structure[0] == '':
-                structure = structure[1]
+            close()
+        while len(stack) < level:
+            if stack:
+                open_topic('')
             else:
-                margin = None
-                for line in structure[1:]:
-                    if isinstance(line, string) and line:
-                        count = re.match(' *', line).end(0)
-                        if margin is None or count < margin:
-                            margin = count
-                if margin is not None:
-                    for counter in range(1, len(structure)):
-                        line = structure[counter]
-                        if isinstance(line, string) and line:
-                            structure[counter] = line[margin:]
-            stack[-1].append(structure)
+                stack.append(_Topic(''))
 
-    if isinstance(input, string):
-        input = file(input)
-    buffer = input.read()
-    import re
-    stack = []
-    for line in buffer.splitlines():
-        match = re.match(r'(\*|\. *[-*+@#.:,;])', line)
+    def open_topic(label):
+        index = len(stack) - 1
+        parent = stack[index]
+        element(index)
+        if not parent.children:
+            flush(index, False)
+        parent.children += 1
+        topic = _Topic(label)
+        if label:
+            target(index).append((ENTER, label))
+        stack.append(topic)
+
+    for line in input:
+        match = marker(line)
         if match:
             level = match.end(0)
-            collapse()
-            stack.append([line[level:].strip()])
+            collapse(level)
+            open_topic(line[level:].strip())
         elif stack:
             line = line.rstrip()
-            if line or len(stack[-1]) > 1:
-                stack[-1].append(line)
+            topic = stack[-1]
+            if line:
+                element(len(stack) - 1)
+                count = len(line) - len(line.lstrip(' '))
+                if topic.margin is None or count < topic.margin:
+                    topic.margin = count
+                topic.lines.append(line)
+            elif topic.lines or topic.children:
+                topic.lines.append(line)
         else:
             line = line.strip()
             if line:
-                stack.append([line])
-    level = 1
-    collapse()
-    if len(stack[0]) == 2 and stack[0][0] == '':
-        stack[0] = stack[0][1]
-    return stack[0]
+                stack.append(_Topic(line))
+                out.append((ENTER, line))
+        if out:
+            yield from out
+            del out[:]
+    collapse(1)
+    close()
+    yield from out
+
+
+def read(input=sys.stdin):
+    # Lire INPUT, qui est soit un fichier déjà ouvert ou tout itérable de
+    # lignes, soit le nom d'un fichier à lire, puis retourner un arbre
+    # représentant la structure `allout' de ce fichier.  L'arbre produit
+    # est une liste contenant récursivement d'autres listes.  Chaque liste
+    # débute par une chaîne donnant le libellé d'un noeud, et contient
+    # ensuite dans l'ordre une chaîne par ligne ordinaire dans ce noeud ou
+    # une sous-liste pour un sous-noeud dans ce noeud.
+    return build(events(input))
+
+
+def select(input, selection):
+    # Retourner les événements du sous-arbre de INPUT atteint en prenant,
+    # à chaque niveau, la branche dont l'indice suit dans SELECTION.  Sans
+    # sélection, le fichier est traité au fil de la lecture; autrement,
+    # la structure est d'abord lue dans un `Outline' compact, pour que les
+    # indices négatifs aient un sens.
+    if not selection:
+        return events(input)
+    return Outline(events(input)).select(selection)
+
+
+def build(events):
+    # Construire l'arbre décrit par la suite EVENTS.
+    stack = [[]]
+    for kind, value in events:
+        if kind is TEXT:
+            stack[-1].append(value)
+        elif kind is ENTER:
+            structure = [value]
+            stack[-1].append(structure)
+            stack.append(structure)
+        else:
+            stack.pop()
+    return stack[0][0]
+
+
+class Outline:
+    """\
+Représentation compacte d'un arbre `allout', alternative aux listes
+imbriquées.  Chaque élément, noeud ou ligne de texte, reçoit un numéro dans
+l'ordre du fichier, la hiérarchie super-englobante ayant le numéro 0.  Des
+tableaux parallèles donnent, pour chaque numéro, le niveau, le parent, le
+premier sous-élément et l'élément suivant de même parent (ou -1), ainsi que
+le début et la fin du texte, libellé ou ligne, dans une seule chaîne
+partagée.  La navigation se fait donc en temps constant, et les parcours
+n'utilisent pas la récursion.
+"""
+
+    def __init__(self, events=()):
+        self.level = array.array('i')
+        self.parent = array.array('i')
+        self.first = array.array('i')
+        self.next = array.array('i')
+        self.start = array.array('l')
+        self.end = array.array('l')
+        self.topic = array.array('b')
+        fragments = []
+        offset = 0
+        # STACK contient les noeuds ouverts, LAST le dernier élément ajouté
+        # à chacun d'eux, ou -1.
+        stack = [-1]
+        last = [-1]
+        for kind, value in events:
+            if kind is LEAVE:
+                stack.pop()
+                last.pop()
+                continue
+            node = len(self.level)
+            parent = stack[-1]
+            self.level.append(len(stack) - 1)
+            self.parent.append(parent)
+            self.first.append(-1)
+            self.next.append(-1)
+            self.start.append(offset)
+            offset += len(value)
+            self.end.append(offset)
+            fragments.append(value)
+            if last[-1] >= 0:
+                self.next[last[-1]] = node
+            elif parent >= 0:
+                self.first[parent] = node
+            last[-1] = node
+            if kind is ENTER:
+                self.topic.append(True)
+                stack.append(node)
+                last.append(-1)
+            else:
+                self.topic.append(False)
+        self.buffer = ''.join(fragments)
+
+    def __len__(self):
+        return len(self.level)
+
+    def text(self, node):
+        # Retourner le libellé ou la ligne de l'élément NODE.
+        return self.buffer[self.start[node]:self.end[node]]
+
+    def children(self, node):
+        # Produire les sous-éléments de NODE, dans l'ordre.
+        node = self.first[node]
+        while node >= 0:
+            yield node
+            node = self.next[node]
+
+    def events(self, node=0):
+        # Produire les événements décrivant le sous-arbre de NODE, tels que
+        # les produirait `events' sur le fichier `allout' correspondant.
+        if not len(self):
+            return
+        top = node
+        while True:
+            if self.topic[node]:
+                yield ENTER, self.text(node)
+                if self.first[node] >= 0:
+                    node = self.first[node]
+                    continue
+                yield LEAVE, None
+            else:
+                yield TEXT, self.text(node)
+            while node != top and self.next[node] < 0:
+                node = self.parent[node]
+                yield LEAVE, None
+            if node == top:
+                return
+            node = self.next[node]
+
+    def tree(self, node=0):
+        # Retourner le sous-arbre de NODE en listes imbriquées.
+        return build(self.events(node))
+
+    def select(self, selection):
+        # Retourner les événements du sous-arbre choisi par SELECTION, avec
+        # la même interprétation des indices qu'avec les listes imbriquées:
+        # 0 est le libellé, les sous-éléments sont comptés à partir de 1, ou
+        # à partir de la fin s'ils sont négatifs.
+        node = 0
+        for counter, branch in enumerate(selection):
+            if not self.topic[node]:
+                return walk(self.text(node)[branch])
+            if branch == 0:
+                structure = self.text(node)
+                for branch in selection[counter+1:]:
+                    structure = structure[branch]
+                return walk(structure)
+            children = list(self.children(node))
+            if branch > 0:
+                node = children[branch-1]
+            else:
+                node = children[branch]
+        return self.events(node)
+
+
+def walk(structure):
+    # Produire les événements décrivant l'arbre STRUCTURE, tels que les
+    # produirait `events' sur le fichier `allout' correspondant.
+    if isinstance(structure, string):
+        yield TEXT, structure
+        return
+    # STACK contient, pour chaque noeud ouvert, l'itérateur sur ses
+    # sous-éléments restants.
+    yield ENTER, structure[0]
+    stack = [itertools.islice(structure, 1, None)]
+    while stack:
+        for branch in stack[-1]:
+            if isinstance(branch, string):
+                yield TEXT, branch
+            else:
+                yield ENTER, branch[0]
+                stack.append(itertools.islice(branch, 1, None))
+                break
+        else:
+            stack.pop()
+            yield LEAVE, None
 
 def write(structure, output=sys.stdout.write):
     # Transformer l'arbre STRUCTURE en un fichier `allout'.  Le résultat est
     # écrit sur OUTPUT, qui doit être une fonction d'écriture ou encore, le
     # nom d'un fichier à créer.
-    if isinstance(output, string):
-        write_recursive(structure, file(output, 'w').write, 0)
-    else:
-        write_recursive(structure, output, 0)
+    write_events(walk(structure), output)
 
-def write_recursive(structure, write, level):
-    if isinstance(structure, string):
-        write('%*s %s\n' % (level, '', structure))
-        return
-    if level == 0:
-        write('* %s\n' % structure[0])
-    elif level == 1:
-        write('.. %s\n' % structure[0])
-    else:
-        write('.%*s %s\n' % (level, '.:,;'[(level-1) % 4], structure[0]))
-    for branch in structure[1:]:
-        write_recursive(branch, write, level+1)
+def write_events(events, output=sys.stdout.write):
+    # Comme `write', mais à partir de la suite d'événements EVENTS.
+    if isinstance(output, string):
+        output = open(output, 'w').write
+    level = 0
+    for kind, value in events:
+        if kind is TEXT:
+            output('%*s %s\n' % (level, '', value))
+        elif kind is ENTER:
+            if level == 0:
+                output('* %s\n' % value)
+            elif level == 1:
+                output('.. %s\n' % value)
+            else:
+                output('.%*s %s\n' % (level, '.:,;'[(level-1) % 4], value))
+            level += 1
+        else:
+            level -= 1
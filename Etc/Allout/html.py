@@ -23,7 +23,7 @@ s'effectue sur l'arbre après les simplifications décrites plus haut.
 """
 
 __metaclass__ = type
-import cgi
+import html
 import sys
 
 
@@ -41,16 +41,15 @@ class Main:
         # Lire le fichier en format `allout'.
         from . import allout
         if len(arguments) == 0:
-            structure = allout.read()
+            input = sys.stdin
         elif len(arguments) == 1:
-            structure = allout.read(arguments[0])
+            input = arguments[0]
         else:
             raise allout.UsageError("Trop d'arguments.")
         # Choisir la sous-branche désirée.
-        for branche in self.selection:
-            structure = structure[branche]
+        events = allout.select(input, self.selection)
         # Imprimer la liste résultante.
-        write_html(structure)
+        write_html_events(events)
 
 main = Main().main
 
@@ -59,8 +58,17 @@ def write_html(structure, write=sys.stdout.write):
     # Transformer l'arbre STRUCTURE en HTML.
     # Le résultat est écrit sur OUTPUT, qui doit être une fonction
     # d'écriture ou encore, le nom d'un fichier à créer.
+    from . import allout
+    write_html_events(allout.walk(structure), write)
+
+
+def write_html_events(events, write=sys.stdout.write):
+    # Comme `write_html', mais à partir de la suite d'événements EVENTS,
+    # produits par `allout.events' ou `allout.walk'.  Chaque événement est
+    # écrit aussitôt reçu.
+    from .allout import ENTER, TEXT
     if isinstance(write, str):
-        write = file(write, 'w').write
+        write = open(write, 'w').write
     write(('<html>\n'
            ' <head>\n'
            '  <meta http-equiv="Content-Type" content="text/html;'
@@ -68,31 +76,37 @@ def write_html(structure, write=sys.stdout.write):
            '  <title>%s</title>\n'
            ' </head>\n'
            ' <body>\n')
-          % cgi.escape(''))
-    write_html_recursive(structure, write, 1)
+          % escape(''))
+    level = 1
+    for kind, value in events:
+        if kind is TEXT:
+            if level > 1:
+                write('  ' * level + '<li>')
+            if value.startswith('http://'):
+                write('<a href="%s">%s</a>\n' % (value, escape(value)))
+            else:
+                write(escape(value))
+            if level > 1:
+                write('</li>\n')
+        elif kind is ENTER:
+            if level > 1:
+                write('  ' * level + '<li>')
+            write(escape(value) + '\n')
+            write('  ' * level + ' <ol>\n')
+            level += 1
+        else:
+            level -= 1
+            write('  ' * level + ' </ol>\n' + '  ' * level)
+            if level > 1:
+                write('</li>\n')
     write(' </body>\n'
           + '</html>\n')
 
 
-def write_html_recursive(structure, write, level):
-    # SPACING est True à l'entrée si la structure précédente s'imprimait sur
-    # plusieurs lignes, et la valeur de cette fonction est True pour
-    # indiquer que STRUCTURE a requis plus d'une ligne pour s'imprimer.
-    if level > 1:
-        write('  ' * level + '<li>')
-    if isinstance(structure, str):
-        if structure.startswith('http://'):
-            write('<a href="%s">%s</a>\n' % (structure, cgi.escape(structure)))
-        else:
-            write(cgi.escape(structure))
-    else:
-        write(cgi.escape(structure[0]) + '\n')
-        write('  ' * level + ' <ol>\n')
-        for element in structure[1:]:
-            write_html_recursive(element, write, level+1)
-        write('  ' * level + ' </ol>\n' + '  ' * level)
-    if level > 1:
-        write('</li>\n')
+def escape(text):
+    # Protéger les caractères spéciaux de TEXT, comme le faisait
+    # `cgi.escape', disparu depuis.
+    return html.escape(text, quote=False)
 
 if __name__ == '__main__':
     main(*sys.argv[1:])
@@ -48,19 +48,18 @@ class Main:
         # Lire le fichier en format `allout'.
         from . import allout
         if len(arguments) == 0:
-            structure = allout.read()
+            input = sys.stdin
         elif len(arguments) == 1:
-            structure = allout.read(arguments[0])
+            input = arguments[0]
         else:
             raise allout.UsageError("Trop d'arguments.")
         # Choisir la sous-branche désirée.
-        for branche in self.selection:
-            structure = structure[branche]
+        events = allout.select(input, self.selection)
         # Imprimer la liste résultante.
         if self.allout:
-            allout.write(structure)
+            allout.write_events(events)
         else:
-            write_listing(structure)
+            write_listing_events(events)
 
 main = Main().main
 
@@ -70,28 +69,42 @@ def write_listing(structure, output=sys.stdout.write):
     # blanches, pour souligner l'arboresence.  Le résultat est écrit sur
     # OUTPUT, qui doit être une fonction d'écriture ou encore, le nom d'un
     # fichier à créer.
-    if isinstance(output, string):
-        write_listing_recursive(structure, file(output, 'w').write, 0, False)
-    else:
-        write_listing_recursive(structure, output, 0, False)
+    from . import allout
+    write_listing_events(allout.walk(structure), output)
 
-def write_listing_recursive(structure, write, level, spacing):
-    # SPACING est True à l'entrée si la structure précédente s'imprimait sur
-    # plusieurs lignes, et la valeur de cette fonction est True pour
-    # indiquer que STRUCTURE a requis plus d'une ligne pour s'imprimer.
-    if spacing or (isinstance(structure, list) and len(structure) > 1):
-        write('\n')
-    write('  ' * level)
-    if isinstance(structure, string):
-        write(structure)
-        write('\n')
-        return False
-    write(structure[0])
-    write('\n')
+def write_listing_events(events, output=sys.stdout.write):
+    # Comme `write_listing', mais à partir de la suite d'événements EVENTS.
+    # Un noeud ayant du contenu est précédé d'une ligne blanche, tout comme
+    # l'élément qui suit un tel noeud.  Il faut donc voir l'événement qui
+    # suit ENTER avant de pouvoir écrire le libellé.
+    from .allout import ENTER, TEXT, LEAVE
+    if isinstance(output, string):
+        output = open(output, 'w').write
+    level = 0
     spacing = False
-    for element in structure[1:]:
-        spacing = write_listing_recursive(element, write, level+1, spacing)
-    return len(structure) > 1
+    label = None
+    for kind, value in events:
+        if label is not None:
+            # Un libellé attend: le noeud a du contenu si l'événement
+            # courant n'est pas sa fin.
+            if spacing or kind is not LEAVE:
+                output('\n')
+            output('  ' * level + label + '\n')
+            label = None
+            spacing = False
+            if kind is LEAVE:
+                continue
+            level += 1
+        if kind is ENTER:
+            label = value
+        elif kind is TEXT:
+            if spacing:
+                output('\n')
+            output('  ' * level + value + '\n')
+            spacing = False
+        else:
+            level -= 1
+            spacing = True
 
 if __name__ == '__main__':
     main(*sys.argv[1:])
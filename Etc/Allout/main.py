@@ -29,8 +29,7 @@ def main(*arguments):
             from . import html
             html.main(*arguments)
         elif action == 'list':
-            import codecs
-            sys.stdout = codecs.getwriter('UTF-8')(sys.stdout)
+            sys.stdout.reconfigure(encoding='UTF-8')
             from . import listing
             listing.main(*arguments)
         elif action == 'texi':
@@ -13,13 +13,22 @@ Usage: allout texi [OPTION]... [INPUT]...
   -H        suppress Texinfo file header
   -T        suppress Texinfo file trailer
   -I PATH   search included Texinfo files along PATH
+  -C DIR    cache the Texinfo output of each top-level topic within DIR
+
+With `-C', a top-level topic is only rendered again when its contents, the
+contents of the files it includes, or the index state it starts from have
+changed; otherwise, its previous output is taken from DIR.
 
 Les conventions d'écriture d'un fichier `allout' en vue d'une transformation
 Texinfo ne sont pas encore décrites ici.  Pour l'un des ces jours pluvieux!
 """
 
 __metaclass__ = type
-import os, re, sys
+import hashlib, os, pickle, re, sys
+
+# Change this whenever the Texinfo produced for a given topic changes, so
+# fragments cached by a previous version get ignored.
+cache_version = 1
 
 Default_Copyright = """\
 Permission is granted to make and distribute verbatim copies of
@@ -67,6 +76,7 @@ class Main:
     def __init__(self):
         # Options.
         self.includes = []
+        self.cache = None
         self.header = True
         self.trailer = True
         # Variables.
@@ -88,9 +98,8 @@ class Main:
         self.Description = None
         self.Copyright = None            # `\n' included
         # Flattener.
-        import string
-        self.flattener = string.maketrans(
-            'àâçéêèëîïôûùüÀÂÇÉÊÈËÎÏÔÛÙÜ«»:`\''.encode('Latin-1'),
+        self.flattener = str.maketrans(
+            'àâçéêèëîïôûùüÀÂÇÉÊÈËÎÏÔÛÙÜ«»:`\'',
             r'aaceeeeiiouuuAACEEEEIIOOUU     ')
         # Index processing.
         self.equivalences = {}
@@ -100,16 +109,18 @@ class Main:
         arguments = self.save_options(arguments)
         if arguments:
             for argument in arguments:
-                self.process_file(argument, file(argument))
+                self.process_file(argument, open(argument))
         else:
             self.process_file('<stdin>', sys.stdin)
 
     def save_options(self, arguments):
         # Decode options.
         import getopt
-        options, arguments = getopt.getopt(arguments, 'I:HT')
+        options, arguments = getopt.getopt(arguments, 'C:I:HT')
         for option, value in options:
-            if option == '-I':
+            if option == '-C':
+                self.cache = value
+            elif option == '-I':
                 self.includes = value.split(':')
             elif option == '-H':
                 self.header = False
@@ -119,16 +130,21 @@ class Main:
 
     def process_file(self, name, input):
         self.input_name = name
-        structure = self.extract_structure(input)
+        events = self.extract_events(input)
         self.ensure_values()
         write = sys.stdout.write
         if self.header:
             self.produce_header(write)
-        self.process_structure(structure, write, 0)
+        if self.cache:
+            self.process_cached(events, write)
+        else:
+            self.process_events(events, write, 0)
         if self.trailer:
             self.produce_trailer(write)
 
-    def extract_structure(self, input):
+    def extract_events(self, input,
+                       copyright=re.compile(r'Copyright (\(C\)|©) (.*)').match,
+                       assignment=re.compile(r'(\S+):\s+(.*)').match):
         # Process initial lines.
         line = input.readline()
         if line and line[0] not in '*.':
@@ -139,7 +155,7 @@ class Main:
             self.Oneliner = line + '\n'
             line = input.readline()
         if line and line[0] not in '*.':
-            match = re.match('Copyright (\(C\)|©) (.*)', line)
+            match = copyright(line)
             if not match:
                 sys.stderr.write(
                     "%(input_name)s might not be in proper format.\n"
@@ -151,7 +167,7 @@ class Main:
         spacing = 0
         while line and line[0] not in '*.':
             line = line.rstrip()
-            match = re.match('(\S+):\s+(.*)', line)
+            match = assignment(line)
             if match:
                 if variable:
                     self.set_variable(variable, ''.join(fragments))
@@ -173,13 +189,10 @@ class Main:
             line = input.readline()
         if variable:
             self.set_variable(variable, ''.join(fragments))
-        # Return the allout part as a structure.
-        def generator(line, input):
-            yield line
-            for line in input:
-                yield line
+        # Return the allout part as events, read as they get consumed.
+        import itertools
         from . import allout
-        return allout.read(generator(line, input))
+        return allout.events(itertools.chain((line,), input))
 
     def ensure_values(self):
         # Ensure values to some variables.
@@ -194,9 +207,9 @@ class Main:
             self.Title = self.Header
         if self.header and not self.Copyright:
             if os.path.exists('copyrall'):
-                self.Copyright = file('copyrall').read()
+                self.Copyright = open('copyrall').read()
             elif os.path.exists('../copyrall'):
-                self.Copyright = file('../copyrall').read()
+                self.Copyright = open('../copyrall').read()
             else:
                 self.Copyright = Default_Copyright
 
@@ -232,7 +245,7 @@ class Main:
         elif os.path.exists('version.texi'):
             write('\n')
             if self.includes:
-                self.include('version.texi')
+                self.include('version.texi', write)
             else:
                 write('@include version.texi\n')
         write('\n'
@@ -316,20 +329,143 @@ class Main:
 
     def process_structure(self, structure, write, level):
         # Transform the allout structure.
-        if isinstance(structure, str):
-            self.output_text(structure, write)
+        from . import allout
+        self.process_events(allout.walk(structure), write, level)
+
+    def process_events(self, events, write, level, stack=None):
+        # Transform the allout events, writing each as soon as it comes.
+        # STACK holds, for each open node, the level of its sub-nodes,
+        # whether these are items, and what to write once it closes.
+        from .allout import ENTER, TEXT
+        if stack is None:
+            stack = [(level, False, None)]
+        skipping = 0
+        for kind, value in events:
+            if skipping:
+                # Ignore the contents of an included node.
+                if kind is ENTER:
+                    skipping += 1
+                elif kind is not TEXT:
+                    skipping -= 1
+            elif kind is TEXT:
+                self.output_text(value, write)
+            elif kind is ENTER:
+                level, items, ending = stack[-1]
+                if items:
+                    if value:
+                        self.output_text('@item %s' % value, write)
+                    else:
+                        write('@item\n')
+                    stack.append((level, False, None))
+                elif self.process_label(value, write, level, stack):
+                    skipping = 1
+            else:
+                level, items, ending = stack.pop()
+                if ending:
+                    write(ending)
+
+    def process_cached(self, events, write):
+        # Transform the allout events like `process_events', but render
+        # each top-level topic on its own, through `process_fragment'.  The
+        # final output is the concatenation of all fragments.
+        from .allout import ENTER, TEXT
+        events = iter(events)
+        for kind, value in events:
+            break
+        else:
+            return
+        if kind is TEXT:
+            self.output_text(value, write)
+            return
+        stack = [(0, False, None)]
+        if self.process_label(value, write, 0, stack):
             return
-        if ' ' in structure[0]:
-            first, rest = structure[0].split(None, 1)
+        frame = stack[-1]
+        fragment = []
+        depth = 0
+        for kind, value in events:
+            if depth == 0 and kind is TEXT:
+                self.output_text(value, write)
+                continue
+            if depth == 0 and kind is not ENTER:
+                # The root topic closes.
+                level, items, ending = frame
+                if ending:
+                    write(ending)
+                break
+            fragment.append((kind, value))
+            if kind is ENTER:
+                depth += 1
+            elif kind is not TEXT:
+                depth -= 1
+                if depth == 0:
+                    self.process_fragment(fragment, write, frame)
+                    fragment = []
+
+    def process_fragment(self, fragment, write, frame):
+        # Write the Texinfo for FRAGMENT, the events of a top-level topic
+        # within FRAME.  Its output also depends on the index state when
+        # it starts, and on included files, so these go into the key of
+        # the cache entry.  The entry also saves how the index state
+        # changes, so a cache hit leaves the same state as rendering.
+        digest = hashlib.sha1(repr(
+            (cache_version, frame, self.includes, fragment,
+             sorted(self.equivalences.items()), self.delayed_text)
+            ).encode('UTF-8'))
+        if self.includes:
+            from .allout import ENTER
+            for kind, value in fragment:
+                # Only a node label may be an include directive, see
+                # `process_label'.
+                if (kind is ENTER and value.endswith('.all')
+                        and ' ' not in value):
+                    name = self.find_include(value[:-4] + '.texi')
+                    if os.path.exists(name):
+                        with open(name, 'rb') as input:
+                            digest.update(input.read())
+        name = os.path.join(self.cache, digest.hexdigest())
+        try:
+            with open(name, 'rb') as input:
+                text, equivalences, delayed_text = pickle.load(input)
+        except Exception:
+            # Any unreadable entry, whatever the reason, is a cache miss.
+            before = set(self.equivalences)
+            fragments = []
+            self.process_events(fragment, fragments.append, frame[0],
+                                [frame])
+            text = ''.join(fragments)
+            equivalences = {}
+            for key, entries in self.equivalences.items():
+                if key not in before:
+                    equivalences[key] = entries
+            if not os.path.isdir(self.cache):
+                os.makedirs(self.cache)
+            temporary = '%s.%d' % (name, os.getpid())
+            with open(temporary, 'wb') as output:
+                pickle.dump((text, equivalences, self.delayed_text),
+                            output, -1)
+            os.replace(temporary, name)
+        else:
+            self.equivalences.update(equivalences)
+            self.delayed_text = delayed_text
+        write(text)
+
+    def process_label(self, label, write, level, stack,
+                      command=re.compile(r'@[^{]+{([^}]*)}').sub,
+                      spaces=re.compile('  +').sub):
+        # Transform the LABEL of a node at LEVEL, and push on STACK what
+        # its sub-nodes need.  Return True if these should be ignored.
+        if ' ' in label:
+            first, rest = label.split(None, 1)
         else:
-            first = structure[0]
+            first = label
             if first.endswith('.all'):
                 texi_name = first[:-4] + '.texi'
                 if self.includes:
-                    self.include(texi_name)
-                    return
-                write('@include %s\n' % texi_name)
-                return
+                    self.include(texi_name, write)
+                else:
+                    write('@include %s\n' % texi_name)
+                return True
             rest = ''
         if first.startswith('@'):
             if first in ('@section', '@unnumbered', '@heading', '@appendix'):
@@ -343,54 +479,44 @@ class Main:
                     second = third = rest
                 if second != '-':
                     second = second.replace('@@', ' ')
-                    second = re.sub(r'@[^{]+{([^}]*)}', r'\1', second)
+                    second = command(r'\1', second)
                     second = second.translate(self.flattener)
-                    second = re.sub('  +', ' ', second)
+                    second = spaces(' ', second)
                     write('@node %s\n' % second)
                 self.output_text('%s %s' % (directive, third), write)
-                for sub in structure[1:]:
-                    self.process_structure(sub, write, level+1)
-                return
+                stack.append((level+1, False, None))
+                return False
             if first in ('@display', '@example', '@format', '@lisp', '@menu',
                          '@quotation', '@smalldisplay', '@smallexample',
                          '@smallformat', '@smalllisp'):
                 assert not rest, rest
                 write('%s\n' % first)
-                for sub in structure[1:]:
-                    self.process_structure(sub, write, level)
-                write('@end %s\n' % first[1:])
-                return
+                stack.append((level, False, '@end %s\n' % first[1:]))
+                return False
             if first in ('@enumerate', '@itemize', '@table'):
                 if rest:
                     write('%s %s\n' % (first, rest))
                 else:
                     write('%s\n' % first)
-                for sub in structure[1:]:
-                    self.process_structure_item(sub, write, level)
-                write('@end %s\n' % first[1:])
-                return
-        if structure[0]:
-            self.output_text(structure[0], write)
-        for sub in structure[1:]:
-            self.process_structure(sub, write, level)
-
-    def process_structure_item(self, structure, write, level):
-        # Transform an allout structure while introducing an @item.
-        if structure[0]:
-            self.output_text('@item %s' % structure[0], write)
-        else:
-            write('@item\n')
-        for sub in structure[1:]:
-            self.process_structure(sub, write, level)
+                stack.append((level, True, '@end %s\n' % first[1:]))
+                return False
+        if label:
+            self.output_text(label, write)
+        stack.append((level, False, None))
+        return False
 
-    def include(self, name, write):
+    def find_include(self, name):
+        # Return the file NAME as found along the include path.
         for directory in self.includes:
             if os.path.exists('%s/%s' % (directory, name)):
-                name = '%s/%s' % (directory, name)
-                break
+                return '%s/%s' % (directory, name)
+        return name
+
+    def include(self, name, write):
+        name = self.find_include(name)
         sys.stderr.write("Including %s..." % name)
         inside = False
-        for line in file(name):
+        for line in open(name):
             if inside:
                 if line in ('@contents\n', '@bye\n'):
                     break
@@ -402,12 +528,13 @@ class Main:
         sys.stderr.write(" done\n")
 
     def output_text(self, text, write,
-                    searcher = re.compile('@<([^>]*)>([^ ]*)').search):
+                    searcher = re.compile('@<([^>]*)>([^ ]*)').search,
+                    colons = re.compile(r'([^ ]):( |$)').sub):
 
         def output_protecting_colons(text):
             # Force a space before textual colons.
-            text = re.sub(r'([^ ]):$', r'\1@w{ :}', text)
-            text = re.sub(r'([^ ]): ', r'\1@w{ :} ', text)
+            if ':' in text:
+                text = colons(r'\1@w{ :}\2', text)
             write('%s\n' % text)
 
         # Merge text after anything delayed.
@@ -457,11 +584,11 @@ class Main:
             text = text[match.end():].lstrip()
             match = searcher(text)
         if text:
-            match = re.search('@<', text)
-            if match:
+            start = text.find('@<')
+            if start >= 0:
                 # Incomplete index entry, delay it until next line.
-                self.delayed_text = text[match.start():]
-                text = text[:match.start()]
+                self.delayed_text = text[start:]
+                text = text[:start]
             output_protecting_colons(text)
 
 main = Main().main
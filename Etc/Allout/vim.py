@@ -8,6 +8,7 @@ Allout support for Vim.
 """
 
 __metaclass__ = type
+import bisect
 from Etc.UniVim import vim
 
 def install_with_vim():
@@ -75,98 +76,120 @@ def register_local_keys(plugin, triplets):
 # Navigation.
 
 def next_visible_topic(mode):
-    for row, level in all_following_lines(mode + 's'):
-        if level is not None:
-            move_cursor(row, level)
+    index = outline_index()
+    visible = visibility(mode + 's')
+    row, col = vim.current.window.cursor
+    for position in index.after(index.topic(row)):
+        if visible(index.rows[position]):
+            move_cursor(index.rows[position], index.depths[position])
             return
     no_such_line()
 
 def last_visible_topic(mode):
-    last_row = None
-    for row, level in all_following_lines(mode + 's'):
-        if level is not None:
-            last_row = row
-            last_level = level
-    if last_row is None:
-        no_such_line()
-    else:
-        move_cursor(last_row, last_level)
+    index = outline_index()
+    visible = visibility(mode + 's')
+    row, col = vim.current.window.cursor
+    for position in range(len(index.rows) - 1, index.topic(row), -1):
+        if visible(index.rows[position]):
+            move_cursor(index.rows[position], index.depths[position])
+            return
+    no_such_line()
 
 def previous_visible_topic(mode):
-    for row, level in all_preceding_lines(mode + 's'):
-        if level is not None:
-            move_cursor(row, level)
+    index = outline_index()
+    visible = visibility(mode + 's')
+    row, col = vim.current.window.cursor
+    for position in range(index.preceding(row), -1, -1):
+        if visible(index.rows[position]):
+            move_cursor(index.rows[position], index.depths[position])
             return
     no_such_line()
 
 def first_visible_topic(mode):
-    first_row = None
-    for row, level in all_preceding_lines(mode + 's'):
-        if level is not None:
-            first_row = row
-            first_level = level
-    if first_row is None:
-        no_such_line()
-    else:
-        move_cursor(first_row, first_level)
+    index = outline_index()
+    visible = visibility(mode + 's')
+    row, col = vim.current.window.cursor
+    for position in range(index.preceding(row) + 1):
+        if visible(index.rows[position]):
+            move_cursor(index.rows[position], index.depths[position])
+            return
+    no_such_line()
 
 def next_sibling(mode):
-    topic_row, topic_level = topic_line()
-    for row, level in all_following_lines(mode + 's'):
-        if level is not None:
+    index = outline_index()
+    visible = visibility(mode + 's')
+    row, col = vim.current.window.cursor
+    position = index.topic(row)
+    topic_level = index.depths[position]
+    for position in index.after(position, topic_level):
+        row = index.rows[position]
+        if visible(row):
+            level = index.depths[position]
             if level == topic_level:
                 move_cursor(row, level)
                 return
-            if level < topic_level:
-                break
+            break
     no_such_line()
 
 def last_sibling(mode):
-    topic_row, topic_level = topic_line()
+    index = outline_index()
+    visible = visibility(mode + 's')
+    row, col = vim.current.window.cursor
+    position = index.topic(row)
+    topic_level = index.depths[position]
     last_row = None
-    for row, level in all_following_lines(mode + 's'):
-        if level is not None:
-            if level == topic_level:
-                last_row = row
-                last_level = level
-            elif level < topic_level:
+    for position in index.after(position, topic_level):
+        row = index.rows[position]
+        if visible(row):
+            if index.depths[position] < topic_level:
                 break
+            last_row = row
     if last_row is None:
         no_such_line()
     else:
-        move_cursor(last_row, last_level)
+        move_cursor(last_row, topic_level)
 
 def previous_sibling(mode):
-    topic_row, topic_level = topic_line()
-    for row, level in all_preceding_lines(mode + 's', topic_row):
-        if level is not None:
+    index = outline_index()
+    visible = visibility(mode + 's')
+    row, col = vim.current.window.cursor
+    position = index.topic(row)
+    topic_level = index.depths[position]
+    for position in index.before(position, topic_level):
+        row = index.rows[position]
+        if visible(row):
+            level = index.depths[position]
             if level == topic_level:
                 move_cursor(row, level)
                 return
-            if level < topic_level:
-                break
+            break
     no_such_line()
 
 def first_sibling(mode):
-    topic_row, topic_level = topic_line()
-    for row, level in all_preceding_lines(mode + 's', topic_row):
-        if level is not None:
-            if level == topic_level:
-                first_row = row
-                first_level = level
-            elif level < topic_level:
+    index = outline_index()
+    visible = visibility(mode + 's')
+    row, col = vim.current.window.cursor
+    position = index.topic(row)
+    topic_level = index.depths[position]
+    first_row = None
+    for position in index.before(position, topic_level):
+        row = index.rows[position]
+        if visible(row):
+            if index.depths[position] < topic_level:
                 break
+            first_row = row
     if first_row is None:
         no_such_line()
     else:
-        move_cursor(first_row, first_level)
+        move_cursor(first_row, topic_level)
 
 def up_level(mode):
-    topic_row, topic_level = topic_line()
-    for row, level in all_preceding_lines(mode, topic_row):
-        if level is not None and level < topic_level:
-            move_cursor(row, level)
-            return
+    index = outline_index()
+    row, col = vim.current.window.cursor
+    position = index.topic(row)
+    for position in index.before(position, index.depths[position] - 1):
+        move_cursor(index.rows[position], index.depths[position])
+        return
     no_such_line()
 
 def down_to_1st_child(mode): down_to_nth_child(mode, 1)
@@ -181,12 +204,15 @@ def down_to_9th_child(mode): down_to_nth_child(mode, 9)
 
 def down_to_nth_child(mode, which):
     # Service for the nine above functions only.
-    topic_row, topic_level = topic_line()
-    for row, level in all_level_lines(mode):
-        if level is not None and level == topic_level + 1:
+    index = outline_index()
+    row, col = vim.current.window.cursor
+    position = index.topic(row)
+    level = index.depths[position] + 1
+    for position in index.inside(position):
+        if index.depths[position] == level:
             which -= 1
             if which == 0:
-                move_cursor(row, level)
+                move_cursor(index.rows[position], level)
                 return
     no_such_line()
 
@@ -275,11 +301,13 @@ def create_subtopic(mode):
     vim.command('startinsert')
 
 def create_supertopic(mode):
-    topic_row, topic_level = topic_line()
-    for row, level in all_preceding_lines(mode, topic_row):
-        if level is not None and level < topic_level:
-            level, bullet, number, line = split_line(row)
-            break
+    index = outline_index()
+    row, col = vim.current.window.cursor
+    position = index.topic(row)
+    for position in index.before(position, index.depths[position] - 1):
+        row = index.rows[position]
+        level, bullet, number, line = split_line(row)
+        break
     else:
         no_such_line()
         return
@@ -300,6 +328,7 @@ def row_of_created_empty(mode, row):
     else:
         row = last
     vim.current.buffer[row:row] = ['']
+    touched(row + 1, row, 1)
     return row + 1
 
 def delete_text(mode):
@@ -395,6 +424,172 @@ def space_topic(mode):
         no_such_line()
     else:
         vim.current.buffer[row-1:row-1] = ['']
+        touched(row, row - 1, 1)
+ 
+## Outline index.
+
+# Each buffer gets an `Index' classifying all its lines, built from a single
+# bulk read of the buffer, so navigation needs no Vim round trip per line.
+# The index is rebuilt whenever `b:changedtick' shows that the buffer was
+# changed by other means; edits made here update it over the changed rows.
+
+# Level of a blank line, in `Index.levels'.
+BLANK = -1
+
+# Indexes, keyed by buffer number.
+indexes = {}
+
+class Index:
+    # LEVELS[ROW-1] is None for a text line at ROW, BLANK for a blank line,
+    # or the topic level.  A non-blank first line always is a topic, of
+    # level 0 if it is not otherwise a topic; a blank one is a root topic
+    # only when looking backwards.  ROWS lists topic rows in
+    # order, with row 1 always first, and DEPTHS gives their levels.  Both
+    # are indexed by topic positions.  PARENTS and SKIPS are computed when
+    # first needed: the position of the closest enclosing topic, or -1, and
+    # the position of the first topic after the sub-topics, or len(ROWS).
+
+    def __init__(self, lines):
+        self.tick = None
+        self.levels = list(map(line_level, lines))
+        self.empty_first = not lines or not lines[0].strip()
+        if lines and self.levels[0] is None:
+            self.levels[0] = 0
+        self.rows = [1]
+        self.depths = [0]
+        for row, level in enumerate(self.levels, 1):
+            if level is not None and level != BLANK:
+                if row == 1:
+                    self.depths[0] = level
+                else:
+                    self.rows.append(row)
+                    self.depths.append(level)
+        self.parents = self.skips = None
+
+    def update(self, first, last, lines):
+        # Replace rows FIRST to LAST by LINES, LAST being FIRST - 1 when
+        # LINES are only inserted.  Topics after them get shifted.
+        if first == 1:
+            self.__init__(vim.current.buffer[:])
+            return
+        levels = list(map(line_level, lines))
+        self.levels[first-1:last] = levels
+        low = bisect.bisect_left(self.rows, first)
+        high = bisect.bisect_right(self.rows, last)
+        rows = []
+        depths = []
+        for row, level in enumerate(levels, first):
+            if level is not None and level != BLANK:
+                rows.append(row)
+                depths.append(level)
+        self.rows[low:high] = rows
+        self.depths[low:high] = depths
+        delta = len(lines) - (last - first + 1)
+        if delta:
+            shifted = self.rows
+            for position in range(low + len(rows), len(shifted)):
+                shifted[position] += delta
+        self.parents = self.skips = None
+
+    def topic(self, row):
+        # Returns the position of the closest topic at or before ROW.
+        return bisect.bisect_right(self.rows, row) - 1
+
+    def preceding(self, row):
+        # Returns the position of the closest topic before ROW, or -1.  An
+        # empty first line always precedes, even itself.
+        position = bisect.bisect_left(self.rows, row) - 1
+        if position < 0 and self.empty_first:
+            return 0
+        return position
+
+    def links(self):
+        # Computes PARENTS and SKIPS, in a single pass over topics.
+        if self.parents is None:
+            depths = self.depths
+            parents = []
+            skips = [len(depths)] * len(depths)
+            stack = []
+            for position, level in enumerate(depths):
+                while stack and depths[stack[-1]] >= level:
+                    skips[stack.pop()] = position
+                if stack:
+                    parents.append(stack[-1])
+                else:
+                    parents.append(-1)
+                stack.append(position)
+            self.parents = parents
+            self.skips = skips
+        return self.parents, self.skips
+
+    def after(self, position, limit=None):
+        # Generates positions of topics after POSITION, in order, whose
+        # level is not above LIMIT; sub-topics too deep are jumped over.
+        parents, skips = self.links()
+        depths = self.depths
+        position += 1
+        while position < len(depths):
+            if limit is not None and depths[position] > limit:
+                position = skips[position]
+            else:
+                yield position
+                position += 1
+
+    def before(self, position, limit):
+        # Generates positions of topics before POSITION, backwards, whose
+        # level is not above LIMIT; too deep topics are climbed out of.
+        parents, skips = self.links()
+        depths = self.depths
+        position -= 1
+        while position >= 0:
+            while position >= 0 and depths[position] > limit:
+                position = parents[position]
+            if position < 0:
+                break
+            yield position
+            position -= 1
+
+    def inside(self, position):
+        # Generates positions of topics within the topic at POSITION which
+        # are not themselves within another of them.
+        parents, skips = self.links()
+        end = skips[position]
+        position += 1
+        while position < end:
+            yield position
+            position = skips[position]
+
+def line_level(line):
+    # Returns the level of a topic LINE, None for text, BLANK if blank.
+    if line:
+        if line[0] == '*':
+            return 1
+        if line[0] == '.':
+            text = line[1:].lstrip()
+            if text and text[0] in '-*+@#.:,;':
+                return len(line) - len(text) + 1
+        if not line.isspace():
+            return None
+    return BLANK
+
+def outline_index():
+    # Returns the index for the current buffer, rebuilt if stale.
+    buffer = vim.current.buffer
+    tick = int(vim.eval('b:changedtick'))
+    index = indexes.get(buffer.number)
+    if index is None or index.tick != tick:
+        index = indexes[buffer.number] = Index(buffer[:])
+        index.tick = tick
+    return index
+
+def touched(first, last, count):
+    # Tells the index that rows FIRST to LAST were just replaced by COUNT
+    # rows, LAST being FIRST - 1 for a mere insertion.
+    buffer = vim.current.buffer
+    index = indexes.get(buffer.number)
+    if index is not None:
+        index.update(first, last, buffer[first-1:first-1+count])
+        index.tick = int(vim.eval('b:changedtick'))
  
 ## Service functions.
 
@@ -460,92 +655,88 @@ def all_text_lines(mode, row=None):
 
 def topic_line(row=None):
     # Returns (ROW, LEVEL) for the closest topic line at or before ROW.
-    row, level = row_and_level(row)
-    if level is None:
-        for row, level in all_preceding_lines('n', row):
-            if level is not None:
-                break
-        else:
-            assert False
-    return row, level
+    if row is None:
+        row, col = vim.current.window.cursor
+    index = outline_index()
+    position = index.topic(row)
+    return index.rows[position], index.depths[position]
 
 def all_following_lines(mode, row=None):
     # In normal mode, generates (ROW, LEVEL) forward for all non-empty lines
     # after ROW.  In visual mode, generates (ROW, LEVEL) for all non-empty
     # selected lines from first to last.
-    buffer = vim.current.buffer
+    index = outline_index()
     if 'n' in mode:
         if row is None:
             row, col = vim.current.window.cursor
-        row = int(vim.eval('nextnonblank(%d)' % (row + 1)))
-        last = len(buffer)
+        row += 1
+        last = len(index.levels)
     elif 'v' in mode:
         assert row is None, row
+        buffer = vim.current.buffer
         row, col = buffer.mark('<')
-        if not buffer[row-1]:
-            row = int(vim.eval('nextnonblank(%d)' % (row + 1)))
         last, col = buffer.mark('>')
-    if 's' in mode:
-        while 0 < row <= last:
-            skip = int(vim.eval('foldclosedend(%d)' % row))
-            if skip < 0:
-                yield row_and_level(row)
-            else:
-                row = skip
-            row = int(vim.eval('nextnonblank(%d)' % (row + 1)))
-    else:
-        while 0 < row <= last:
-            yield row_and_level(row)
-            row = int(vim.eval('nextnonblank(%d)' % (row + 1)))
+    levels = index.levels
+    skipping = 's' in mode
+    while row <= last:
+        level = levels[row-1]
+        if level != BLANK:
+            if skipping:
+                skip = int(vim.eval('foldclosedend(%d)' % row))
+                if skip >= 0:
+                    row = skip + 1
+                    continue
+            yield row, level
+        row += 1
 
 def all_preceding_lines(mode, row=None):
     # In normal mode, generates (ROW, LEVEL) backwards for all non-empty lines
     # before ROW; a first line of the file is never considered empty for this
     # purpose, as it is then the root topic.  In visual mode, generates (ROW,
     # LEVEL) for all non-empty selected lines from last to first.
-    buffer = vim.current.buffer
+    index = outline_index()
     if 'n' in mode:
         if row is None:
             row, col = vim.current.window.cursor
-        row = int(vim.eval('prevnonblank(%d)' % (row - 1)))
+        row -= 1
         first = 1
     elif 'v' in mode:
         assert row is None, row
+        buffer = vim.current.buffer
         row, col = buffer.mark('>')
-        if not buffer[row-1]:
-            row = int(vim.eval('prevnonblank(%d)' % (row - 1)))
         first, col = buffer.mark('<')
-    if 's' in mode:
-        while first <= row:
-            skip = int(vim.eval('foldclosed(%d)' % row))
-            if skip < 0:
-                yield row_and_level(row)
-            else:
-                row = skip
-            row = int(vim.eval('prevnonblank(%d)' % (row - 1)))
-    else:
-        while first <= row:
-            yield row_and_level(row)
-            row = int(vim.eval('prevnonblank(%d)' % (row - 1)))
-    if 'n' in mode and len(buffer) > 0 and not buffer[0]:
-        if not ('s' in mode and is_invisible(1)):
+    levels = index.levels
+    skipping = 's' in mode
+    while first <= row:
+        level = levels[row-1]
+        if level != BLANK:
+            if skipping:
+                skip = int(vim.eval('foldclosed(%d)' % row))
+                if skip >= 0:
+                    row = skip - 1
+                    continue
+            yield row, level
+        row -= 1
+    if 'n' in mode and index.empty_first:
+        if not (skipping and is_invisible(1)):
             yield 1, 0
 
 def row_and_level(row=None):
     # Returns (ROW, LEVEL) for line at ROW.
     if row is None:
         row, col = vim.current.window.cursor
-    line = vim.current.buffer[row-1]
-    if line:
-        if line[0] == '*':
-            return row, 1
-        if line[0] == '.':
-            text = line[1:].lstrip()
-            if text and text[0] in '-*+@#.:,;':
-                return row, len(line) - len(text) + 1
-    if row == 1:
-        return 1, 0
-    return row, None
+    level = outline_index().levels[row-1]
+    if level == BLANK:
+        if row == 1:
+            return 1, 0
+        return row, None
+    return row, level
+
+def visibility(mode):
+    # Returns a function telling if a row should be considered, given MODE.
+    if 's' in mode:
+        return lambda row: not is_invisible(row)
+    return lambda row: True
 
 def command_at(row, command):
     # Temporarily move cursor on ROW and execute Vim COMMAND there.
@@ -643,6 +834,7 @@ def build_line(row=None, level=None, bullet='.', number=None, line=None,
             buffer[row-1] = prefix
         else:
             buffer[row-1] = prefix + ' ' + line
+    touched(row, row, 1)
 
 def is_invisible(row=None):
     # Tells if the line at ROW is within a currently closed fold.
@@ -197,7 +197,7 @@ class Graphique:
             #        return
             #    self.compteur = 0
             compteur = 0
-            for champ in file('/proc/self/statm').read().split():
+            for champ in open('/proc/self/statm').read().split():
                 self.statm[compteur].append(int(champ))
                 compteur += 1
             self.references.append(compteur_references)
@@ -258,12 +258,142 @@ class Graphique:
             write('e\n')
 
 
+class Chronologie:
+
+    # Un fil d'exécution de fond échantillonne périodiquement la mémoire
+    # du processus, sans X ni Gnuplot, et garde les CAPACITE plus récents
+    # échantillons dans un tampon circulaire.  La chronologie peut être
+    # exportée en CSV ou JSON, ou encore servie en HTTP local, pour examiner
+    # après coup un processus de longue durée sur un serveur sans écran.
+
+    # Chaque échantillon contient, dans l'ordre des CHAMPS: le moment en
+    # secondes depuis l'époque, les sept champs de /proc/self/statm
+    # convertis en kilo-octets, les compteurs des trois générations du
+    # ramasse-miettes et, si OBJETS est vrai, le nombre d'objets suivis
+    # par le ramasse-miettes (sinon -1).
+
+    champs = ('moment', 'totale', 'residente', 'partagee', 'pure',
+              'impure', 'bibliotheque', 'modifiee',
+              'generation0', 'generation1', 'generation2', 'objets')
+
+    def __init__(self, capacite=3600, intervalle=1., objets=True):
+        import collections
+        import threading
+        self.echantillons = collections.deque(maxlen=capacite)
+        self.intervalle = intervalle
+        self.objets = objets
+        self.fin = threading.Event()
+        self.fil = None
+        self.serveur = None
+        try:
+            self.kilos_par_page = os.sysconf('SC_PAGE_SIZE') // 1024
+        except (AttributeError, ValueError, OSError):
+            self.kilos_par_page = 4
+
+    def echantillonner(self):
+        import gc
+        import time
+        moment = time.time()
+        try:
+            with open('/proc/self/statm') as fichier:
+                statm = [int(champ) * self.kilos_par_page
+                         for champ in fichier.read().split()]
+        except OSError:
+            statm = [-1] * 7
+        if self.objets:
+            objets = len(gc.get_objects())
+        else:
+            objets = -1
+        self.echantillons.append(
+            (moment,) + tuple(statm[:7]) + tuple(gc.get_count()) + (objets,))
+
+    def demarrer(self):
+        import threading
+        if self.fil is None:
+            self.fin.clear()
+            self.fil = threading.Thread(target=self.boucler,
+                                        name='Chronologie', daemon=True)
+            self.fil.start()
+
+    def arreter(self):
+        if self.fil is not None:
+            self.fin.set()
+            self.fil.join()
+            self.fil = None
+        if self.serveur is not None:
+            self.serveur.shutdown()
+            self.serveur.server_close()
+            self.serveur = None
+
+    def boucler(self):
+        while not self.fin.is_set():
+            self.echantillonner()
+            self.fin.wait(self.intervalle)
+
+    def texte_csv(self):
+        import csv
+        import io
+        tampon = io.StringIO()
+        ecrivain = csv.writer(tampon, lineterminator='\n')
+        ecrivain.writerow(self.champs)
+        ecrivain.writerows(list(self.echantillons))
+        return tampon.getvalue()
+
+    def texte_json(self):
+        import json
+        return json.dumps({'champs': self.champs,
+                           'echantillons': list(self.echantillons)})
+
+    def exporter(self, nom):
+        # Le format est choisi selon l'extension de NOM, `.json' ou non.
+        if nom.endswith('.json'):
+            texte = self.texte_json()
+        else:
+            texte = self.texte_csv()
+        with open(nom, 'w') as fichier:
+            fichier.write(texte)
+
+    def servir(self, port=0, hote='127.0.0.1'):
+        # Servir /csv et /json sur HOTE et PORT, dans un fil de fond.
+        # Retourne l'adresse effective, utile lorsque PORT vaut zéro.
+        import http.server
+        import threading
+        chronologie = self
+
+        class Requete(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.startswith('/csv'):
+                    texte, genre = chronologie.texte_csv(), 'text/csv'
+                elif self.path in ('/', '/json'):
+                    texte, genre = (chronologie.texte_json(),
+                                    'application/json')
+                else:
+                    self.send_error(404)
+                    return
+                contenu = texte.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', genre + '; charset=utf-8')
+                self.send_header('Content-Length', str(len(contenu)))
+                self.end_headers()
+                self.wfile.write(contenu)
+
+            def log_message(self, format, *arguments):
+                pass
+
+        self.serveur = http.server.ThreadingHTTPServer((hote, port), Requete)
+        threading.Thread(target=self.serveur.serve_forever,
+                         name='Chronologie HTTP', daemon=True).start()
+        return self.serveur.server_address
+
+
 class Collection:
 
-    def __init__(self, titre=None, typecode='I'):
+    def __init__(self, titre=None):
         self.titre = titre
-        import array
-        self.array = array.array(str(typecode))
+        import collections
+        # Le tampon circulaire élimine lui-même les plus vieux points.
+        self.array = collections.deque(maxlen=Graphique.affichage_maximum)
         self.points_elimines = 0
 
     def append(self, valeur):
@@ -272,12 +402,153 @@ class Collection:
         else:
             self.minimum = min(self.minimum, valeur)
             self.maximum = max(self.maximum, valeur)
-            if len(self.array) == Graphique.affichage_maximum:
-                self.array.pop(0)
+            if len(self.array) == self.array.maxlen:
                 self.points_elimines += 1
         self.array.append(valeur)
 
 
+class Inventaire_Echantillon:
+
+    # Inventaire peu coûteux, conçu pour rester actif en production.  Au
+    # lieu de tout examiner à chaque appel, on échantillonne de deux façons.
+
+    # D'une part, le module `tracemalloc' n'est activé que durant une
+    # fraction TAUX des intervalles entre deux appels à SURVEILLER.  À la
+    # fin d'un intervalle échantillonné, les blocs alloués durant cet
+    # intervalle et toujours vivants sont regroupés par lieu d'appel: ce
+    # sont les candidats aux déperditions de mémoire.  Hors de ces
+    # intervalles, `tracemalloc' ne coûte rien.  Si `tracemalloc' était déjà
+    # actif par ailleurs, on compare plutôt deux instantanés successifs.
+
+    # D'autre part, les objets suivis par le ramasse-miettes ne sont
+    # comptés, par type, qu'aux appels qui débutent un intervalle
+    # échantillonné, soit une fois sur 1/TAUX.  Le compte est alors exact,
+    # et les différences rapportées couvrent les 1/TAUX intervalles écoulés
+    # depuis le compte précédent.  Un échantillon d'objets pris au fil du
+    # tas changerait d'un appel à l'autre, et ses différences ne seraient
+    # que du bruit.  Les classes imbriquées ne sont pas ignorées,
+    # contrairement à ce que fait Inventaire.
+
+    # Le coût se mesure par `python3 -m benchmarks -k memoire'.  Sur une
+    # boucle qui ne fait qu'allouer, `tracemalloc' ralentit chaque
+    # allocation d'environ quatre fois, et le compte des objets prend
+    # environ 65 ns par objet.  Avec le TAUX de 0.01 par défaut et un appel
+    # par seconde, le surcoût reste donc d'environ 3 %, et bien moindre
+    # pour un programme qui fait autre chose qu'allouer.
+
+    # Ordinal du dernier appel traité.
+    ordinal = 0
+    # Moment, en secondes flottantes, du dernier appel traité.
+    moment = None
+    # Vrai si `tracemalloc' a été activé par cet inventaire.
+    actif = False
+    # Dernier instantané, lorsque `tracemalloc' est activé par ailleurs.
+    instantane = None
+
+    def __init__(self, taux=0.01, profondeur=1, limite=15, delai=1.):
+        self.periode = max(1, int(round(1 / taux)))
+        self.profondeur = profondeur
+        self.limite = limite
+        self.delai = delai
+        self.objets_par_type = {}
+
+    def surveiller(self, titre=None, write=None, force=False):
+        import time
+        moment = time.time()
+        if force or self.moment is None or moment - self.moment > self.delai:
+            self.moment = moment
+            self.ordinal += 1
+            self.rapporter(titre, write)
+
+    def rapporter(self, titre=None, write=None):
+        import tracemalloc
+        if titre is None:
+            titre = '-' * 79
+        if write is None:
+            write = sys.stderr.write
+        write(titre + '\n')
+        echantillonner = self.ordinal % self.periode == 0
+        # Types, comptés avant d'activer `tracemalloc'.
+        if echantillonner:
+            avant = self.objets_par_type
+            apres = self.objets_par_type = self.compter_objets()
+            if avant:
+                self.rapporter_types(write, avant, apres)
+        # Lieux d'appel, pour l'intervalle qui se termine.
+        if self.actif:
+            instantane = self.prendre_instantane()
+            tracemalloc.stop()
+            self.actif = False
+            self.rapporter_lieux(
+                write, instantane.statistics('lineno'), "allocations")
+        elif tracemalloc.is_tracing():
+            instantane = self.prendre_instantane()
+            if self.instantane is not None:
+                self.rapporter_lieux(
+                    write, instantane.compare_to(self.instantane, 'lineno'),
+                    "différences")
+            self.instantane = instantane
+        elif echantillonner:
+            # Échantillonner le prochain intervalle.
+            tracemalloc.start(self.profondeur)
+            self.actif = True
+
+    def arreter(self):
+        import tracemalloc
+        if self.actif:
+            tracemalloc.stop()
+            self.actif = False
+
+    def prendre_instantane(self):
+        import tracemalloc
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<unknown>')))
+
+    def compter_objets(self):
+        # Le décompte par `collections.Counter' se fait en C, sans boucle
+        # Python sur chacun des objets.
+        import collections
+        import gc
+        compteurs = {}
+        for genre, compteur in collections.Counter(
+                map(type, gc.get_objects())).items():
+            nom = '%s.%s' % (genre.__module__, genre.__qualname__)
+            compteurs[nom] = compteurs.get(nom, 0) + compteur
+        return compteurs
+
+    def rapporter_lieux(self, write, statistiques, quoi):
+        statistiques = [statistique for statistique in statistiques
+                        if getattr(statistique, 'size_diff',
+                                   statistique.size)]
+        write("%d lieux d'appel, %s:\n" % (len(statistiques), quoi))
+        for statistique in statistiques[:self.limite]:
+            lieu = statistique.traceback[0]
+            if hasattr(statistique, 'size_diff'):
+                write("  %+10d octets %+8d blocs   %s:%d\n"
+                      % (statistique.size_diff, statistique.count_diff,
+                         lieu.filename, lieu.lineno))
+            else:
+                write("  %+10d octets %+8d blocs   %s:%d\n"
+                      % (statistique.size, statistique.count,
+                         lieu.filename, lieu.lineno))
+
+    def rapporter_types(self, write, avant, apres):
+        deltas = []
+        for nom, compteur in apres.items():
+            delta = compteur - avant.get(nom, 0)
+            if delta:
+                deltas.append((-abs(delta), nom, delta, compteur))
+        for nom, compteur in avant.items():
+            if nom not in apres:
+                deltas.append((-compteur, nom, -compteur, 0))
+        deltas.sort()
+        for ignore, nom, delta, compteur in deltas[:self.limite]:
+            write("  %+7d -> %-7d   %s\n" % (delta, compteur, nom))
+
+
 class Inventaire_Vieux:
     ordinal = 0
     compteurs = {}
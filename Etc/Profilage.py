@@ -6,6 +6,9 @@
 Ce module regroupe quelques déclarations utiles.
 """
 
+import os
+import sys
+
 
 def garantir_repertoire(nom):
     import os
@@ -18,6 +21,60 @@ def garantir_repertoire(nom):
 
 ## Profilage de l'exécution
 
+class Histogramme:
+    # Durées cumulées sous un même nom.  Chaque durée est aussi comptée dans
+    # une case, la case K regroupant les durées d'au moins 2**K microsecondes
+    # et de moins de 2**(K+1), la case 0 recevant aussi les plus courtes.
+
+    def __init__(self, nom):
+        import threading
+        self.nom = nom
+        self.verrou = threading.Lock()
+        self.compte = 0
+        self.total = 0.
+        self.minimum = None
+        self.maximum = 0.
+        self.cases = {}
+
+    def ajouter(self, duree):
+        case = max(0, int(duree * 1e6)).bit_length() - 1
+        with self.verrou:
+            self.compte += 1
+            self.total += duree
+            if self.minimum is None or duree < self.minimum:
+                self.minimum = duree
+            if duree > self.maximum:
+                self.maximum = duree
+            self.cases[max(0, case)] = self.cases.get(max(0, case), 0) + 1
+
+    def rapport(self):
+        if not self.compte:
+            return "%s : aucune mesure.\n" % self.nom
+        lignes = ["%s : %d mesures, total %.6f s, moyenne %.6f s,"
+                  " minimum %.6f s, maximum %.6f s.\n"
+                  % (self.nom, self.compte, self.total,
+                     self.total / self.compte, self.minimum, self.maximum)]
+        for case, compte in sorted(self.cases.items()):
+            lignes.append("  < %10d us  %8d\n" % (1 << (case + 1), compte))
+        return ''.join(lignes)
+
+
+# Registre des histogrammes, selon leur nom.
+histogrammes = {}
+
+
+def histogramme(nom):
+    resultat = histogrammes.get(nom)
+    if resultat is None:
+        resultat = histogrammes.setdefault(nom, Histogramme(nom))
+    return resultat
+
+
+def rapport_chronometres():
+    return ''.join(histogrammes[nom].rapport()
+                   for nom in sorted(histogrammes, key=str))
+
+
 class Chronometre:
     # Chaque instance de chronomètre imprime la durée de son existence.
     # Par exemple, "chronometre = Chronometre()" mesure l'intervalle
@@ -25,53 +82,238 @@ class Chronometre:
     # ou encore, le moment où la variable "chronometre" est affectée de
     # nouveau (généralement par une nouvelle instance de Chronometre.
 
+    # Comme ce mécanisme, fondé sur __del__, n'est pas fiable sous PyPy ni
+    # à la sortie de l'interpréteur, mieux vaut utiliser un chronomètre
+    # comme gestionnaire de contexte, "with Chronometre('titre'): ...",
+    # ou comme décorateur, "@Chronometre('titre')", le titre étant alors
+    # facultatif.  Les durées s'accumulent alors dans l'histogramme nommé
+    # d'après le titre, plutôt que d'être imprimées.
+
     def __init__(self, titre=None):
         self.titre = titre
-        from time import time
-        self.depart = time()
+        from time import perf_counter
+        self.depart = perf_counter()
+        self.mesure = False
+
+    def __enter__(self):
+        from time import perf_counter
+        self.mesure = True
+        self.depart = perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        from time import perf_counter
+        histogramme(self.titre).ajouter(perf_counter() - self.depart)
+
+    def __call__(self, fonction):
+        import functools
+        from time import perf_counter
+        self.mesure = True
+        cible = histogramme(self.titre or fonction.__qualname__)
+
+        @functools.wraps(fonction)
+        def enveloppe(*arguments, **mots_cles):
+            depart = perf_counter()
+            try:
+                return fonction(*arguments, **mots_cles)
+            finally:
+                cible.ajouter(perf_counter() - depart)
+
+        return enveloppe
 
     def __del__(self):
-        from time import time
-        delta = time() - self.depart
+        if self.mesure:
+            return
+        from time import perf_counter
+        delta = perf_counter() - self.depart
+        # L'interpréteur qui se termine a parfois déjà fermé sys.stderr.
+        sortie = sys.stderr
+        if sortie is None:
+            return
         if self.titre:
-            info.chrono("%s : %.1f secondes." % (self.titre, delta))
+            sortie.write("%s : %.1f secondes.\n" % (self.titre, delta))
         else:
-            info.chrono("%.1f secondes." % delta)
+            sortie.write("%.1f secondes.\n" % delta)
 
 
 class Profilage:
-    deja = False
-    profileur = None
-    Stats = None
+    # Profilage déterministe par `cProfile'.  Chaque fil d'exécution a son
+    # propre profileur: celui qui appelle ACTIVER, et ceux qui démarrent
+    # ensuite, tant que le profilage reste actif.  Le rapport fusionne les
+    # statistiques de tous les fils.
+
+    # Depuis Python 3.12, `cProfile' repose sur `sys.monitoring': un seul
+    # profileur peut être actif à la fois, et il voit alors tous les fils.
+    # Un profileur unique remplace donc ceux de chaque fil.  Auparavant, un
+    # fil ne peut retirer que son propre crochet de profilage: DESACTIVER
+    # fige plutôt les statistiques des autres fils, qui restent profilés
+    # jusqu'à leur fin, mais sans que cela paraisse dans le rapport.
+
+    unique = sys.version_info >= (3, 12)
+
+    def __init__(self):
+        import threading
+        self.verrou = threading.Lock()
+        self.profileurs = {}
+        self.figes = {}
+        self.actif = False
 
     def activer(self, effacer=False):
-        if not self.deja:
-            try:
-                import lsprof
-            except ImportError:
-                pass
-            else:
-                self.profileur = lsprof.Profiler()
-                self.Stats = lsprof.Stats
-            self.deja = True
-        if self.profileur is not None:
+        import threading
+        with self.verrou:
             if effacer:
-                self.profileur.clear()
-            self.profileur.enable(subcalls=False, builtins=True)
+                self.profileurs = {}
+            self.figes = {}
+        self.profiler_fil()
+        self.actif = True
+        if not self.unique:
+            threading.setprofile(self.demarrer_fil)
 
     def desactiver(self):
-        if self.profileur is not None:
-            self.profileur.disable()
+        import threading
+        self.actif = False
+        if not self.unique:
+            threading.setprofile(None)
+        moi = threading.get_ident()
+        with self.verrou:
+            for identite, profileur in self.profileurs.items():
+                if self.unique or identite == moi:
+                    profileur.disable()
+                else:
+                    self.figes[identite] = Instantane(profileur)
 
-    def rapport(self):
-        if self.profileur is None:
+    def demarrer_fil(self, *arguments):
+        # Appelé une seule fois au démarrage de chaque nouveau fil.
+        sys.setprofile(None)
+        if self.actif:
+            self.profiler_fil()
+
+    def profiler_fil(self):
+        # Une ValueError signale qu'un autre outil de profilage occupe déjà
+        # ce fil, ou l'interpréteur depuis Python 3.12.  Elle est propagée,
+        # plutôt que de laisser croire que le profilage a lieu.
+        import cProfile
+        import threading
+        identite = None if self.unique else threading.get_ident()
+        with self.verrou:
+            profileur = self.profileurs.get(identite)
+            if profileur is None:
+                profileur = self.profileurs[identite] = cProfile.Profile()
+        profileur.enable(subcalls=False, builtins=True)
+
+    def statistiques(self):
+        # Retourne un `pstats.Stats' fusionnant tous les fils, ou None.
+        import pstats
+        with self.verrou:
+            instantanes = [self.figes.get(identite) or Instantane(profileur)
+                           for identite, profileur in self.profileurs.items()]
+        stats = None
+        for instantane in instantanes:
+            if not instantane.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(instantane)
+            else:
+                stats.add(pstats.Stats(instantane))
+        return stats
+
+    def rapport(self, limite=20):
+        stats = self.statistiques()
+        if stats is None:
             return "\n   Pas de rapport: le profilage n'a pas eu lieu.\n"
-        stats = self.Stats(self.profileur.getstats())
-        stats.sort('inlinetime')
         from io import StringIO
         tampon = StringIO()
         tampon.write('\n')
-        stats.pprint(20, tampon)
+        stats.stream = tampon
+        stats.sort_stats('tottime')
+        stats.print_stats(limite)
         return tampon.getvalue()
 
 profilage = Profilage()
+
+
+class Instantane:
+    # Relevé des statistiques d'un profileur `cProfile', sans l'arrêter,
+    # sous une forme acceptée par `pstats.Stats'.
+
+    def __init__(self, profileur):
+        profileur.snapshot_stats()
+        self.stats = profileur.stats
+
+    def create_stats(self):
+        pass
+
+
+## Profilage statistique.
+
+class Echantillonneur:
+    # Échantillonnage des piles d'appel, à faible coût.  Toutes les
+    # INTERVALLE secondes, un fil de fond relève la pile de chacun des
+    # autres fils.  Si SIGNAL est vrai, on utilise plutôt le signal SIGPROF,
+    # déclenché selon le temps de calcul consommé, mais seul le fil principal
+    # est alors échantillonné, et ACTIVER doit y être appelé.  Les piles
+    # sont rapportées au format replié des graphiques en flammes: une
+    # ligne par pile distincte, appels séparés par des points-virgules
+    # depuis la racine, suivie d'une espace et du nombre d'échantillons.
+
+    def __init__(self, intervalle=0.005, signal=False):
+        import threading
+        self.intervalle = intervalle
+        self.signal = signal
+        self.piles = {}
+        self.fin = threading.Event()
+        self.fil = None
+
+    def activer(self):
+        if self.signal:
+            import signal
+            signal.signal(signal.SIGPROF, self.recevoir_signal)
+            signal.setitimer(signal.ITIMER_PROF,
+                             self.intervalle, self.intervalle)
+        elif self.fil is None:
+            import threading
+            self.fin.clear()
+            self.fil = threading.Thread(target=self.boucler,
+                                        name='Echantillonneur', daemon=True)
+            self.fil.start()
+
+    def desactiver(self):
+        if self.signal:
+            import signal
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        elif self.fil is not None:
+            self.fin.set()
+            self.fil.join()
+            self.fil = None
+
+    def recevoir_signal(self, numero, cadre):
+        self.relever(cadre)
+
+    def boucler(self):
+        import threading
+        moi = threading.get_ident()
+        while not self.fin.wait(self.intervalle):
+            for identite, cadre in sys._current_frames().items():
+                if identite != moi:
+                    self.relever(cadre)
+
+    def relever(self, cadre):
+        pile = []
+        while cadre is not None:
+            code = cadre.f_code
+            pile.append('%s (%s:%d)' % (code.co_name,
+                                        os.path.basename(code.co_filename),
+                                        code.co_firstlineno))
+            cadre = cadre.f_back
+        pile.reverse()
+        cle = ';'.join(pile)
+        self.piles[cle] = self.piles.get(cle, 0) + 1
+
+    def rapport(self):
+        return ''.join('%s %d\n' % (cle, compte)
+                       for cle, compte in sorted(self.piles.items()))
+
+    def ecrire(self, nom):
+        with open(nom, 'w') as fichier:
+            fichier.write(self.rapport())
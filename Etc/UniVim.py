@@ -35,10 +35,15 @@ class Buffer(Wrapper):
         return len(self.object)
 
     def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.__getslice__(index.start, index.stop)
         return self.object[index].decode(charset)
 
     def __setitem__(self, index, value):
-        self.object[index] = value.encode(charset)
+        if isinstance(index, slice):
+            self.__setslice__(index.start, index.stop, value)
+        else:
+            self.object[index] = value.encode(charset)
 
     def __getslice__(self, low, high):
         return [value.decode(charset) for value in self.object[low:high]]
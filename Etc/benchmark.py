@@ -4,61 +4,338 @@
 
 """\
 Simple tool for benchmarking a function.
+
+`measure(TEST)' times the parameter-less function TEST and returns a Result.
+The number of loops per run is calibrated automatically, a few warmup runs
+are discarded, then several runs are timed, each with the overhead of an
+empty loop subtracted.  A Result reports the median, the interquartile
+range and the minimum time per call, and flags outlier runs.
+
+Results may be saved as a JSON baseline with `save', reloaded with `load',
+and compared with `compare', which tells for each test if the new timings
+are significantly slower or faster, using a Mann-Whitney U test.  The
+`main' function offers all this from the command line, and may be used
+to gate performance regressions.  When tests carry a `size' parameter,
+`report_scaling' also shows how timings grow with the input size.
+
+`benchmark(TEST)' is the older interface, which prints one line comparing
+timings with the garbage collector enabled and disabled.
+"""
+
+import gc
+import json
+import math
+import statistics
+import sys
+import time
+
+
+class Result:
+    """\
+Timings for one test.  TIMES holds, for each run, the wall time in seconds
+per call of the test, and CPU_TIMES the CPU time likewise.  LOOPS is the
+number of calls per run.
+"""
+
+    def __init__(self, name, loops, times, cpu_times, parameters=None):
+        self.name = name
+        self.loops = loops
+        self.times = times
+        self.cpu_times = cpu_times
+        self.parameters = parameters or {}
+
+    def __repr__(self):
+        return '<Result %s: median %s, iqr %s, %d runs of %d loops>' % (
+            self.name, format_time(self.median), format_time(self.iqr),
+            len(self.times), self.loops)
+
+    @property
+    def median(self):
+        return statistics.median(self.times)
+
+    @property
+    def cpu_median(self):
+        return statistics.median(self.cpu_times)
+
+    @property
+    def minimum(self):
+        return min(self.times)
+
+    def quartiles(self):
+        if len(self.times) < 2:
+            return self.times[0], self.times[0]
+        low, middle, high = statistics.quantiles(self.times, n=4)
+        return low, high
+
+    @property
+    def iqr(self):
+        low, high = self.quartiles()
+        return high - low
+
+    def outliers(self):
+        """\
+Return the list of run times outside Tukey's fences, that is, further
+than 1.5 interquartile range away from the quartiles.
+"""
+        low, high = self.quartiles()
+        margin = 1.5 * (high - low)
+        return [value for value in self.times
+                if value < low - margin or value > high + margin]
+
+    def as_dict(self):
+        return {'loops': self.loops, 'times': self.times,
+                'cpu_times': self.cpu_times, 'parameters': self.parameters}
+
+    @classmethod
+    def from_dict(cls, name, data):
+        return cls(name, data['loops'], data['times'], data['cpu_times'],
+                   data.get('parameters'))
+
+
+def measure(test, name=None, runs=7, warmups=1, min_time=0.05, loops=None,
+            parameters=None):
+    """\
+Time the parameter-less function TEST and return a Result named NAME,
+or after TEST when NAME is not given.  Each of the RUNS timed runs calls
+TEST LOOPS times, LOOPS being chosen so a run lasts at least MIN_TIME
+seconds when not given.  WARMUPS untimed runs come first.  PARAMETERS is
+an optional dictionary describing the input, saved along with timings.
+"""
+    if name is None:
+        name = test.__name__
+    if loops is None:
+        loops = calibrate(test, min_time)
+    for counter in range(warmups):
+        run(test, loops)
+    overhead_wall, overhead_cpu = run(empty, loops)
+    times = []
+    cpu_times = []
+    for counter in range(runs):
+        wall, cpu = run(test, loops)
+        times.append(max(0, wall - overhead_wall) / loops * 1e-9)
+        cpu_times.append(max(0, cpu - overhead_cpu) / loops * 1e-9)
+    return Result(name, loops, times, cpu_times, parameters)
+
+
+def calibrate(test, min_time):
+    # Return a number of loops so a run of TEST lasts at least MIN_TIME.
+    loops = 1
+    while True:
+        wall, cpu = run(test, loops)
+        if wall >= min_time * 1e9:
+            return loops
+        if wall <= 0:
+            loops *= 10
+        else:
+            # Aim a bit higher, to avoid ending just below the target.
+            loops = max(loops * 2,
+                        int(loops * min_time * 1.2e9 / wall) + 1)
+
+
+def run(test, loops):
+    # Return wall and CPU nanoseconds for calling TEST LOOPS times.
+    loop = range(loops)
+    wall_start = time.perf_counter_ns()
+    cpu_start = time.process_time_ns()
+    for counter in loop:
+        test()
+    cpu = time.process_time_ns() - cpu_start
+    return time.perf_counter_ns() - wall_start, cpu
+
+
+def empty():
+    pass
+
+
+## Reporting.
+
+def format_time(seconds):
+    for factor, unit in (1e0, 's'), (1e3, 'ms'), (1e6, 'us'):
+        if seconds * factor >= 1:
+            return '%.3g%s' % (seconds * factor, unit)
+    return '%.3gns' % (seconds * 1e9)
+
+
+def report(results, write=None):
+    """\
+Write one line per Result in RESULTS, through WRITE or on standard output.
+"""
+    if write is None:
+        write = sys.stdout.write
+    write('%10s %10s %10s %10s %4s  %s\n'
+          % ('median', 'iqr', 'min', 'cpu', 'out', 'name'))
+    for result in results:
+        write('%10s %10s %10s %10s %4d  %s\n'
+              % (format_time(result.median), format_time(result.iqr),
+                 format_time(result.minimum), format_time(result.cpu_median),
+                 len(result.outliers()), result.name))
+
+
+def report_scaling(results, write=None):
+    """\
+For results having a `size' parameter, write the median time per size
+unit, and the exponent K such that time grows like size**K between two
+successive sizes of a same family.  A family groups results whose names
+only differ after a `[' character.
+"""
+    if write is None:
+        write = sys.stdout.write
+    write('%10s %10s %6s  %s\n' % ('size', 'per unit', 'slope', 'name'))
+    previous = {}
+    for result in results:
+        size = result.parameters.get('size')
+        if not size:
+            continue
+        family = result.name.split('[')[0]
+        slope = ''
+        if family in previous:
+            last_size, last_median = previous[family]
+            if size != last_size and last_median > 0 and result.median > 0:
+                slope = '%.2f' % (math.log(result.median / last_median)
+                                  / math.log(size / last_size))
+        previous[family] = size, result.median
+        write('%10d %10s %6s  %s\n'
+              % (size, format_time(result.median / size), slope,
+                 result.name))
+
+
+## Baselines.
+
+def save(results, file_name):
+    """\
+Save RESULTS as a JSON baseline into FILE_NAME.
+"""
+    with open(file_name, 'w') as file:
+        json.dump(dict((result.name, result.as_dict())
+                       for result in results),
+                  file, indent=1, sort_keys=True)
+
+
+def load(file_name):
+    """\
+Return a dictionary of results, by name, from the JSON baseline FILE_NAME.
+"""
+    with open(file_name) as file:
+        data = json.load(file)
+    return dict((name, Result.from_dict(name, value))
+                for name, value in data.items())
+
+
+def compare(baseline, results, alpha=0.01, threshold=0.02):
+    """\
+Compare RESULTS with BASELINE, a dictionary of results by name.  Return a
+list of (NAME, RATIO, P_VALUE, VERDICT), one per result also found in the
+baseline.  RATIO is the new median over the baseline median, and P_VALUE
+comes from a Mann-Whitney U test over run times.  VERDICT is 'slower'
+or 'faster' when P_VALUE is below ALPHA and medians differ by more than
+THRESHOLD (relatively), and 'same' otherwise.
 """
+    comparisons = []
+    for result in results:
+        old = baseline.get(result.name)
+        if old is None:
+            continue
+        if old.median > 0:
+            ratio = result.median / old.median
+        else:
+            ratio = math.inf
+        p_value = mann_whitney(old.times, result.times)
+        if p_value < alpha and abs(ratio - 1) > threshold:
+            if ratio > 1:
+                verdict = 'slower'
+            else:
+                verdict = 'faster'
+        else:
+            verdict = 'same'
+        comparisons.append((result.name, ratio, p_value, verdict))
+    return comparisons
+
 
+def report_comparison(comparisons, write=None):
+    if write is None:
+        write = sys.stdout.write
+    write('%8s %8s %7s  %s\n' % ('ratio', 'p', 'verdict', 'name'))
+    for name, ratio, p_value, verdict in comparisons:
+        write('%8.3f %8.4f %7s  %s\n' % (ratio, p_value, verdict, name))
 
-def benchmark(test, repeat=1,
-              calibration=[]):
+
+def mann_whitney(first, second):
+    """\
+Return the two-sided p-value of a Mann-Whitney U test telling if samples
+FIRST and SECOND come from the same distribution.  The normal approximation
+is used, with a correction for ties, so samples should not be tiny.
+"""
+    count1 = len(first)
+    count2 = len(second)
+    if not count1 or not count2:
+        return 1.
+    values = sorted([(value, 0) for value in first]
+                    + [(value, 1) for value in second])
+    # Give tied values their average rank.
+    rank_sum = 0.
+    tie_term = 0.
+    start = 0
+    while start < len(values):
+        end = start
+        while end < len(values) and values[end][0] == values[start][0]:
+            end += 1
+        rank = (start + end + 1) / 2
+        for position in range(start, end):
+            if values[position][1] == 0:
+                rank_sum += rank
+        tied = end - start
+        tie_term += tied ** 3 - tied
+        start = end
+    u = rank_sum - count1 * (count1 + 1) / 2
+    total = count1 + count2
+    mean = count1 * count2 / 2
+    variance = count1 * count2 / 12 * (
+        total + 1 - tie_term / (total * (total - 1) or 1))
+    if variance <= 0:
+        return 1.
+    z = (abs(u - mean) - 0.5) / math.sqrt(variance)
+    return min(1., math.erfc(max(0., z) / math.sqrt(2)))
+
+
+## Older interface.
+
+# True once column headings were written by `benchmark'.
+heading_written = False
+
+
+def benchmark(test, repeat=1):
     """\
 Benchmark the parameter-less function TEST and report its average execution
 time over REPEAT executions, or over a single execution when not specified.
 The whole looped test is repeated twice, with the garbage collector enabled
 and disabled, the enabled status is restored to what it was.
 """
-    import sys
-    import time
+    global heading_written
     write = sys.stdout.write
 
-    # Define an empty function used for calibration.
-    def calibrate():
-        pass
-
     # Define a function returning the time taken for one TEST call.
-    def measure():
-        wall_start = time.time()
-        cpu_start = time.clock()
-        for counter in range(repeat):
-            test()
-        return ((time.clock() - cpu_start) / repeat - calibration[0],
-                (time.time() - wall_start) / repeat - calibration[1])
-    # Is it the first time?
-    if not calibration:
-        # Find the overhead coming from the measurement mechanics.
-        loops = 100000
-        wall_start = time.time()
-        cpu_start = time.clock()
-        for counter in range(loops):
-            calibrate()
-        calibration.append((time.clock() - cpu_start) / loops)
-        calibration.append((time.time() - wall_start) / loops)
+    def measure_once():
+        result = measure(test, runs=3, warmups=0, loops=repeat)
+        return result.cpu_median, result.median
+    if not heading_written:
         # Produce column headings.
         write('    GC enabled          GC disabled    Ratio  Function Name\n')
         write('   CPU      wall       CPU      wall  ena/dis\n')
+        heading_written = True
     # Measure both times, enabling and disabling the garbage collector.
-    import gc
     if gc.isenabled():
         # Start and finish with garbage collector enabled.
-        cpu_gc_on, wall_gc_on = measure()
+        cpu_gc_on, wall_gc_on = measure_once()
         gc.disable()
         gc.collect()
-        cpu_gc_off, wall_gc_off = measure()
+        cpu_gc_off, wall_gc_off = measure_once()
         gc.enable()
     else:
         # Start and finish with garbage collector disabled.
         gc.collect()
-        cpu_gc_off, wall_gc_off = measure()
+        cpu_gc_off, wall_gc_off = measure_once()
         gc.enable()
-        cpu_gc_on, wall_gc_on = measure()
+        cpu_gc_on, wall_gc_on = measure_once()
         gc.disable()
     # Select a proper time scale for reporting values.
     minimum_time = min(cpu_gc_on, wall_gc_on, cpu_gc_off, wall_gc_off)
@@ -71,11 +348,63 @@ and disabled, the enabled status is restored to what it was.
     else:
         factor = 1e6
         unit = 'us'
+    if cpu_gc_off > 0:
+        ratio = cpu_gc_on / cpu_gc_off
+    else:
+        ratio = 1.
     # Produce one line of report on standard output.
     write('%6.2f%-2s %6.2f%-2s   %6.2f%-2s %6.2f%-2s   %3.1f   %s\n'
           % (cpu_gc_on * factor, unit, wall_gc_on * factor, unit,
              cpu_gc_off * factor, unit, wall_gc_off * factor, unit,
-             cpu_gc_on / cpu_gc_off, test.__name__))
+             ratio, test.__name__))
+
+
+def main(tests, arguments=None):
+    """\
+Measure all TESTS, a list of parameter-less functions, of (NAME, FUNCTION)
+pairs or of (NAME, FUNCTION, PARAMETERS) triples, then report.  TESTS may
+be any iterable, a generator lets each test build its data only when its
+turn comes.  ARGUMENTS, taken from the command line if not given, may hold
+`-s FILE' to save results as a baseline, and `-c FILE' to compare them
+with a baseline.  Return 1 if some test got significantly slower than its
+baseline, 0 otherwise.
+"""
+    import getopt
+    if arguments is None:
+        arguments = sys.argv[1:]
+    options, arguments = getopt.getopt(arguments, 'c:s:')
+    save_name = compare_name = None
+    for option, value in options:
+        if option == '-c':
+            compare_name = value
+        elif option == '-s':
+            save_name = value
+    results = []
+    for test in tests:
+        parameters = None
+        if isinstance(test, tuple):
+            if len(test) == 3:
+                name, test, parameters = test
+            else:
+                name, test = test
+        else:
+            name = test.__name__
+        results.append(measure(test, name, parameters=parameters))
+    report(results)
+    if any('size' in result.parameters for result in results):
+        sys.stdout.write('\n')
+        report_scaling(results)
+    status = 0
+    if compare_name is not None:
+        comparisons = compare(load(compare_name), results)
+        sys.stdout.write('\n')
+        report_comparison(comparisons)
+        for comparison in comparisons:
+            if comparison[3] == 'slower':
+                status = 1
+    if save_name is not None:
+        save(results, save_name)
+    return status
 
 
 def test():
@@ -107,6 +436,8 @@ def test():
     benchmark(zip_and_update)
     benchmark(zip_with_none)
     benchmark(zip_with_self)
+    sys.stdout.write('\n')
+    return main([comprehension, zip_and_update, zip_with_none, zip_with_self])
 
 if __name__ == '__main__':
-    test()
+    sys.exit(test())
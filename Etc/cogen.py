@@ -11,11 +11,23 @@ All generators below have the following properties in common:
   explictly used on any iterator argument before calling these methods.
 
 * All results are new lists, input sequences are never directly returned.
+  However, when the BUFFER argument is true, a single list is yielded over
+  and over, modified in place between results.  This avoids allocating one
+  list per result, but the caller should copy any result it wants to keep.
 
 * Successive results are delivered in sorted order, given than input sequences
   were already sorted.
+
+* When the SHARD argument is given as (K, N), only the K-th slice, counting
+  from 0, out of N nearly equal slices of all results gets generated.
+  Generation starts right at the slice, without producing earlier results,
+  so N processes may split an enumeration between themselves.  The `rank_'
+  and `unrank_' functions convert between results and their ordinals.
 """
 
+import itertools
+import math
+
 # J'ai eu besoin chez moi d'un module Python nommé `cogen', qui fournit divers
 # générateurs combinatoires.  Voici comment `cogen' s'utilise:
 #
@@ -65,75 +77,92 @@ All generators below have the following properties in common:
 # aient à beaucoup changer.  On ne peut tout prévoir, bien sûr! :-)
 
 
-def cartesian(*sequences):
+def cartesian(*sequences, buffer=False, shard=None):
     """\
 Generate the `cartesian product' of all SEQUENCES.  Each member of the
 product is a list containing an element taken from each original sequence.
 """
-    length = len(sequences)
-    if length < 4:
-        # Cases 1, 2 and 3 are for speed only, these are not really required.
-        if length == 3:
-            for first in sequences[0]:
-                for second in sequences[1]:
-                    for third in sequences[2]:
-                        yield [first, second, third]
-        elif length == 2:
-            for first in sequences[0]:
-                for second in sequences[1]:
-                    yield [first, second]
-        elif length == 1:
-            for first in sequences[0]:
-                yield [first]
+    pools = [tuple(sequence) for sequence in sequences]
+    lengths = [len(pool) for pool in pools]
+    first, count = shard_bounds(count_cartesian(lengths), shard)
+    if count == 0:
+        return iter(())
+    generator = cartesian_from(pools, unrank_cartesian(first, lengths),
+                               buffer)
+    if shard is None:
+        return generator
+    return itertools.islice(generator, count)
+
+
+def cartesian_from(pools, indices, buffer):
+    # INDICES is an odometer, the last wheel turning faster.
+    result = [pool[index] for pool, index in zip(pools, indices)]
+    last = len(pools) - 1
+    while True:
+        if buffer:
+            yield result
         else:
-            yield []
-    else:
-        head, tail = sequences[:-1], sequences[-1]
-        for result in cartesian(*head):
-            for last in tail:
-                yield result + [tail]
+            yield result[:]
+        position = last
+        while position >= 0:
+            index = indices[position] + 1
+            pool = pools[position]
+            if index < len(pool):
+                indices[position] = index
+                result[position] = pool[index]
+                break
+            indices[position] = 0
+            result[position] = pool[0]
+            position -= 1
+        else:
+            return
 
 
-def subsets(sequence):
+def subsets(sequence, buffer=False, shard=None):
     """\
 Generate all subsets of a given SEQUENCE.  Each subset is delivered
 as a list holding zero or more elements from the original sequence.
 """
     length = len(sequence)
+    first, count = shard_bounds(count_subsets(length), shard)
+    if count == 0:
+        return iter(())
+    generator = subsets_from(sequence, unrank_subset(first, length), buffer)
+    if shard is None:
+        return generator
+    return itertools.islice(generator, count)
+
+
+def subsets_from(sequence, indices, buffer):
+    # INDICES lists increasing positions in SEQUENCE of the current subset.
     # The empty set always sorts as the lowest.
-    yield []
-    if length < 4:
-        # Cases 1, 2 and 3 are for speed only, these are not really required.
-        if length == 3:
-            first = sequence[0]
-            second = sequence[1]
-            third = sequence[2]
-            yield [first]
-            yield [first, second]
-            yield [first, second, third]
-            yield [first, third]
-            yield [second]
-            yield [second, third]
-            yield [third]
-        elif length == 2:
-            first = sequence[0]
-            second = sequence[1]
-            yield [first]
-            yield [first, second]
-            yield [second]
-        elif length == 1:
-            yield [sequence[0]]
-    else:
-        head, tail = sequence[0], sequence[1:]
-        # Some subsets retain HEAD.
-        for result in subsets(tail):
-            result.insert(0, head)
+    length = len(sequence)
+    result = [sequence[index] for index in indices]
+    while True:
+        if buffer:
             yield result
-        # Some subsets do not retain HEAD.
-        for result in subsets(tail):
-            # Avoid returning the empty set more than once.
-            if len(result) > 0:
-                yield result
+        else:
+            yield result[:]
+        if indices and indices[-1] == length - 1:
+            # The subset ends with the last element, so it has no extension.
+            # Drop that last element and advance the previous one instead.
+            indices.pop()
+            result.pop()
+            if not indices:
+                return
+            index = indices[-1] + 1
+            indices[-1] = index
+            result[-1] = sequence[index]
+        elif length:
+            # Extend the subset with the next element.
+            if indices:
+                index = indices[-1] + 1
+            else:
+                index = 0
+            indices.append(index)
+            result.append(sequence[index])
+        else:
+            return
 
 
 def subsets2(sequence):
@@ -141,98 +170,384 @@ def subsets2(sequence):
 Generate all subsets of a given SEQUENCE.  Each subset is delivered
 as a list holding zero or more elements from the original sequence.
 """
-    # Adapted from Eric Raymond.
+    # Adapted from Eric Raymond.  Selectors count in binary, bit K standing
+    # for SEQUENCE[K], and subsets list elements from the highest bit down.
+    # Incrementing a selector clears its trailing one bits and sets the next
+    # bit, so the subset only changes at its end.
     length = len(sequence)
-    pairs = list(zip([1 << position for position in range(length)],
-                sequence))
-    pairs.reverse()
-    for selector in range(1 << length):
-        yield [element for mask, element in pairs if mask & selector]
+    result = []
+    yield []
+    for selector in range(1, 1 << length):
+        position = (selector & -selector).bit_length() - 1
+        if position:
+            del result[-position:]
+        result.append(sequence[position])
+        yield result[:]
 
 
 def powerset(base):
     """Powerset of an iterable, yielding lists."""
-    # From Eric Raymond.
-    pairs = [(2 ** i, x) for i, x in enumerate(base)]
-    for n in range(2 ** len(pairs)):
-        yield [x for m, x in pairs if m & n]
+    # From Eric Raymond.  As in `subsets2', but elements are listed from
+    # the lowest bit up, so the subset only changes at its beginning.
+    base = list(base)
+    result = []
+    yield []
+    for selector in range(1, 1 << len(base)):
+        position = (selector & -selector).bit_length() - 1
+        del result[:position]
+        result.insert(0, base[position])
+        yield result[:]
+
+
+def subsets_gray(sequence):
+    """\
+Generate the changes needed to walk through all subsets of a given
+SEQUENCE, starting from the empty set, in binary reflected Gray code order.
+Each change is a pair (ELEMENT, ADDED): ELEMENT joins the current subset
+when ADDED is true, and leaves it otherwise.  There are 2**N - 1 changes,
+where N == len(SEQUENCE), so a caller may update incremental state in
+constant time for each subset.
+"""
+    present = [False] * len(sequence)
+    for step in range(1, 1 << len(sequence)):
+        # The bit flipping at STEP is its lowest set bit.
+        position = (step & -step).bit_length() - 1
+        added = not present[position]
+        present[position] = added
+        yield sequence[position], added
+
 
+def subset_masks(length, size=1 << 16, gray=False, numpy=False):
+    """\
+Generate all subsets of a sequence of LENGTH elements as bit masks, bit K
+standing for element K, delivered in blocks of at most SIZE masks.  Blocks
+are `array.array('Q')' instances, or NumPy `uint64' arrays when NUMPY is
+true, so subsets may be evaluated in vectorised fashion.  Masks follow
+binary counting order, or Gray code order when GRAY is true.  LENGTH
+should not exceed 64.
+"""
+    assert 0 <= length <= 64, length
+    total = 1 << length
+    if numpy:
+        import numpy
+        for start in range(0, total, size):
+            block = numpy.arange(start, min(start + size, total),
+                                 dtype=numpy.uint64)
+            if gray:
+                block ^= block >> numpy.uint64(1)
+            yield block
+    else:
+        from array import array
+        for start in range(0, total, size):
+            counter = range(start, min(start + size, total))
+            if gray:
+                yield array('Q', [value ^ (value >> 1) for value in counter])
+            else:
+                yield array('Q', counter)
 
-def combinations(sequence, number):
+
+def combinations(sequence, number, buffer=False, shard=None):
     """\
 Generate all combinations of NUMBER elements from list SEQUENCE.
 """
-    # Adapted from Python 2.2 `test/test_generators.py'.
     length = len(sequence)
-    if number > length:
-        return
-    if number == 0:
-        yield []
+    first, count = shard_bounds(count_combinations(length, number), shard)
+    if count == 0:
+        return iter(())
+    generator = combinations_from(
+        sequence, unrank_combination(first, length, number), buffer)
+    if shard is None:
+        return generator
+    return itertools.islice(generator, count)
+
+
+def combinations_from(sequence, indices, buffer):
+    # Adapted from the pure Python equivalent of `itertools.combinations'.
+    length = len(sequence)
+    number = len(indices)
+    result = [sequence[index] for index in indices]
+    if buffer:
+        yield result
     else:
-        head, tail = sequence[0], sequence[1:]
-        # Some combinations retain HEAD.
-        for result in combinations(tail, number - 1):
-            result.insert(0, head)
-            yield result
-        # Some combinations do not retain HEAD.
-        for result in combinations(tail, number):
+        yield result[:]
+    offset = length - number
+    while True:
+        # Find the rightmost index which may still be incremented.
+        position = number - 1
+        while position >= 0 and indices[position] == position + offset:
+            position -= 1
+        if position < 0:
+            return
+        index = indices[position] + 1
+        while position < number:
+            indices[position] = index
+            result[position] = sequence[index]
+            index += 1
+            position += 1
+        if buffer:
             yield result
+        else:
+            yield result[:]
 
 
-def arrangements(sequence, number):
+def arrangements(sequence, number, buffer=False, shard=None):
     """\
 Generate all arrangements of NUMBER elements from list SEQUENCE.
 """
-    # Adapted from PERMUTATIONS below.
     length = len(sequence)
-    if number > length:
-        return
-    if number == 0:
-        yield []
-    else:
-        cut = 0
-        for element in sequence:
-            for result in arrangements(sequence[:cut] + sequence[cut + 1:],
-                                       number - 1):
-                result.insert(0, element)
-                yield result
-            cut += 1
+    first, count = shard_bounds(count_arrangements(length, number), shard)
+    if count == 0:
+        return iter(())
+    generator = arrangements_from(
+        sequence, unrank_arrangement(first, length, number), buffer)
+    if shard is None:
+        return generator
+    return itertools.islice(generator, count)
 
 
-def permutations(sequence):
+def arrangements_from(sequence, indices, buffer):
+    # Lexicographic successor over a full array of indices, the first
+    # NUMBER of which are selected.  Unselected indices follow in increasing
+    # order.  Reversing them before each step lets the usual permutation
+    # successor skip over their orderings.
+    length = len(sequence)
+    number = len(indices)
+    chosen = set(indices)
+    indices = indices + [index for index in range(length)
+                         if index not in chosen]
+    result = [sequence[index] for index in indices[:number]]
+    while True:
+        if buffer:
+            yield result
+        else:
+            yield result[:]
+        indices[number:] = indices[number:][::-1]
+        # Find the longest decreasing suffix, POSITION precedes it.
+        position = min(number - 1, length - 2)
+        while position >= 0 and indices[position] > indices[position + 1]:
+            position -= 1
+        if position < 0:
+            return
+        # Swap with the smallest greater index from the suffix, then make
+        # that suffix increasing.
+        pivot = indices[position]
+        other = length - 1
+        while indices[other] < pivot:
+            other -= 1
+        indices[position] = indices[other]
+        indices[other] = pivot
+        indices[position + 1:] = indices[:position:-1]
+        result[position:] = [sequence[index]
+                             for index in indices[position:number]]
+
+
+def permutations(sequence, buffer=False, shard=None):
     """\
 Generate all permutations from list SEQUENCE.
 """
-    # Adapted from Gerhard Häring <gerhard.haering@gmx.de>, 2002-08-24.
     length = len(sequence)
-    if length < 4:
-        # Cases 1, 2 and 3 are for speed only, these are not really required.
-        if length == 3:
-            first = sequence[0]
-            second = sequence[1]
-            third = sequence[2]
-            yield [first, second, third]
-            yield [first, third, second]
-            yield [second, first, third]
-            yield [second, third, first]
-            yield [third, first, second]
-            yield [third, second, first]
-        elif length == 2:
-            first = sequence[0]
-            second = sequence[1]
-            yield [first, second]
-            yield [second, first]
-        elif length == 1:
-            yield [sequence[0]]
+    first, count = shard_bounds(count_permutations(length), shard)
+    if length < 3:
+        # Cases 0, 1 and 2 are too short for the unrolled loop.
+        generator = arrangements_from(
+            sequence, unrank_permutation(first, length), buffer)
+        if shard is None:
+            return generator
+        return itertools.islice(generator, count)
+    # The unrolled loop starts on a multiple of six.
+    skip = first % 6
+    generator = permutations_from(
+        sequence, unrank_permutation(first - skip, length), buffer)
+    if shard is None:
+        return generator
+    return itertools.islice(generator, skip, skip + count)
+
+
+def permutations_from(sequence, indices, buffer):
+    # Lexicographic successor over an array of indices.  The last three
+    # positions are unrolled, so the successor only runs every sixth result.
+    length = len(sequence)
+    cut = length - 3
+    result = [sequence[index] for index in indices]
+    while True:
+        first, second, third = result[cut:]
+        if buffer:
+            yield result
+            result[cut + 1:] = third, second
+            yield result
+            result[cut:] = second, first, third
+            yield result
+            result[cut + 1:] = third, first
+            yield result
+            result[cut:] = third, first, second
+            yield result
+            result[cut + 1:] = second, first
+            yield result
         else:
-            yield []
-    else:
-        cut = 0
-        for element in sequence:
-            for result in permutations(sequence[:cut] + sequence[cut + 1:]):
-                result.insert(0, element)
-                yield result
-            cut += 1
+            head = result[:cut]
+            yield head + [first, second, third]
+            yield head + [first, third, second]
+            yield head + [second, first, third]
+            yield head + [second, third, first]
+            yield head + [third, first, second]
+            yield head + [third, second, first]
+        # All orders of the last three positions were produced, that suffix
+        # now counts as decreasing.  Find the longest decreasing suffix,
+        # POSITION precedes it.
+        indices[cut:] = indices[cut:][::-1]
+        position = cut - 1
+        while position >= 0 and indices[position] > indices[position + 1]:
+            position -= 1
+        if position < 0:
+            return
+        # Swap with the smallest greater index from the suffix, then make
+        # that suffix increasing.
+        pivot = indices[position]
+        other = length - 1
+        while indices[other] < pivot:
+            other -= 1
+        indices[position] = indices[other]
+        indices[other] = pivot
+        indices[position + 1:] = indices[:position:-1]
+        result[position:] = [sequence[index] for index in indices[position:]]
+
+
+## Counting, ranking and unranking.
+
+# Results are ranked from 0 in the order generators produce them.  A result
+# is described by INDICES, the list of positions of its elements within
+# the original sequence (or within each sequence, for `cartesian').  Given
+# the LENGTH of a sequence, a `rank_' function turns INDICES into a rank,
+# and the matching `unrank_' function does the reverse.
+
+def shard_bounds(total, shard):
+    # Return the first rank and the count of results for SHARD, which is
+    # either None for all TOTAL results, or (K, N) for the K-th slice out of
+    # N slices of nearly equal size, K counting from 0.
+    if shard is None:
+        return 0, total
+    part, parts = shard
+    first = total * part // parts
+    return first, total * (part + 1) // parts - first
+
+
+def count_cartesian(lengths):
+    return math.prod(lengths)
+
+
+def rank_cartesian(indices, lengths):
+    rank = 0
+    for index, length in zip(indices, lengths):
+        rank = rank * length + index
+    return rank
+
+
+def unrank_cartesian(rank, lengths):
+    indices = []
+    for length in reversed(lengths):
+        rank, index = divmod(rank, length)
+        indices.append(index)
+    indices.reverse()
+    return indices
+
+
+def count_subsets(length):
+    return 1 << length
+
+
+def rank_subset(indices, length):
+    # Subsets are produced as a preorder walk of a tree, in which a subset
+    # ending with position P has one child subset per position after P.
+    # Each subtree is skipped by adding its size.
+    rank = 0
+    previous = -1
+    for index in indices:
+        rank += 1
+        for skipped in range(previous + 1, index):
+            rank += 1 << (length - 1 - skipped)
+        previous = index
+    return rank
+
+
+def unrank_subset(rank, length):
+    indices = []
+    index = 0
+    while rank:
+        rank -= 1
+        while rank >= 1 << (length - 1 - index):
+            rank -= 1 << (length - 1 - index)
+            index += 1
+        indices.append(index)
+        index += 1
+    return indices
+
+
+def count_combinations(length, number):
+    return math.comb(length, number)
+
+
+def rank_combination(indices, length):
+    number = len(indices)
+    rank = 0
+    value = 0
+    for position, index in enumerate(indices):
+        while value < index:
+            rank += math.comb(length - 1 - value, number - 1 - position)
+            value += 1
+        value = index + 1
+    return rank
+
+
+def unrank_combination(rank, length, number):
+    indices = []
+    value = 0
+    for position in range(number):
+        while True:
+            size = math.comb(length - 1 - value, number - 1 - position)
+            if rank < size:
+                break
+            rank -= size
+            value += 1
+        indices.append(value)
+        value += 1
+    return indices
+
+
+def count_arrangements(length, number):
+    return math.perm(length, number)
+
+
+def rank_arrangement(indices, length):
+    number = len(indices)
+    available = list(range(length))
+    rank = 0
+    for position, index in enumerate(indices):
+        digit = available.index(index)
+        del available[digit]
+        rank += digit * math.perm(length - 1 - position, number - 1 - position)
+    return rank
+
+
+def unrank_arrangement(rank, length, number):
+    available = list(range(length))
+    indices = []
+    for position in range(number):
+        digit, rank = divmod(
+            rank, math.perm(length - 1 - position, number - 1 - position))
+        indices.append(available.pop(digit))
+    return indices
+
+
+def count_permutations(length):
+    return math.factorial(length)
+
+
+def rank_permutation(indices):
+    return rank_arrangement(indices, len(indices))
+
+
+def unrank_permutation(rank, length):
+    return unrank_arrangement(rank, length, length)
 
 
 def test():
@@ -265,5 +580,40 @@ def test():
         for permutation in permutations(list(range(1, 5))):
             print(permutation)
 
+
+def benchmark(sizes=(9, 10), product_sizes=(10, 10, 10, 10, 10, 10)):
+    # Compare generators with their `itertools' counterparts.  Sizes 11 and
+    # 12 for permutations are fine but take minutes.
+    import itertools
+    import time
+
+    def measure(title, generator):
+        start = time.perf_counter()
+        count = 0
+        for result in generator:
+            count += 1
+        print('%-40s %10d results, %7.3f s'
+              % (title, count, time.perf_counter() - start))
+
+    for size in sizes:
+        sequence = list(range(size))
+        measure('permutations n=%d' % size, permutations(sequence))
+        measure('permutations n=%d, buffer' % size,
+                permutations(sequence, buffer=True))
+        measure('itertools.permutations n=%d' % size,
+                itertools.permutations(sequence))
+    sequence = list(range(20))
+    measure('combinations 20, 10', combinations(sequence, 10))
+    measure('combinations 20, 10, buffer',
+            combinations(sequence, 10, buffer=True))
+    measure('itertools.combinations 20, 10',
+            itertools.combinations(sequence, 10))
+    sequences = [list(range(size)) for size in product_sizes]
+    title = 'x'.join(map(str, product_sizes))
+    measure('cartesian %s' % title, cartesian(*sequences))
+    measure('cartesian %s, buffer' % title,
+            cartesian(*sequences, buffer=True))
+    measure('itertools.product %s' % title, itertools.product(*sequences))
+
 if __name__ == '__main__':
     test()
@@ -10,7 +10,7 @@ import os
 import time
 import sys
 from email import message_from_string
-from email.Errors import MessageError
+from email.errors import MessageError
 
 
 class Error(Exception):
@@ -21,7 +21,7 @@ def folder(file_name, strip201=False):
     if file_name:
         if not os.path.isfile(file_name):
             raise Error("%s: File not found." % file_name)
-        buffer = file(file_name).read()
+        buffer = open(file_name).read()
     else:
         buffer = sys.stdin.read()
     if strip201:
@@ -77,7 +77,7 @@ class Folder:
         if size < self.file_size:
             self.error("May not rescan a shrunk folder.")
         if size > self.file_size:
-            input = file(self.file_name)
+            input = open(self.file_name)
             input.seek(self.file_size)
             self.file_size = size
             self.extend_data(input.read())
@@ -125,7 +125,7 @@ class Folder:
                         if self.file_name is None:
                             write = sys.stdout.write
                         else:
-                            write = file(self.file_name, 'w').write
+                            write = open(self.file_name, 'w').write
                         if self.folder_prefix is not None:
                             write(self.folder_prefix)
                     self.write_indexed_message(counter, write)
@@ -6,49 +6,167 @@
 A graph is made from a set of vertices, and a set of oriented arcs.
 
 Each vertex should be immutable and not None.  An oriented arc is an instance
-of an Arc, as below.
+of an Arc, as below.  Functions accepting ARCS also accept a Graph instance,
+which keeps arcs indexed between calls.
 """
 
+import heapq
+from array import array
 
-def path(before, after, arcs):
+
+def path(before, after, arcs, heuristic=None):
     """\
 Return the most economical path from the BEFORE vertex to the AFTER vertex,
 given a set of ARCS representing possible partial paths.  The path is
 returned as a list of successive arcs connecting BEFORE to AFTER, or None
 is there is no such path.
+
+Arc weights should not be negative.  If HEURISTIC is given, it is a function
+which, given a vertex, returns a lower bound for the weight of the remaining
+path from that vertex to AFTER, and the search then proceeds as A*.
 """
+    if isinstance(arcs, Graph):
+        return arcs.path(before, after, heuristic)
+    if before == after:
+        return []
+    followers = index_followers(arcs)
+    # With each reached vertex, associate its best total weight from BEFORE,
+    # and the best backward arc leading to it.
+    weights = {before: 0}
+    backwards = {before: None}
+    # Heap entries are (estimate, order, weight, vertex), ORDER avoids ever
+    # comparing vertices, which might not be orderable.
+    order = 0
+    if heuristic is None:
+        heap = [(0, order, 0, before)]
+    else:
+        heap = [(heuristic(before), order, 0, before)]
+    while heap:
+        estimate, ignored, weight, vertex = heapq.heappop(heap)
+        if weight > weights[vertex]:
+            # This is a stale entry, a better one has been processed.
+            continue
+        if vertex == after:
+            return rebuild_path(backwards, after)
+        for arc in followers.get(vertex, ()):
+            total = weight + arc.weight
+            previous = weights.get(arc.after)
+            if previous is None or total < previous:
+                weights[arc.after] = total
+                backwards[arc.after] = arc
+                order += 1
+                if heuristic is None:
+                    estimate = total
+                else:
+                    estimate = total + heuristic(arc.after)
+                heapq.heappush(heap, (estimate, order, total, arc.after))
+    return None
 
-    class Vertex(tuple):
 
-        best_forward = property(make_getter(0))
-        total_weight = property(make_getter(1))
+def path_bidirectional(before, after, arcs):
+    """\
+Return the most economical path from the BEFORE vertex to the AFTER vertex,
+exactly as `path' does, but searching simultaneously forward from BEFORE
+and backward from AFTER.  This often explores much fewer vertices on large
+graphs.  Arc weights should not be negative.
+"""
+    if isinstance(arcs, Graph):
+        return arcs.path_bidirectional(before, after)
+    if before == after:
+        return []
+    followers, predecessors = index_both(arcs)
+    # Index 0 is for the forward search, index 1 for the backward search.
+    weights = {before: 0}, {after: 0}
+    best_arcs = {before: None}, {after: None}
+    heaps = [(0, 0, before)], [(0, 0, after)]
+    indexes = followers, predecessors
+    order = 0
+    best_total = None
+    meeting = None
+    while heaps[0] and heaps[1]:
+        if (best_total is not None
+                and heaps[0][0][0] + heaps[1][0][0] >= best_total):
+            break
+        # Expand the side having the smallest frontier.
+        side = len(heaps[0]) > len(heaps[1])
+        weight, ignored, vertex = heapq.heappop(heaps[side])
+        weights_here = weights[side]
+        if weight > weights_here[vertex]:
+            continue
+        weights_there = weights[not side]
+        for arc in indexes[side].get(vertex, ()):
+            if side:
+                neighbour = arc.before
+            else:
+                neighbour = arc.after
+            total = weight + arc.weight
+            previous = weights_here.get(neighbour)
+            if previous is None or total < previous:
+                weights_here[neighbour] = total
+                best_arcs[side][neighbour] = arc
+                order += 1
+                heapq.heappush(heaps[side], (total, order, neighbour))
+                other = weights_there.get(neighbour)
+                if other is not None and (best_total is None
+                                          or total + other < best_total):
+                    best_total = total + other
+                    meeting = neighbour
+    if meeting is None:
+        return None
+    result = rebuild_path(best_arcs[0], meeting)
+    backwards = best_arcs[1]
+    arc = backwards[meeting]
+    while arc is not None:
+        result.append(arc)
+        arc = backwards[arc.after]
+    return result
 
-        def __new__(cls, best_forward, total_weight):
-            return tuple.__new__([best_forward, total_weight])
 
-    # With each vertex, associate a best forward arc and total weight.
-    table = {after: Vertex(None, 0)}
-    changed = True
-    while changed:
-        changed = False
-        for arc in arcs:
-            entry = table.get(arc.after)
-            if entry is not None:
-                weight = arc.weight + entry.total_weight
-                previous = table.get(arc.before)
-                if previous is None or weight < previous.total_weight:
-                    table[arc.before] = Vertex(arc, weight)
-                    changed = True
-    # Rebuild best path.
-    entry = table.get(before)
-    if entry is None:
-        return None
-    path = []
-    arc = entry.best_forward
+def rebuild_path(backwards, vertex):
+    # Follow best backward arcs from VERTEX, return them in forward order.
+    result = []
+    arc = backwards[vertex]
     while arc is not None:
-        path.append(arc)
-        arc = table[arc.after].best_forward
-    return path
+        result.append(arc)
+        arc = backwards[arc.before]
+    result.reverse()
+    return result
+
+
+def index_followers(arcs):
+    """\
+Return a dictionary associating each vertex with the list of ARCS starting
+from it.  Arcs are scanned once.
+"""
+    followers = {}
+    for arc in arcs:
+        entry = followers.get(arc.before)
+        if entry is None:
+            followers[arc.before] = [arc]
+        else:
+            entry.append(arc)
+    return followers
+
+
+def index_both(arcs):
+    """\
+Return two dictionaries, associating each vertex with the list of ARCS
+respectively starting from it and ending at it.  Arcs are scanned once.
+"""
+    followers = {}
+    predecessors = {}
+    for arc in arcs:
+        entry = followers.get(arc.before)
+        if entry is None:
+            followers[arc.before] = [arc]
+        else:
+            entry.append(arc)
+        entry = predecessors.get(arc.after)
+        if entry is None:
+            predecessors[arc.after] = [arc]
+        else:
+            entry.append(arc)
+    return followers, predecessors
 
 
 def sort(vertices, arcs):
@@ -59,51 +177,26 @@ lists, which together hold all original VERTICES, with none repeated.
 The first list is the sorted result, the second list gives all vertices
 involved into some cycle.
 """
-
-    class Vertex(list):
-
-        vertex = property(make_getter(0), make_setter(0))
-        predecessor_count = property(make_getter(1), make_setter(1))
-        followers = property(make_getter(2), make_setter(2), make_deleter(2))
-
-    # With each vertex, associate a predecessor count and the set of all
-    # follower vertices.
-    table = {}
-    for vertex in vertices:
-        table[vertex] = Vertex([vertex, 0, []])
-    for arc in arcs:
-        before = table.get(arc.before)
-        after = table.get(arc.after)
-        if (before is not None
-                and after is not None
-                and after not in before.followers):
-            before.followers.append(after)
-            after.predecessor_count += 1
-    vertices = list(table.values())
-    del table
-    # Accumulate sorted vertices in the SORTED list.
-    zeroes = []
-    for vertex in vertices[:]:
-        if vertex.predecessor_count == 0:
-            vertices.remove(vertex)
-            zeroes.append(vertex)
+    if isinstance(arcs, Graph):
+        return arcs.sort(vertices)
+    followers, counts = index_constraints(vertices, arcs)
+    # Accumulate sorted vertices in the SORTED list, one wave of vertices
+    # without remaining predecessors at a time (Kahn's algorithm).
+    zeroes = [vertex for vertex, count in counts.items() if count == 0]
     sorted = []
     while zeroes:
         new_zeroes = []
         zeroes.sort()
         for zero in zeroes:
-            sorted.append(zero.vertex)
-            for vertex in zero.followers:
-                vertex.predecessor_count -= 1
-                if vertex.predecessor_count == 0:
-                    vertices.remove(vertex)
+            sorted.append(zero)
+            for vertex in followers[zero]:
+                count = counts[vertex] - 1
+                counts[vertex] = count
+                if count == 0:
                     new_zeroes.append(vertex)
         zeroes = new_zeroes
     # Unprocessed vertices participate into various cycles.
-    cycles = []
-    for vertex in vertices:
-        cycles.append(vertex.vertex)
-        del vertex.followers
+    cycles = [vertex for vertex, count in counts.items() if count > 0]
     return sorted, cycles
 
 
@@ -115,57 +208,78 @@ list containing the sorted result.  That list may contain sublists,
 in which case these sublists contain vertices involved together in some cycle.
 These sublists taken whole are still topologically sorted within the result.
 """
+    if isinstance(arcs, Graph):
+        return arcs.sort2(vertices)
+    followers, counts = index_constraints(vertices, arcs)
+    # Tarjan's algorithm finds strongly connected components in reverse
+    # topological order.  Vertices are explored in reverse, so unconstrained
+    # vertices keep their original order once the result gets reversed.
+    # The depth-first search is iterative, to avoid recursion limits.
+    numbers = {}
+    lowlinks = {}
+    stack = []
+    stacked = set()
+    result = []
+    counter = 0
+    for root in reversed(list(counts)):
+        if root in numbers:
+            continue
+        numbers[root] = lowlinks[root] = counter
+        counter += 1
+        stack.append(root)
+        stacked.add(root)
+        work = [(root, iter(followers[root]))]
+        while work:
+            vertex, children = work[-1]
+            for child in children:
+                if child not in numbers:
+                    numbers[child] = lowlinks[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    stacked.add(child)
+                    work.append((child, iter(followers[child])))
+                    break
+                if child in stacked and numbers[child] < lowlinks[vertex]:
+                    lowlinks[vertex] = numbers[child]
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    if lowlinks[vertex] < lowlinks[parent]:
+                        lowlinks[parent] = lowlinks[vertex]
+                if lowlinks[vertex] == numbers[vertex]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        stacked.discard(member)
+                        component.append(member)
+                        if member == vertex:
+                            break
+                    if (len(component) == 1
+                            and vertex not in followers[vertex]):
+                        result.append(vertex)
+                    else:
+                        result.append(component)
+    result.reverse()
+    return result
 
-    class Vertex(list):
-
-        vertex = property(make_getter(0), make_setter(0))
-        predecessor_count = property(make_getter(1), make_setter(1))
-        followers = property(make_getter(2), make_setter(2), make_deleter(2))
 
-    # With each vertex, associate a predecessor count and the set of all
-    # follower vertices.
-    table = {}
+def index_constraints(vertices, arcs):
+    # Return a dictionary associating each of VERTICES with the set of its
+    # followers, and another giving its count of distinct predecessors.
+    # Arcs referring to non-listed vertices are ignored.
+    followers = {}
+    counts = {}
     for vertex in vertices:
-        table[vertex] = Vertex([vertex, 0, []])
+        followers[vertex] = set()
+        counts[vertex] = 0
     for arc in arcs:
-        before = table.get(arc.before)
-        after = table.get(arc.after)
-        if (before is not None
-                and after is not None
-                and after not in before.followers):
-            before.followers.append(after)
-            after.predecessor_count += 1
-    vertices = list(table.values())
-    del table
-    # Accumulate sorted vertices in the SORTED list.
-    sorted = []
-    while vertices:
-        # Sort by decreasing predecessor count.
-        vertices.sort()
-        vertices.reverse()
-        # Consider the last (and lowest) predecessor count.
-        if vertices[-1].predecessor_count == 0:
-            # If zero, we have a run of topologically sorted vertices.
-            while vertices and vertices[-1].predecessor_count == 0:
-                vertex = vertices.pop()
-                for vertex2 in vertex.followers:
-                    vertex2.predecessor_count -= 1
-                sorted.append(vertex.vertex)
-        else:
-            # If not zero, the vertex is necessarily part of a cycle.
-            # Find the shortest path back to self.
-            vertex = vertices.pop()
-            cycle = [vertex]
-            # ...
-            sublist = []
-            for vertex in cycle:
-                for vertex2 in vertex.followers:
-                    vertex2.predecessor_count -= 1
-                # Help the Python garbage collector.
-                del vertex.followers
-                sublist.append(vertex.vertex)
-            sorted.append(sublist)
-    return sorted
+        entry = followers.get(arc.before)
+        if entry is not None and arc.after in counts:
+            if arc.after not in entry:
+                entry.add(arc.after)
+                counts[arc.after] += 1
+    return followers, counts
 
 
 ## Code for naming tuple or list elements.
@@ -214,3 +328,717 @@ a weight of one is implied if none are given.
     before = property(make_getter(0))
     after = property(make_getter(1))
     weight = property(weight_getter)
+
+
+## Compact graph container.
+
+class Graph:
+    """\
+A graph holding vertices and arcs in compact form, meant to be built once
+and queried many times.  Each vertex is interned as an integer identifier,
+and arcs are kept in parallel arrays.  Adjacency and reverse adjacency are
+indexed in compressed sparse row form, that is, for each vertex identifier,
+a slice of one shared array lists its neighbours.  Arcs may be added at
+any time.  On the next query, a few arcs added since the last one are
+merged into the existing indexes, while many are indexed anew, through a
+linear counting sort.
+
+A Graph may be given instead of ARCS to `path', `path_bidirectional',
+`sort' and `sort2'.
+"""
+
+    def __init__(self, arcs=(), vertices=()):
+        # VERTICES[IDENTIFIER] gives the vertex, IDENTIFIERS[VERTEX] is the
+        # reverse mapping.
+        self.vertices = []
+        self.identifiers = {}
+        # For each arc, its starting and ending vertex identifiers, weight,
+        # and whether that weight was explicit.
+        self.befores = array('i')
+        self.afters = array('i')
+        self.weights = array('d')
+        self.explicit = bytearray()
+        self.indexed = False
+        # Number of arcs already within the indexes.
+        self.indexed_arcs = 0
+        for vertex in vertices:
+            self.add_vertex(vertex)
+        self.add_arcs(arcs)
+
+    def __len__(self):
+        return len(self.vertices)
+
+    def __contains__(self, vertex):
+        return vertex in self.identifiers
+
+    def add_vertex(self, vertex):
+        """\
+Add VERTEX to the graph if not already there, return its identifier.
+"""
+        identifier = self.identifiers.get(vertex)
+        if identifier is None:
+            identifier = self.identifiers[vertex] = len(self.vertices)
+            self.vertices.append(vertex)
+            self.indexed = False
+        return identifier
+
+    def add_arc(self, before, after, weight=None):
+        """\
+Add an arc going from the BEFORE vertex to the AFTER vertex.  A weight of
+one is implied if WEIGHT is not given.
+"""
+        self.befores.append(self.add_vertex(before))
+        self.afters.append(self.add_vertex(after))
+        if weight is None:
+            self.weights.append(1)
+            self.explicit.append(0)
+        else:
+            self.weights.append(weight)
+            self.explicit.append(1)
+        self.indexed = False
+
+    def add_arcs(self, arcs):
+        """\
+Add all ARCS, which are Arc instances.
+"""
+        add_arc = self.add_arc
+        for arc in arcs:
+            if len(arc) > 2:
+                add_arc(arc[0], arc[1], arc[2])
+            else:
+                add_arc(arc[0], arc[1])
+
+    def arc_count(self):
+        return len(self.befores)
+
+    def arc(self, index):
+        """\
+Return the INDEX-th arc of the graph, as an Arc instance.
+"""
+        before = self.vertices[self.befores[index]]
+        after = self.vertices[self.afters[index]]
+        if self.explicit[index]:
+            weight = self.weights[index]
+            if weight.is_integer():
+                weight = int(weight)
+            return Arc(before, after, weight)
+        return Arc(before, after)
+
+    def arcs(self):
+        """\
+Generate all arcs of the graph, as Arc instances, in insertion order.
+"""
+        for index in range(len(self.befores)):
+            yield self.arc(index)
+
+    def followers(self, vertex):
+        """\
+Return the list of vertices reached by arcs starting from VERTEX.
+"""
+        identifier = self.identifiers.get(vertex)
+        if identifier is None:
+            return []
+        self.index()
+        vertices = self.vertices
+        starts = self.forward_starts
+        return [vertices[follower] for follower in self.forward_targets[
+            starts[identifier]:starts[identifier + 1]]]
+
+    def predecessors(self, vertex):
+        """\
+Return the list of vertices starting arcs which end at VERTEX.
+"""
+        identifier = self.identifiers.get(vertex)
+        if identifier is None:
+            return []
+        self.index()
+        vertices = self.vertices
+        starts = self.backward_starts
+        return [vertices[predecessor] for predecessor in self.backward_targets[
+            starts[identifier]:starts[identifier + 1]]]
+
+    def index(self):
+        # Bring adjacency indexes up to date if arcs or vertices were added.
+        # Merging costs a memory move of the indexes per vertex having new
+        # arcs, and a pass over the vertex starts, so it is only used when
+        # few arcs were added since the indexes were last built.
+        if self.indexed:
+            return
+        count = len(self.befores)
+        first = self.indexed_arcs
+        if first and (count - first) * 16 <= count:
+            self.merge_by(self.forward_starts, self.forward_targets,
+                          self.forward_arcs, self.befores, self.afters, first)
+            self.merge_by(self.backward_starts, self.backward_targets,
+                          self.backward_arcs, self.afters, self.befores, first)
+        else:
+            self.forward_starts, self.forward_targets, self.forward_arcs = (
+                self.index_by(self.befores, self.afters))
+            (self.backward_starts, self.backward_targets,
+             self.backward_arcs) = self.index_by(self.afters, self.befores)
+        self.indexed_arcs = count
+        self.indexed = True
+
+    def index_by(self, keys, targets):
+        # Return STARTS, NEIGHBOURS and ARCS arrays, such that for vertex
+        # identifier K, NEIGHBOURS[STARTS[K]:STARTS[K+1]] are the TARGETS of
+        # arcs having K in KEYS, and ARCS gives the index of these arcs.
+        # Arcs are placed by a counting sort, so arcs of a vertex keep their
+        # insertion order.
+        counts = [0] * (len(self.vertices) + 1)
+        for key in keys:
+            counts[key + 1] += 1
+        total = 0
+        for position, count in enumerate(counts):
+            total += count
+            counts[position] = total
+        fill = counts[:-1]
+        order = [0] * len(keys)
+        for arc, key in enumerate(keys):
+            position = fill[key]
+            fill[key] = position + 1
+            order[position] = arc
+        return (array('i', counts),
+                array('i', map(targets.__getitem__, order)),
+                array('i', order))
+
+    def merge_by(self, starts, neighbours, arcs, keys, targets, first):
+        # Update in place STARTS, NEIGHBOURS and ARCS, as returned by
+        # `index_by' for the arcs before FIRST, so they also cover the arcs
+        # from FIRST on.  New arcs go after the older ones of their vertex.
+        starts.extend([starts[-1]] * (len(self.vertices) + 1 - len(starts)))
+        groups = {}
+        for arc in range(first, len(keys)):
+            groups.setdefault(keys[arc], []).append(arc)
+        groups = sorted(groups.items())
+        # Insert from the highest vertex down, so lower positions hold.
+        for key, group in reversed(groups):
+            position = starts[key + 1]
+            neighbours[position:position] = array(
+                'i', map(targets.__getitem__, group))
+            arcs[position:position] = array('i', group)
+        # Shift the starts following each vertex having new arcs.
+        shift = 0
+        for counter, (key, group) in enumerate(groups):
+            shift += len(group)
+            if counter + 1 < len(groups):
+                end = groups[counter + 1][0] + 1
+            else:
+                end = len(starts)
+            starts[key + 1:end] = array(
+                'i', map(shift.__add__, starts[key + 1:end]))
+
+    def path(self, before, after, heuristic=None):
+        """\
+Same as the `path' function, over this graph.
+"""
+        if before == after:
+            return []
+        start = self.identifiers.get(before)
+        goal = self.identifiers.get(after)
+        if start is None or goal is None:
+            return None
+        self.index()
+        starts = self.forward_starts
+        targets = self.forward_targets
+        arcs = self.forward_arcs
+        costs = self.weights
+        vertices = self.vertices
+        weights = {start: 0}
+        backwards = {start: None}
+        if heuristic is None:
+            heap = [(0, 0, start)]
+        else:
+            heap = [(heuristic(before), 0, start)]
+        while heap:
+            estimate, weight, identifier = heapq.heappop(heap)
+            if weight > weights[identifier]:
+                continue
+            if identifier == goal:
+                return self.rebuild_path(backwards, goal, self.befores)
+            for position in range(starts[identifier],
+                                  starts[identifier + 1]):
+                follower = targets[position]
+                arc = arcs[position]
+                total = weight + costs[arc]
+                previous = weights.get(follower)
+                if previous is None or total < previous:
+                    weights[follower] = total
+                    backwards[follower] = arc
+                    if heuristic is None:
+                        estimate = total
+                    else:
+                        estimate = total + heuristic(vertices[follower])
+                    heapq.heappush(heap, (estimate, total, follower))
+        return None
+
+    def path_bidirectional(self, before, after):
+        """\
+Same as the `path_bidirectional' function, over this graph.
+"""
+        if before == after:
+            return []
+        start = self.identifiers.get(before)
+        goal = self.identifiers.get(after)
+        if start is None or goal is None:
+            return None
+        self.index()
+        costs = self.weights
+        # Index 0 is for the forward search, index 1 for the backward search.
+        indexes = ((self.forward_starts, self.forward_targets,
+                    self.forward_arcs),
+                   (self.backward_starts, self.backward_targets,
+                    self.backward_arcs))
+        weights = {start: 0}, {goal: 0}
+        best_arcs = {start: None}, {goal: None}
+        heaps = [(0, start)], [(0, goal)]
+        best_total = None
+        meeting = None
+        while heaps[0] and heaps[1]:
+            if (best_total is not None
+                    and heaps[0][0][0] + heaps[1][0][0] >= best_total):
+                break
+            side = len(heaps[0]) > len(heaps[1])
+            weight, identifier = heapq.heappop(heaps[side])
+            weights_here = weights[side]
+            if weight > weights_here[identifier]:
+                continue
+            weights_there = weights[not side]
+            starts, targets, arcs = indexes[side]
+            for position in range(starts[identifier],
+                                  starts[identifier + 1]):
+                neighbour = targets[position]
+                arc = arcs[position]
+                total = weight + costs[arc]
+                previous = weights_here.get(neighbour)
+                if previous is None or total < previous:
+                    weights_here[neighbour] = total
+                    best_arcs[side][neighbour] = arc
+                    heapq.heappush(heaps[side], (total, neighbour))
+                    other = weights_there.get(neighbour)
+                    if other is not None and (best_total is None
+                                              or total + other < best_total):
+                        best_total = total + other
+                        meeting = neighbour
+        if meeting is None:
+            return None
+        result = self.rebuild_path(best_arcs[0], meeting, self.befores)
+        backwards = best_arcs[1]
+        afters = self.afters
+        arc = backwards[meeting]
+        while arc is not None:
+            result.append(self.arc(arc))
+            arc = backwards[afters[arc]]
+        return result
+
+    def rebuild_path(self, backwards, identifier, befores):
+        # Follow best backward arcs from IDENTIFIER, return them as Arc
+        # instances in forward order.
+        result = []
+        arc = backwards[identifier]
+        while arc is not None:
+            result.append(self.arc(arc))
+            arc = backwards[befores[arc]]
+        result.reverse()
+        return result
+
+    def selection(self, vertices):
+        # Return the identifiers of listed VERTICES, without repetition,
+        # a bytearray flagging selected identifiers, and the list of
+        # VERTICES unknown to the graph.  All vertices are selected when
+        # VERTICES is None.
+        if vertices is None:
+            return (list(range(len(self.vertices))),
+                    bytearray(b'\1') * len(self.vertices), [])
+        identifiers = self.identifiers
+        selected = bytearray(len(self.vertices))
+        listed = []
+        unknown = []
+        seen = set()
+        for vertex in vertices:
+            identifier = identifiers.get(vertex)
+            if identifier is None:
+                if vertex not in seen:
+                    seen.add(vertex)
+                    unknown.append(vertex)
+            elif not selected[identifier]:
+                selected[identifier] = 1
+                listed.append(identifier)
+        return listed, selected, unknown
+
+    def sort(self, vertices=None):
+        """\
+Same as the `sort' function over this graph, restricted to VERTICES if
+given.  Vertices unknown to the graph have no constraints.
+"""
+        self.index()
+        listed, selected, unknown = self.selection(vertices)
+        starts = self.forward_starts
+        targets = self.forward_targets
+        all_vertices = self.vertices
+        identifiers = self.identifiers
+        # Count predecessors among selected vertices.  Repeated arcs are
+        # counted and later discounted as many times, which is harmless.
+        counts = array('i', bytes(4 * len(all_vertices)))
+        for identifier in listed:
+            for follower in targets[starts[identifier]:
+                                    starts[identifier + 1]]:
+                if selected[follower]:
+                    counts[follower] += 1
+        zeroes = [all_vertices[identifier] for identifier in listed
+                  if counts[identifier] == 0]
+        zeroes += unknown
+        sorted = []
+        while zeroes:
+            new_zeroes = []
+            zeroes.sort()
+            for zero in zeroes:
+                sorted.append(zero)
+                identifier = identifiers.get(zero)
+                if identifier is None:
+                    continue
+                for follower in targets[starts[identifier]:
+                                        starts[identifier + 1]]:
+                    if selected[follower]:
+                        count = counts[follower] - 1
+                        counts[follower] = count
+                        if count == 0:
+                            new_zeroes.append(all_vertices[follower])
+            zeroes = new_zeroes
+        cycles = [all_vertices[identifier] for identifier in listed
+                  if counts[identifier] > 0]
+        return sorted, cycles
+
+    def sort2(self, vertices=None):
+        """\
+Same as the `sort2' function over this graph, restricted to VERTICES if
+given.  Vertices unknown to the graph have no constraints.
+"""
+        self.index()
+        listed, selected, unknown = self.selection(vertices)
+        starts = self.forward_starts
+        targets = self.forward_targets
+        all_vertices = self.vertices
+        # See the `sort2' function for the algorithm.  NUMBERS is -1 for
+        # unvisited vertices, STACKED flags vertices on the Tarjan stack.
+        numbers = array('i', [-1]) * len(all_vertices)
+        lowlinks = array('i', bytes(4 * len(all_vertices)))
+        stacked = bytearray(len(all_vertices))
+        stack = []
+        result = unknown[::-1]
+        counter = 0
+        for root in reversed(listed):
+            if numbers[root] >= 0:
+                continue
+            numbers[root] = lowlinks[root] = counter
+            counter += 1
+            stack.append(root)
+            stacked[root] = 1
+            work = [(root, iter(targets[starts[root]:starts[root + 1]]))]
+            while work:
+                identifier, children = work[-1]
+                for child in children:
+                    if not selected[child]:
+                        continue
+                    if numbers[child] < 0:
+                        numbers[child] = lowlinks[child] = counter
+                        counter += 1
+                        stack.append(child)
+                        stacked[child] = 1
+                        work.append(
+                            (child,
+                             iter(targets[starts[child]:starts[child + 1]])))
+                        break
+                    if (stacked[child]
+                            and numbers[child] < lowlinks[identifier]):
+                        lowlinks[identifier] = numbers[child]
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        if lowlinks[identifier] < lowlinks[parent]:
+                            lowlinks[parent] = lowlinks[identifier]
+                    if lowlinks[identifier] == numbers[identifier]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            stacked[member] = 0
+                            component.append(all_vertices[member])
+                            if member == identifier:
+                                break
+                        if len(component) == 1 and identifier not in targets[
+                                starts[identifier]:starts[identifier + 1]]:
+                            result.append(component[0])
+                        else:
+                            result.append(component)
+        result.reverse()
+        return result
+
+
+## Incremental topological order.
+
+class CycleError(Exception):
+    """\
+Raised when an arc would close a cycle.  The CYCLE attribute lists the
+vertices of the offending cycle, starting with the AFTER vertex of the
+rejected arc and ending with its BEFORE vertex.
+"""
+
+    def __init__(self, cycle):
+        Exception.__init__(self, cycle)
+        self.cycle = cycle
+
+
+class Order:
+    """\
+Maintain a topological order of vertices under arc insertions and
+deletions, following Pearce and Kelly's dynamic algorithm.  When an
+inserted arc contradicts the current order, only the vertices lying
+between its ends in that order are explored and reordered.  An arc which
+would introduce a cycle is refused right away, raising CycleError.
+"""
+
+    def __init__(self, vertices=(), arcs=()):
+        # VERTICES[POSITION] gives the vertex at that POSITION, or None for
+        # a removed vertex.  POSITIONS[VERTEX] is the reverse mapping.
+        self.vertices = []
+        self.positions = {}
+        self.followers = {}
+        self.predecessors = {}
+        for vertex in vertices:
+            self.add_vertex(vertex)
+        for arc in arcs:
+            self.add_arc(arc.before, arc.after)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, vertex):
+        return vertex in self.positions
+
+    def __iter__(self):
+        for vertex in self.vertices:
+            if vertex is not None:
+                yield vertex
+
+    def order(self):
+        """\
+Return the list of all vertices, topologically sorted.
+"""
+        return list(self)
+
+    def precedes(self, before, after):
+        """\
+Tell if BEFORE comes before AFTER in the current order.
+"""
+        return self.positions[before] < self.positions[after]
+
+    def add_vertex(self, vertex):
+        """\
+Add VERTEX, unconstrained, at the end of the order.
+"""
+        if vertex not in self.positions:
+            self.positions[vertex] = len(self.vertices)
+            self.vertices.append(vertex)
+            self.followers[vertex] = set()
+            self.predecessors[vertex] = set()
+
+    def remove_vertex(self, vertex):
+        """\
+Remove VERTEX and all arcs touching it.
+"""
+        for follower in self.followers.pop(vertex):
+            self.predecessors[follower].discard(vertex)
+        for predecessor in self.predecessors.pop(vertex):
+            self.followers[predecessor].discard(vertex)
+        self.vertices[self.positions.pop(vertex)] = None
+        # Compact the order once removed vertices dominate.
+        if len(self.vertices) > 2 * len(self.positions) + 16:
+            self.vertices = list(self)
+            self.positions = dict((vertex, position)
+                                  for position, vertex
+                                  in enumerate(self.vertices))
+
+    def remove_arc(self, before, after):
+        """\
+Remove the arc from BEFORE to AFTER, if any.  The order stays valid.
+"""
+        followers = self.followers.get(before)
+        if followers is not None and after in followers:
+            followers.discard(after)
+            self.predecessors[after].discard(before)
+
+    def add_arc(self, before, after):
+        """\
+Add an arc from BEFORE to AFTER, adding these vertices as needed, and
+reorder the affected region.  Raise CycleError if the arc would close
+a cycle, in which case the arc is not added.
+"""
+        self.add_vertex(before)
+        self.add_vertex(after)
+        if after in self.followers[before]:
+            return
+        positions = self.positions
+        lower = positions[after]
+        upper = positions[before]
+        if before == after:
+            raise CycleError([before])
+        if lower < upper:
+            # The order is invalidated, explore the affected region.
+            forward = self.explore_forward(after, before, upper)
+            backward = self.explore_backward(before, lower)
+            self.reorder(backward, forward)
+        self.followers[before].add(after)
+        self.predecessors[after].add(before)
+
+    def explore_forward(self, start, goal, upper):
+        # Return vertices reachable from START without going past position
+        # UPPER.  Raise CycleError if GOAL is reachable.
+        positions = self.positions
+        followers = self.followers
+        parents = {start: None}
+        stack = [start]
+        while stack:
+            vertex = stack.pop()
+            for follower in followers[vertex]:
+                if follower == goal:
+                    cycle = [goal]
+                    while vertex is not None:
+                        cycle.append(vertex)
+                        vertex = parents[vertex]
+                    cycle.reverse()
+                    raise CycleError(cycle)
+                if follower not in parents and positions[follower] < upper:
+                    parents[follower] = vertex
+                    stack.append(follower)
+        return list(parents)
+
+    def explore_backward(self, start, lower):
+        # Return vertices reaching START without going before position LOWER.
+        positions = self.positions
+        predecessors = self.predecessors
+        seen = {start}
+        stack = [start]
+        while stack:
+            vertex = stack.pop()
+            for predecessor in predecessors[vertex]:
+                if predecessor not in seen and positions[predecessor] > lower:
+                    seen.add(predecessor)
+                    stack.append(predecessor)
+        return list(seen)
+
+    def reorder(self, backward, forward):
+        # Reuse the positions held by BACKWARD and FORWARD vertices, placing
+        # all BACKWARD ones first, each group keeping its relative order.
+        positions = self.positions
+        vertices = self.vertices
+        key = positions.__getitem__
+        backward.sort(key=key)
+        forward.sort(key=key)
+        moved = backward + forward
+        slots = sorted(map(key, moved))
+        for vertex, position in zip(moved, slots):
+            positions[vertex] = position
+            vertices[position] = vertex
+
+
+## Benchmarks.
+
+def random_arcs(vertex_count, arc_count, seed=0):
+    # Return ARC_COUNT random weighted arcs among VERTEX_COUNT vertices.
+    import random
+    generator = random.Random(seed)
+    randrange = generator.randrange
+    return [Arc(randrange(vertex_count), randrange(vertex_count),
+                randrange(1, 100))
+            for counter in range(arc_count)]
+
+
+def benchmark_path(vertex_count=20000, arc_count=100000, queries=20):
+    # Time path searches over a random sparse graph.
+    import random
+    import time
+    arcs = random_arcs(vertex_count, arc_count)
+    generator = random.Random(1)
+    pairs = [(generator.randrange(vertex_count),
+              generator.randrange(vertex_count))
+             for counter in range(queries)]
+    start = time.perf_counter()
+    graph = Graph(arcs)
+    graph.index()
+    print('Graph building for %d arcs: %.2f s'
+          % (arc_count, time.perf_counter() - start))
+    for function in path, path_bidirectional:
+        for container, title in (arcs, 'arcs'), (graph, 'Graph'):
+            start = time.perf_counter()
+            found = 0
+            for before, after in pairs:
+                if function(before, after, container) is not None:
+                    found += 1
+            print('%-20s %-5s %d vertices, %d arcs: %.2f ms per query,'
+                  ' %d/%d found'
+                  % (function.__name__, title, vertex_count, arc_count,
+                     (time.perf_counter() - start) * 1000 / queries,
+                     found, queries))
+
+
+def benchmark_sort(vertex_count=200000, arc_count=1000000):
+    # Time topological sorts over a random graph, then over an acyclic one.
+    import time
+    vertices = list(range(vertex_count))
+    cyclic = random_arcs(vertex_count, arc_count)
+    acyclic = [Arc(min(arc.before, arc.after), max(arc.before, arc.after))
+               for arc in cyclic if arc.before != arc.after]
+    for arcs, title in (cyclic, 'cyclic'), (acyclic, 'acyclic'):
+        for function in sort, sort2:
+            start = time.perf_counter()
+            function(vertices, arcs)
+            print('%-6s %-8s %d vertices, %d arcs: %.2f s'
+                  % (function.__name__, title, vertex_count, len(arcs),
+                     time.perf_counter() - start))
+
+
+def benchmark_order(vertex_count=100000, arc_count=50000, edits=20000,
+                    span=100):
+    # Time small edits to an incrementally maintained topological order,
+    # against one full sort.  Arcs join vertices at most SPAN apart, in
+    # either direction, mimicking the locality of build graphs.
+    import random
+    import time
+    generator = random.Random(2)
+    randrange = generator.randrange
+
+    def random_pair():
+        before = randrange(vertex_count - span)
+        after = before + randrange(1, span)
+        if randrange(2):
+            return after, before
+        return before, after
+
+    order = Order(range(vertex_count))
+    start = time.perf_counter()
+    refused = 0
+    for counter in range(arc_count):
+        try:
+            order.add_arc(*random_pair())
+        except CycleError:
+            refused += 1
+    print('Order building, %d arcs (%d refused): %.2f s'
+          % (arc_count, refused, time.perf_counter() - start))
+    start = time.perf_counter()
+    for counter in range(edits):
+        before, after = random_pair()
+        try:
+            order.add_arc(before, after)
+        except CycleError:
+            pass
+        else:
+            order.remove_arc(before, after)
+    print('Order editing: %.1f us per arc insertion and deletion'
+          % ((time.perf_counter() - start) * 1e6 / edits))
+    arcs = [Arc(before, after)
+            for before in order for after in order.followers[before]]
+    start = time.perf_counter()
+    sort(list(order), arcs)
+    print('Full sort, for comparison: %.1f ms'
+          % ((time.perf_counter() - start) * 1e3))
@@ -94,7 +94,7 @@ to watch!  From all times, sorting has always been a Great Art! :-)
 
 class Heap:
 
-    def __init__(self, compare=cmp):
+    def __init__(self, compare=None):
         """\
 Set a new heap.  If COMPARE is given, use it instead of built-in comparison.
 
@@ -102,6 +102,8 @@ COMPARE, given two items, should return negative, zero or positive depending
 on the fact the first item compares smaller, equal or greater than the
 second item.
 """
+        if compare is None:
+            compare = lambda a, b: (a > b) - (a < b)
         self.compare = compare
         self.array = []
 
@@ -132,7 +134,7 @@ Add ITEM to the current heap instance.
         array.append(item)
         high = len(array) - 1
         while high > 0:
-            low = (high - 1) / 2
+            low = (high - 1) // 2
             if compare(array[low], array[high]) <= 0:
                 break
             array[low], array[high] = array[high], array[low]
@@ -4,12 +4,30 @@
 
 """\
 Convert dates from some American formats to ISO format.
+
+Each Rule recognises one format.  An Application merges the patterns of
+all its rules into a single alternation, and rewrites a text in one pass,
+earlier rules having precedence over later ones for a same position.
+`normalize_stream' and `unposix_stream' rewrite a big file block by block,
+cutting blocks at line boundaries, as dates never span lines.
+
+`parse' returns the date found in a string, like a mail `Date:' header,
+as a (YEAR, MONTH, DAY, TIME, OFFSET) tuple.  TIME counts seconds since
+midnight and OFFSET minutes east of UTC, each is None when not given.
+`parse_many' and `epochs' do the same for a whole list of strings, with
+repeated strings only parsed once.
 """
 
+import array
+import calendar
+import functools
 import re
 
 
 class Rule:
+    # PATTERN is a regular expression string.  FORMAT receives the tuple of
+    # all groups in PATTERN, and returns the replacement text.  SEARCH and
+    # REPLACE offer the same rule on its own.
 
     which_month = {
         'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
@@ -35,6 +53,22 @@ class Rule:
     month = '|'.join(which_month)
     year = '[890][0-9]|19[789][0-9]|20[0-9][0-9]'
     day_time = '[0-2][0-9]:[0-5][0-9]:[0-5][0-9]|[0-2][0-9]:[0-5][0-9]'
+    zone_name = 'UT|GMT[-+][0-9][0-9]?|[A-Z][A-Z]T'
+    # Optional zone following a time, as recognised by the Zone rules.
+    # The time rules absorb it, as the Zone rules would have seen it only
+    # once the time got rewritten.
+    zone_suffix = '(?: (%s)| ([+-][01][0-9])([03]0))?' % zone_name
+    # Parsing is more lenient than rewriting: a day may have one digit,
+    # as in `5 Aug 2004', and a numeric zone may hold any HHMM value.
+    parse_month_day = '[ 0-3]?[0-9]'
+    parse_zone_suffix = ('(?: (%s)| ([+-][0-9][0-9])([0-5][0-9]))?'
+                         % zone_name)
+
+    def __init__(self):
+        self.search = re.compile(self.pattern).search
+
+    def replace(self, match):
+        return self.format(match.groups())
 
     def which_year(self, text):
         year = int(text)
@@ -44,124 +78,234 @@ class Rule:
             return 1900 + year
         return 2000 + year
 
+    def which_time(self, text):
+        # Return seconds since midnight for a HH:MM or HH:MM:SS TEXT.
+        if len(text) > 5:
+            return int(text[:2]) * 3600 + int(text[3:5]) * 60 + int(text[6:])
+        return int(text[:2]) * 3600 + int(text[3:5]) * 60
+
+    def which_offset(self, name, hours, minutes):
+        # Return minutes east of UTC for an optional zone, or None.
+        if name:
+            text = self.which_zone.get(name)
+            if text is None:
+                return None
+            hours, minutes = text[:3], text[4:]
+        elif not hours:
+            return None
+        offset = abs(int(hours)) * 60 + int(minutes)
+        if hours.startswith('-'):
+            return -offset
+        return offset
+
+    def format_zone(self, name, hours, minutes):
+        # Return the ISO rewriting of an optional zone, with its space.
+        if name:
+            return ' ' + self.which_zone.get(name, name)
+        if hours:
+            return ' %s:%s' % (hours, minutes)
+        return ''
+
 
 # Frequent cases.
 
 class Rule_Slashed(Rule):
-    def __init__(self):
-        self.search = re.compile(
-            '([01]?[0-9])\/([0-3]?[0-9])\/([890][0-9])').search
+    pattern = r'([01]?[0-9])/([0-3]?[0-9])/([890][0-9])'
 
-    def replace(self, match):
-        return '%d-%02d-%02d' % (self.which_year(match.group(3)),
-                                 int(match.group(1)),
-                                 int(match.group(2)))
+    def format(self, groups):
+        return '%d-%02d-%02d' % (self.which_year(groups[2]),
+                                 int(groups[0]),
+                                 int(groups[1]))
 
 
 class Rule_Email(Rule):
-    def __init__(self):
-        self.search = (re.compile(
-                '((%s), )?(%s) (%s) (%s)'
-                % (self.week_day, self.month_day, self.month, self.year))
-            .search)
+    template = '((%s), )?(%s) (%s) (%s)'
+    pattern = template % (Rule.week_day, Rule.month_day, Rule.month,
+                          Rule.year)
 
-    def replace(self, match):
-        return '%d-%02d-%02d' % (self.which_year(match.group(5)),
-                                 self.which_month[match.group(4)],
-                                 int(match.group(3)))
+    def format(self, groups):
+        return '%d-%02d-%02d' % (self.which_year(groups[4]),
+                                 self.which_month[groups[3]],
+                                 int(groups[2]))
+
+    def value(self, groups):
+        return (self.which_year(groups[4]), self.which_month[groups[3]],
+                int(groups[2]), None, None)
 
 
 class Rule_Other_1(Rule):
-    def __init__(self):
-        self.search = (re.compile(
-                '(%s) (%s) (%s) (%s)'
-                % (self.month, self.month_day, self.day_time, self.year))
-            .search)
+    pattern = ('(%s) (%s) (%s) (%s)%s'
+               % (Rule.month, Rule.month_day, Rule.day_time, Rule.year,
+                  Rule.zone_suffix))
 
-    def replace(self, match):
-        return '%d-%02d-%02d %s' % (self.which_year(match.group(4)),
-                                    self.which_month[match.group(1)],
-                                    int(match.group(2)),
-                                    match.group(3))
+    def format(self, groups):
+        return '%d-%02d-%02d %s%s' % (self.which_year(groups[3]),
+                                      self.which_month[groups[0]],
+                                      int(groups[1]),
+                                      groups[2],
+                                      self.format_zone(*groups[4:7]))
+
+    def value(self, groups):
+        return (self.which_year(groups[3]), self.which_month[groups[0]],
+                int(groups[1]), self.which_time(groups[2]),
+                self.which_offset(*groups[4:7]))
 
 
 class Rule_Other_2(Rule):
-    def __init__(self):
-        self.search = (re.compile(
-                '(%s) (%s) (%s)'
-                % (self.month, self.month_day, self.day_time))
-            .search)
+    pattern = ('(%s) (%s) (%s)%s'
+               % (Rule.month, Rule.month_day, Rule.day_time,
+                  Rule.zone_suffix))
 
-    def replace(self, match):
-        return '%02d-%02d %s' % (self.which_month[match.group(1)],
-                                 int(match.group(2)),
-                                 match.group(3))
+    def format(self, groups):
+        return '%02d-%02d %s%s' % (self.which_month[groups[0]],
+                                   int(groups[1]),
+                                   groups[2],
+                                   self.format_zone(*groups[3:6]))
 
 
 class Rule_Zone_1(Rule):
-    def __init__(self):
-        self.search = re.compile(
-            '(%s) (UT|GMT[-+][0-9][0-9]?|[A-Z][A-Z]T)' % self.day_time).search
+    pattern = '(%s) (%s)' % (Rule.day_time, Rule.zone_name)
 
-    def replace(self, match):
-        return '%s %s' % (match.group(1), self.which_zone(match.group(2)))
+    def format(self, groups):
+        return groups[0] + self.format_zone(groups[1], None, None)
+
+    def value(self, groups):
+        return (None, None, None, self.which_time(groups[0]),
+                self.which_offset(groups[1], None, None))
 
 
 class Rule_Zone_2(Rule):
-    def __init__(self):
-        self.search = re.compile(
-            '(%s) ([+-][01][0-9])([03]0)' % self.day_time).search
+    pattern = '(%s) ([+-][01][0-9])([03]0)' % Rule.day_time
 
-    def replace(self, match):
-        return '%s %s:%s' % match.group(1, 2, 3)
+    def format(self, groups):
+        return '%s %s:%s' % groups
+
+    def value(self, groups):
+        return (None, None, None, self.which_time(groups[0]),
+                self.which_offset(None, groups[1], groups[2]))
+
+
+class Rule_Email_Date(Rule_Email):
+    # Only used for parsing: a mail date, the day may have one digit.
+    pattern = Rule_Email.template % (Rule.week_day, Rule.parse_month_day,
+                                     Rule.month, Rule.year)
+
+
+class Rule_Email_Time(Rule):
+    # Only used for parsing: a whole mail date, with its time and zone.
+    pattern = ('%s (%s)%s' % (Rule_Email_Date.pattern, Rule.day_time,
+                              Rule.parse_zone_suffix))
+
+    def value(self, groups):
+        return (self.which_year(groups[4]), self.which_month[groups[3]],
+                int(groups[2]), self.which_time(groups[5]),
+                self.which_offset(*groups[6:9]))
+
+
+class Rule_Other_Time(Rule_Other_1):
+    # Only used for parsing: as `Rule_Other_1', with any numeric zone.
+    pattern = ('(%s) (%s) (%s) (%s)%s'
+               % (Rule.month, Rule.month_day, Rule.day_time, Rule.year,
+                  Rule.parse_zone_suffix))
+
+
+class Rule_Time(Rule):
+    # Only used for parsing, for a time which may lack a zone.
+    pattern = '(%s)%s' % (Rule.day_time, Rule.parse_zone_suffix)
+
+    def value(self, groups):
+        return (None, None, None, self.which_time(groups[0]),
+                self.which_offset(*groups[1:4]))
 
 
 # POSIX horrors, as in `ls' and `pax'.  Just drop the time.
 
 class Rule_Posix_1(Rule):
+    pattern = '(%s) (%s) (%s)' % (Rule.month, Rule.month_day, Rule.day_time)
+
     def __init__(self):
         import time
         self.current_year = time.localtime(time.time())[0]
-        self.search = (re.compile(
-                '(%s) (%s) (%s)'
-                % (self.month, self.month_day, self.day_time))
-            .search)
+        Rule.__init__(self)
 
-    def replace(self, match):
+    def format(self, groups):
         return '%d-%02d-%02d ' % (self.current_year,
-                                  self.which_month[match.group(1)],
-                                  int(match.group(2)))
+                                  self.which_month[groups[0]],
+                                  int(groups[1]))
+
+    def value(self, groups):
+        return (self.current_year, self.which_month[groups[0]],
+                int(groups[1]), self.which_time(groups[2]), None)
 
 
 class Rule_Posix_2(Rule):
-    def __init__(self):
-        self.search = (re.compile(
-                '(%s) (%s)  (%s)'
-                % (self.month, self.month_day, self.year))
-            .search)
+    pattern = '(%s) (%s)  (%s)' % (Rule.month, Rule.month_day, Rule.year)
 
-    def replace(self, match):
-        return '%d-%02d-%02d ' % (int(match.group(3)),
-                                  self.which_month[match.group(1)],
-                                  int(match.group(2)))
+    def format(self, groups):
+        return '%d-%02d-%02d ' % (int(groups[2]),
+                                  self.which_month[groups[0]],
+                                  int(groups[1]))
+
+    def value(self, groups):
+        return (int(groups[2]), self.which_month[groups[0]], int(groups[1]),
+                None, None)
 
 
 # Do it all.
 
 class Application:
+    # RULES, set by the subclass, are listed by decreasing precedence.
+    # METHOD names the rule method called for each match.
+    method = 'format'
+    # Every rule pattern starts with one of these characters.  Checking it
+    # first spares trying all alternatives at most positions of a text.
+    start = '[ 0-9A-Z]'
+
+    def __init__(self):
+        fragments = []
+        self.dispatch = {}
+        group = 0
+        for counter, rule in enumerate(self.rules):
+            name = 'rule%d' % counter
+            count = re.compile(rule.pattern).groups
+            fragments.append('(?P<%s>%s)' % (name, rule.pattern))
+            self.dispatch[name] = (
+                getattr(rule, self.method),
+                tuple(range(group + 2, group + 2 + count)))
+            group += 1 + count
+        self.regexp = re.compile('(?=%s)(?:%s)'
+                                 % (self.start, '|'.join(fragments)))
+        self.sub = self.regexp.sub
 
     def transform(self, text):
-        for rule in self.rules:
-            fragments = []
-            match = rule.search(text)
-            while match:
-                fragments.append(text[:match.start()])
-                fragments.append(rule.replace(match))
-                text = text[match.end():]
-                match = rule.search(text)
-            fragments.append(text)
-            text = ''.join(fragments)
-        return text
+        return self.sub(self.replace, text)
+
+    def replace(self, match):
+        # The named group for the whole rule closes last, so it names the
+        # rule which matched.
+        format, indices = self.dispatch[match.lastgroup]
+        return format(match.group(*indices))
+
+    def transform_stream(self, input, size=1 << 20):
+        """\
+Read INPUT, a text file, by blocks of about SIZE characters, and generate
+the transformed text, block by block.  Blocks are cut after a newline,
+so memory stays bounded by SIZE and the longest line.
+"""
+        transform = self.transform
+        remainder = ''
+        while True:
+            block = input.read(size)
+            if not block:
+                break
+            cut = block.rfind('\n') + 1
+            if cut == 0:
+                remainder += block
+                continue
+            yield transform(remainder + block[:cut])
+            remainder = block[cut:]
+        if remainder:
+            yield transform(remainder)
 
 
 class Normalize(Application):
@@ -169,13 +313,84 @@ class Normalize(Application):
         self.rules = (Rule_Slashed(), Rule_Email(),
                       Rule_Other_1(), Rule_Other_2(),
                       Rule_Zone_1(), Rule_Zone_2())
+        Application.__init__(self)
 
 
 class Unposix(Application):
     def __init__(self):
         self.rules = Rule_Posix_1(), Rule_Posix_2()
+        Application.__init__(self)
+
+
+class Parse(Application):
+    method = 'value'
+
+    def __init__(self):
+        self.rules = (Rule_Email_Time(), Rule_Email_Date(),
+                      Rule_Other_Time(),
+                      Rule_Posix_2(),
+                      Rule_Posix_1(), Rule_Zone_1(), Rule_Zone_2(),
+                      Rule_Time())
+        Application.__init__(self)
+
+    def parse(self, text):
+        """\
+Return (YEAR, MONTH, DAY, TIME, OFFSET) for the date within TEXT, or None
+if no date is found.  Successive matches fill the fields still missing,
+so a date and a following time with its zone may come from two rules.
+"""
+        dispatch = self.dispatch
+        result = None
+        for match in self.regexp.finditer(text):
+            value, indices = dispatch[match.lastgroup]
+            value = value(match.group(*indices))
+            if result is None:
+                result = value
+            else:
+                result = tuple([old if old is not None else new
+                                for old, new in zip(result, value)])
+            if None not in result:
+                break
+        if result is None or result[0] is None:
+            return None
+        return result
+
+    def epoch(self, text):
+        """\
+Return the POSIX time for the date within TEXT, or NaN if none is found.
+A missing time means midnight, a missing zone means UTC.
+"""
+        result = self.parse(text)
+        if result is None:
+            return float('nan')
+        year, month, day, time, offset = result
+        return (calendar.timegm((year, month, day, 0, 0, 0))
+                + (time or 0) - (offset or 0) * 60)
+
+    def parse_many(self, texts, cache_size=1 << 16):
+        """\
+Return the list of parse results for all TEXTS.  Up to CACHE_SIZE
+recently seen distinct strings are remembered, so repeated ones are
+parsed only once.
+"""
+        parse = functools.lru_cache(maxsize=cache_size)(self.parse)
+        return list(map(parse, texts))
+
+    def epochs(self, texts, cache_size=1 << 16):
+        """\
+Return an array of doubles holding the POSIX time of all TEXTS, NaN
+where no date is found.  CACHE_SIZE is as for `parse_many'.
+"""
+        epoch = functools.lru_cache(maxsize=cache_size)(self.epoch)
+        return array.array('d', map(epoch, texts))
 
 
 # External API.
 normalize = Normalize().transform
+normalize_stream = Normalize().transform_stream
 unposix = Unposix().transform
+unposix_stream = Unposix().transform_stream
+parser = Parse()
+parse = parser.parse
+parse_many = parser.parse_many
+epochs = parser.epochs
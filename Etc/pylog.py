@@ -4,14 +4,38 @@
 # REVOIR: Détecter que plusieurs journaux sont dirigés dans un seul
 # et même fichier, et fusionner correctement dans ce cas.
 
-import sys
+import atexit
 import collections
+import functools
+import io
+import os
+import sys
+import threading
+import time
+import weakref
 
 
 class Error(Exception):
     pass
 
 
+class Lazy(functools.partial):
+    """\
+Argument of a log call which is only computed, as FUNCTION(*ARGS), when
+the message actually gets formatted.  A disabled log call, or a message
+dropped by its consumer, never calls FUNCTION.
+"""
+    # Dériver de `functools.partial' garde la construction en C: un appel
+    # coupé ne paie presque rien pour ses arguments paresseux.
+    __slots__ = ()
+
+    def __str__(self):
+        return str(self())
+
+    def __repr__(self):
+        return repr(self())
+
+
 class Message_X(object):
 
     def __init__(self, keywords, args):
@@ -39,13 +63,28 @@ class Message_X(object):
 
 
 class Producer(object):
+    """Log producer for a tuple of KEYWORDS; calling it logs its arguments.
+
+A disabled producer returns at once, without building any Message, but
+the call itself still costs what CPython needs to call an instance and
+pack its arguments: about 160 to 390 ns per call, as measured by
+`python3 -m benchmarks -k pylog'.  In a hot loop, guard the call with
+`if log.enabled: log(...)', which brings a disabled call down to about
+one attribute test, some 30 ns.  Processors of a Logger behave alike.
+"""
     Message = Message_X
     keywords2consumer = {}
+    # Faux pour un préfixe de mots-clés dont la journalisation est coupée.
+    keywords2enabled = {}
 
     def __init__(self, keywords):
         if isinstance(keywords, str):
             keywords = tuple(keywords.split('.'))
         self.keywords = keywords
+        # Le consommateur est mémorisé, et ENABLED dit s'il existe.  Dans
+        # une boucle critique, `if log.enabled: log(...)' évite même l'appel.
+        self._resolve()
+        resolvers.add(self)
 
     def __repr__(self):
         return '<py.log.Producer %s>' % ':'.join(self.keywords)
@@ -58,10 +97,18 @@ class Producer(object):
         return producer
 
     def __call__(self, *args):
-        func = self.get_consumer(self.keywords)
+        # Un appel pour un producteur coupé ne construit aucun Message.
+        func = self._consumer
         if func is not None:
             func(self.Message(self.keywords, args))
 
+    def _resolve(self):
+        if isenabled(self.keywords):
+            self._consumer = self.get_consumer(self.keywords)
+        else:
+            self._consumer = None
+        self.enabled = self._consumer is not None
+
     def get_consumer(self, keywords):
         for i in range(len(self.keywords), 0, -1):
             try:
@@ -72,8 +119,39 @@ class Producer(object):
 
     def set_consumer(self, consumer):
         self.keywords2consumer[self.keywords] = consumer
+        invalidate()
+
+# Producteurs et processeurs vivants, qui mémorisent leur consommateur.
+resolvers = weakref.WeakSet()
+
+
+def invalidate():
+    # À appeler après toute modification directe de KEYWORDS2CONSUMER ou de
+    # KEYWORDS2ENABLED.
+    for resolver in list(resolvers):
+        resolver._resolve()
 
-default = Producer('default')
+
+def isenabled(keywords):
+    table = Producer.keywords2enabled
+    for i in range(len(keywords), 0, -1):
+        try:
+            return table[keywords[:i]]
+        except KeyError:
+            continue
+    return True
+
+
+def enable(keywords):
+    Producer.keywords2enabled[_keywords(keywords)] = True
+    invalidate()
+
+
+def disable(keywords):
+    # Couper la journalisation pour KEYWORDS et tous ses sous-mots-clés,
+    # à moins qu'un sous-mot-clé ne soit explicitement réactivé.
+    Producer.keywords2enabled[_keywords(keywords)] = False
+    invalidate()
 
 
 def _getstate():
@@ -83,6 +161,7 @@ def _getstate():
 def _setstate(state):
     Producer.keywords2consumer.clear()
     Producer.keywords2consumer.update(state)
+    invalidate()
 
 
 def default_consumer(msg):
@@ -90,6 +169,8 @@ def default_consumer(msg):
 
 Producer.keywords2consumer['default'] = default_consumer
 
+default = Producer('default')
+
 ### Adapté à partir de codespeak/log/consumer.py
 ### ============================================
 
@@ -98,12 +179,19 @@ class File(object):
 
     def __init__(self, f):
         assert hasattr(f, 'write')
-        assert isinstance(f, file) or not hasattr(f, 'open')
+        assert isinstance(f, io.IOBase) or not hasattr(f, 'open')
         self._file = f
 
     def __call__(self, msg):
         self._file.write(str(msg) + '\n')
 
+    def write(self, text):
+        self._file.write(text)
+
+    def flush(self):
+        if hasattr(self._file, 'flush'):
+            self._file.flush()
+
 
 class Path(object):
 
@@ -116,15 +204,207 @@ class Path(object):
             self._openfile()
 
     def _openfile(self):
-        self._file = file(self._filename,
+        self._file = open(self._filename,
                           'a' if self._append else 'w',
-                          #buffering=self._buffering,
-                          )
+                          buffering=self._buffering)
 
     def __call__(self, msg):
+        self.write(str(msg) + '\n')
+
+    def write(self, text):
         if not hasattr(self, '_file'):
             self._openfile()
-        self._file.write(str(msg) + '\n')
+        self._file.write(text)
+
+    def flush(self):
+        if hasattr(self, '_file'):
+            self._file.flush()
+
+    def close(self):
+        if hasattr(self, '_file'):
+            self._file.close()
+            del self._file
+
+
+class Rotating(Path):
+    """\
+Write to FILENAME, like Path, but rotate the file once it would grow over
+MAX_BYTES characters, or once it has been opened for INTERVAL seconds.
+On rotation, FILENAME is renamed FILENAME.1, the previous FILENAME.1 is
+renamed FILENAME.2, and so on, keeping at most BACKUPS old files.
+"""
+
+    def __init__(self, filename, max_bytes=None, interval=None, backups=5,
+                 append=False, delayed_create=False, buffering=1):
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backups = backups
+        Path.__init__(self, filename, append, delayed_create, buffering)
+
+    def _openfile(self):
+        Path._openfile(self)
+        self._size = self._file.tell()
+        if self.interval is None:
+            self._deadline = None
+        else:
+            self._deadline = time.time() + self.interval
+
+    def write(self, text):
+        if not hasattr(self, '_file'):
+            self._openfile()
+        elif ((self.max_bytes is not None and self._size > 0
+               and self._size + len(text) > self.max_bytes)
+              or (self._deadline is not None
+                  and time.time() >= self._deadline)):
+            self.rotate()
+        self._file.write(text)
+        self._size += len(text)
+
+    def rotate(self):
+        self.close()
+        name = self._filename
+        if self.backups > 0:
+            for counter in range(self.backups - 1, 0, -1):
+                old = '%s.%d' % (name, counter)
+                if os.path.exists(old):
+                    os.replace(old, '%s.%d' % (name, counter + 1))
+            if os.path.exists(name):
+                os.replace(name, name + '.1')
+        elif os.path.exists(name):
+            os.remove(name)
+        self._openfile()
+
+
+class Queued(object):
+    """\
+Consumer formatting and writing messages on a background thread.
+
+Calling the consumer merely appends the message to a queue.  A thread
+wakes up every INTERVAL seconds, or as soon as BATCH messages are waiting,
+then formats the waiting messages and writes them to DESTINATION in
+batches of at most BATCH messages, each batch with a single write.
+DESTINATION is a file name, opened through Path, or any object having a
+`write' method, like an open file, a File, a Path or a Rotating consumer.
+
+At most MAXIMUM messages wait in the queue.  When the queue is full,
+OVERFLOW tells what to do: 'block' makes the caller wait for room,
+'drop-new' discards the new message and 'drop-old' discards the oldest
+waiting message.  DROPPED counts discarded messages.  Messages are
+formatted late, so their arguments should not be modified after the call.
+
+A batch which cannot be formatted or written, say because a message
+`__str__' fails or the disk is full, is reported on standard error and
+counted in FAILED, and the thread goes on with the next batch.  Should
+the thread die anyway, messages are written on the caller's thread.
+"""
+
+    def __init__(self, destination, maximum=10000, batch=500, interval=0.1,
+                 overflow='block'):
+        if overflow not in ('block', 'drop-new', 'drop-old'):
+            raise ValueError("Invalid overflow policy %r" % (overflow,))
+        if isinstance(destination, str):
+            destination = Path(destination)
+        self.destination = destination
+        self.maximum = maximum
+        self.batch = batch
+        self.interval = interval
+        self.overflow = overflow
+        self.dropped = 0
+        self.failed = 0
+        if overflow == 'drop-old':
+            self._queue = collections.deque(maxlen=maximum)
+        else:
+            self._queue = collections.deque()
+        self._closed = False
+        self._wakeup = threading.Event()
+        self._room = threading.Condition()
+        self._writing = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='pylog.Queued')
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __call__(self, msg):
+        if self._closed or not self._thread.is_alive():
+            # Plus de fil d'écriture: écrire ici, après ce qui attend.
+            self.flush()
+            self._write([msg])
+            return
+        queue = self._queue
+        if len(queue) >= self.maximum:
+            if self.overflow == 'block':
+                with self._room:
+                    while (len(queue) >= self.maximum and not self._closed
+                           and self._thread.is_alive()):
+                        self._wakeup.set()
+                        self._room.wait(self.interval)
+            else:
+                self.dropped += 1
+                if self.overflow == 'drop-new':
+                    return
+        queue.append(msg)
+        if not self._thread.is_alive():
+            self.flush()
+        elif len(queue) >= self.batch:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                self._report(0)
+
+    def flush(self):
+        # Écrire tout ce qui est en attente, puis vider le tampon de la
+        # destination.  Peut aussi être appelé par le producteur.
+        queue = self._queue
+        popleft = queue.popleft
+        with self._writing:
+            while queue:
+                msgs = []
+                try:
+                    for counter in range(self.batch):
+                        msgs.append(popleft())
+                except IndexError:
+                    pass
+                try:
+                    self._write(msgs)
+                except Exception:
+                    self._report(len(msgs))
+                if self.overflow == 'block':
+                    with self._room:
+                        self._room.notify_all()
+            if hasattr(self.destination, 'flush'):
+                try:
+                    self.destination.flush()
+                except Exception:
+                    self._report(0)
+
+    def _write(self, msgs):
+        self.destination.write(''.join([str(msg) + '\n' for msg in msgs]))
+
+    def _report(self, count):
+        # Signaler l'exception courante, qui a fait perdre COUNT messages.
+        self.failed += count
+        if sys.stderr is not None:
+            import traceback
+            sys.stderr.write("pylog.Queued: %d message(s) lost.\n" % count)
+            traceback.print_exc(file=sys.stderr)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        with self._room:
+            self._room.notify_all()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+        atexit.unregister(self.close)
 
 
 def STDOUT(msg):
@@ -140,14 +420,19 @@ def ERROR(msg):
     raise Error(str(msg) + '\n')
 
 
-def setconsumer(keywords, consumer):
+def _keywords(keywords):
     if isinstance(keywords, str):
-        keywords = tuple(list(keywords.split('.')))
-    elif hasattr(keywords, 'keywords'):
-        keywords = keywords.keywords
-    elif not isinstance(keywords, tuple):
+        return tuple(keywords.split('.'))
+    if hasattr(keywords, 'keywords'):
+        return keywords.keywords
+    if not isinstance(keywords, tuple):
         raise TypeError("key %r is not a string or tuple" % (keywords,))
-    if consumer is not None and not isinstance(consumer, collections.Callable):
+    return keywords
+
+
+def setconsumer(keywords, consumer):
+    keywords = _keywords(keywords)
+    if consumer is not None and not callable(consumer):
         if not hasattr(consumer, 'write'):
             raise TypeError("%r should be None, callable or file-like"
                             % (consumer,))
@@ -174,6 +459,8 @@ class Message(object):
     def __unicode__(self):
         return self.strprefix() + self.strcontent()
 
+    __str__ = __unicode__
+
 
 class Processor(object):
 
@@ -181,19 +468,28 @@ class Processor(object):
         self.logger = logger
         self.name = name
         self.consume = consume
+        self._resolve()
+        resolvers.add(self)
 
     def __call__(self, *args):
-        try:
-            consume = self.logger._override
-        except AttributeError:
-            consume = self.consume
+        consume = self._consume
         if consume is not None:
-            msg = Message(self, *args)
-            consume(msg)
+            consume(Message(self, *args))
+
+    def _resolve(self):
+        if isenabled((self.logger._ident, self.name)):
+            consume = self.logger._override
+            if consume is None:
+                consume = self.consume
+            self._consume = consume
+        else:
+            self._consume = None
+        self.enabled = self._consume is not None
 
 
 class Logger(object):
     _key2logger = {}
+    _override = None
 
     def __init__(self, ident):
         self._ident = ident
@@ -211,12 +507,11 @@ class Logger(object):
 
     def set_override(self, consumer):
         self._override = lambda msg: consumer(msg)
+        invalidate()
 
     def del_override(self):
-        try:
-            del self._override
-        except AttributeError:
-            pass
+        self._override = None
+        invalidate()
 
     def _setsub(self, name, dest):
         assert '_' not in name
@@ -8,11 +8,19 @@ Vérifier et critiquer les fichiers et sources Python présents.
 pypoux [OPTION]... [ARGUMENT]...
 
 Options:
-  -h   Fournir cette aide, et ne rien faire d'autre.
-  -v   Imprimer une ligne pour chaque vérification.
+  -h           Fournir cette aide, et ne rien faire d'autre.
+  -v           Imprimer une ligne pour chaque vérification.
+  -j NOMBRE    Répartir les fichiers sur NOMBRE processus (défaut: un par
+               processeur).
+  -c FICHIER   Garder les résultats dans FICHIER (défaut: .pypoux.cache).
+  -C           Ne pas utiliser de cache, tout vérifier à nouveau.
 
 Les ARGUMENTs sont ignorés.  Le programme examine les fichiers du
 répertoire courant, ainsi que tous ses sous-répertoires, récursivement.
+Chaque fichier est lu une seule fois pour toutes ses vérifications.  Un
+fichier dont la date de modification et la taille n'ont pas changé depuis
+l'exécution précédente n'est pas vérifié à nouveau: ses diagnostics sont
+repris du cache.
 """
 
 # Ce module vérifie et critique tous les sources Python dans la
@@ -26,71 +34,185 @@ répertoire courant, ainsi que tous ses sous-répertoires, récursivement.
 import os
 import sys
 
+# Changer ce numéro chaque fois que les vérifications changent, pour que
+# les résultats déjà en cache soient ignorés.
+version = 2
+
 
 class Main:
     volubile = False
+    processus = None
+    cache = '.pypoux.cache'
 
     def main(self, *arguments):
         import getopt
-        options, arguments = getopt.getopt(arguments, 'hv')
+        options, arguments = getopt.getopt(arguments, 'Cc:hj:v')
         for option, value in options:
-            if option == '-h':
+            if option == '-C':
+                self.cache = None
+            elif option == '-c':
+                self.cache = value
+            elif option == '-h':
                 sys.stdout.write(__doc__)
                 return
+            elif option == '-j':
+                self.processus = int(value)
             elif option == '-v':
                 self.volubile = True
-        setup_module(None)
         write = sys.stderr.write
         courant = None
-        for compteur, arguments in enumerate(Test_Poux().test_chacun()):
-            test, fichier = arguments
-            if self.volubile:
-                if fichier.startswith('./'):
-                    fichier = fichier[2:]
-                if fichier != courant:
-                    courant = marge = fichier
-                write('%d. %s %s\n'
-                      % (compteur + 1, marge, test.__func__.__name__))
-                marge = ' ' * len(marge)
-            try:
-                test(fichier)
-            except AssertionError:
-                pass
-        teardown_module(None)
+        compteur = 0
+        # Les diagnostics nomment les fichiers sans le `./' initial.
+        fichiers = [fichier[2:] if fichier.startswith('./') else fichier
+                    for fichier in Test_Poux().chaque_fichier()]
+        for fichier, resultats in verifier_tout(fichiers, self.processus,
+                                                self.cache):
+            for nom, texte in resultats:
+                compteur += 1
+                if self.volubile:
+                    if fichier != courant:
+                        courant = marge = fichier
+                    write('%d. %s %s\n' % (compteur, marge, nom))
+                    marge = ' ' * len(marge)
+                sys.stdout.write(texte)
 
 run = Main()
 main = run.main
 
 
-def setup_module(module):
-    import tempfile
-    run.repertoire = tempfile.mkdtemp()
-
-
-def teardown_module(module):
-    import shutil
-    shutil.rmtree(run.repertoire)
+def verifier_tout(fichiers, processus=None, cache=None):
+    """\
+Vérifier chacun des FICHIERS et produire, dans le même ordre, les paires
+(FICHIER, RÉSULTATS), où RÉSULTATS est ce que retourne `verifier_fichier'.
+Les fichiers à vérifier sont répartis sur PROCESSUS processus, un par
+processeur si None.  CACHE, s'il n'est pas None, nomme le fichier gardant
+les résultats d'une exécution à l'autre.
+"""
+    if cache is not None:
+        cache = Cache(cache)
+    # Séparer les fichiers déjà connus de ceux à vérifier.
+    fichiers = list(fichiers)
+    etats = []
+    a_verifier = []
+    for fichier in fichiers:
+        statut = os.stat(fichier)
+        etat = statut.st_mtime_ns, statut.st_size, version
+        etats.append(etat)
+        if cache is None or cache.chercher(fichier, etat) is None:
+            a_verifier.append(fichier)
+    # Vérifier les autres, en parallèle s'il y a lieu.
+    if processus is None:
+        processus = os.cpu_count() or 1
+    processus = min(processus, len(a_verifier))
+    if processus > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(processus)
+        nouveaux = pool.imap(verifier_fichier, a_verifier, chunksize=8)
+    else:
+        pool = None
+        nouveaux = map(verifier_fichier, a_verifier)
+    try:
+        for fichier, etat in zip(fichiers, etats):
+            resultats = None
+            if cache is not None:
+                resultats = cache.chercher(fichier, etat)
+            if resultats is None:
+                resultats = next(nouveaux)
+                if cache is not None:
+                    cache.noter(fichier, etat, resultats)
+            yield fichier, resultats
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if cache is not None:
+            cache.sauver(fichiers)
+
+
+def verifier_fichier(fichier):
+    """\
+Vérifier FICHIER, lu une seule fois pour toutes les vérifications, et
+retourner une liste de paires (NOM, TEXTE), une par vérification, où TEXTE
+est ce que la vérification NOM a imprimé.
+"""
+    poux = Test_Poux()
+    resultats = []
+    for test in poux.tests(fichier):
+        sortie = []
+        poux.ecrire = sortie.append
+        try:
+            test(fichier)
+        except AssertionError:
+            pass
+        resultats.append((test.__func__.__name__, ''.join(sortie)))
+    return resultats
+
+
+class Cache:
+    # Résultats des exécutions précédentes.  ENTREES associe à chaque nom
+    # de fichier une paire (ÉTAT, RÉSULTATS), où ÉTAT est un triplet donnant
+    # la date de modification, la taille et la `version' des vérifications.
+
+    def __init__(self, nom):
+        import pickle
+        self.nom = nom
+        self.modifie = False
+        try:
+            with open(nom, 'rb') as entree:
+                self.entrees = pickle.load(entree)
+        except Exception:
+            # Un cache illisible, quelle qu'en soit la raison, est vide.
+            self.entrees = {}
+
+    def chercher(self, fichier, etat):
+        # Retourner les résultats connus pour FICHIER, ou None.
+        entree = self.entrees.get(fichier)
+        if entree is not None and entree[0] == etat:
+            return entree[1]
+
+    def noter(self, fichier, etat, resultats):
+        self.entrees[fichier] = etat, resultats
+        self.modifie = True
+
+    def sauver(self, fichiers):
+        # Oublier les fichiers disparus, puis réécrire le cache au besoin.
+        import pickle
+        fichiers = set(fichiers)
+        for fichier in list(self.entrees):
+            if fichier not in fichiers:
+                del self.entrees[fichier]
+                self.modifie = True
+        if self.modifie:
+            temporaire = '%s.%d' % (self.nom, os.getpid())
+            with open(temporaire, 'wb') as sortie:
+                pickle.dump(self.entrees, sortie, -1)
+            os.replace(temporaire, self.nom)
+            self.modifie = False
 
 
 class Test_Poux:
     fichier = None
+    octets = None
     tampon = None
 
     def test_chacun(self):
         for fichier in self.chaque_fichier():
-            if not peut_avoir_tabs(fichier):
-                yield self.verifier_tabs, fichier
-            yield self.ligne_blanche_debut, fichier
-            yield self.ligne_blanche_fin, fichier
-            yield self.blancs_suffixes, fichier
-            yield self.double_ligne_blanche, fichier
-            yield self.commentaire_vide, fichier
-            if est_python(fichier):
-                yield self.ligne_blanche_manquante, fichier
-                yield self.coding_manquant, fichier
-                yield self.metaclasse_manquant, fichier
-                yield self.chaines_unicode, fichier
-                yield self.verifier_syntaxe, fichier
+            for test in self.tests(fichier):
+                yield test, fichier
+
+    def tests(self, fichier):
+        # Retourner les vérifications à faire sur FICHIER.
+        self.garantir_tampon(fichier)
+        tests = []
+        if not peut_avoir_tabs(fichier):
+            tests.append(self.verifier_tabs)
+        tests += [self.ligne_blanche_debut, self.ligne_blanche_fin,
+                  self.blancs_suffixes, self.double_ligne_blanche,
+                  self.commentaire_vide]
+        if est_python(fichier, self.tampon):
+            tests += [self.ligne_blanche_manquante, self.coding_manquant,
+                      self.metaclasse_manquant, self.chaines_unicode,
+                      self.verifier_syntaxe]
+        return tests
 
     ## Espace blanc.
 
@@ -180,15 +302,6 @@ class Test_Poux:
         from io import StringIO
         erreur = None
         self.garantir_tampon(fichier)
-        # Noter la position de chaque ligne.
-        self.lignes = [0, 0]
-        position = 0
-        while True:
-            position = self.tampon.find('\n', position) + 1
-            if not position:
-                break
-            self.lignes.append(position)
-        self.lignes.append(len(self.tampon))
         # Analyser le source Python.
         self.position = 0
         chaine_vide = None
@@ -228,18 +341,13 @@ class Test_Poux:
         assert erreur is None, erreur
 
     def verifier_syntaxe(self, fichier):
-        pyc = os.path.basename(fichier)
-        if pyc.endswith('.py'):
-            pyc += 'c'
-        else:
-            pyc += '.pyc'
+        # Compiler le contenu brut déjà lu, sans rien écrire sur disque.
         import py_compile
         try:
-            py_compile.compile(fichier.encode('UTF-8'),
-                               os.path.join(run.repertoire, pyc),
-                               doraise=True)
-        except py_compile.PyCompileError as exception:
-            sys.stdout.write(str(exception))
+            compile(self.octets, fichier, 'exec', dont_inherit=True)
+        except (SyntaxError, ValueError) as exception:
+            self.ecrire(str(py_compile.PyCompileError(
+                exception.__class__, exception, fichier)))
             assert False
 
     ## Services.
@@ -261,21 +369,44 @@ class Test_Poux:
                         yield fichier
 
     def garantir_tampon(self, fichier):
+        # Lire FICHIER, s'il n'est pas déjà lu, et noter la position de
+        # chaque ligne: LIGNES[N] est la position de la ligne N, LIGNES[0]
+        # et la dernière entrée étant là pour `tokenize'.
         if fichier != self.fichier:
             self.fichier = fichier
-            self.tampon = file(fichier).read()
+            # OCTETS garde le contenu brut, pour que `verifier_syntaxe'
+            # respecte le biscuit coding et signale les octets invalides.
+            with open(fichier, 'rb') as entree:
+                self.octets = entree.read()
+            self.tampon = self.octets.decode('UTF-8', 'replace')
+            self.lignes = [0, 0]
+            position = 0
+            while True:
+                position = self.tampon.find('\n', position) + 1
+                if not position:
+                    break
+                self.lignes.append(position)
+            self.lignes.append(len(self.tampon))
 
     def rapporter(self, diagnostic):
-        ligne = self.tampon[:self.position].count('\n') + 1
-        position = self.tampon.rfind('\n', 0, self.position)
-        if position < 0:
-            colonne = self.position + 1
-        else:
-            colonne = self.position - position
-        sys.stdout.write('%s:%d:%d: %s\n'
-                         % (self.fichier, ligne, colonne, diagnostic))
+        import bisect
+        ligne = bisect.bisect_right(self.lignes, self.position, 1) - 1
+        if ligne >= len(self.lignes) - 1:
+            ligne = len(self.lignes) - 2
+        colonne = self.position - self.lignes[ligne] + 1
+        self.ecrire('%s:%d:%d: %s\n'
+                    % (self.fichier, ligne, colonne, diagnostic))
         return diagnostic
 
+    def ecrire(self, texte):
+        sys.stdout.write(texte)
+
+
+def lire(fichier):
+    # Retourner le contenu de FICHIER, fins de ligne intactes.
+    return open(fichier, encoding='UTF-8', errors='replace',
+                newline='').read()
+
 
 def est_fichier_acceptable(base):
     if base in ('tags', 'TAGS'):
@@ -318,10 +449,12 @@ def peut_avoir_tabs(fichier):
     return False
 
 
-def est_python(fichier):
+def est_python(fichier, tampon=None):
     if fichier.endswith('.py'):
         return True
-    ligne = file(fichier).readline()
+    if tampon is None:
+        tampon = lire(fichier)
+    ligne = tampon[:tampon.find('\n') + 1]
     if ligne.startswith('#!') and ligne.endswith('python\n'):
         return True
     return False
@@ -133,6 +133,8 @@ History, references.
    rather meaningless in Python.  The code has also been simplified.
 """
 
+import functools
+
 
 ### Global definitions.
 
@@ -199,7 +201,7 @@ class File:
 class Marshall(File):
 
     def open_write(self):
-        self.file = file(self.file_name, 'wb')
+        self.file = open(self.file_name, 'wb')
         self.end_of_file = True
         import marshal
         self.dump = marshal.dump
@@ -212,7 +214,7 @@ class Marshall(File):
     def open_read(self):
         if self.file is not None:
             self.file.close()
-        self.file = file(self.file_name, 'rb')
+        self.file = open(self.file_name, 'rb')
         try:
             self.record = self.load(self.file)
         except EOFError:
@@ -234,7 +236,7 @@ class Marshall(File):
 class Pickle(File):
 
     def open_write(self):
-        self.file = file(self.file_name, 'wb')
+        self.file = open(self.file_name, 'wb')
         self.end_of_file = True
         import pickle
         self.dump = pickle.Pickler(self.file, -1).dump
@@ -246,7 +248,7 @@ class Pickle(File):
     def open_read(self):
         if self.file is not None:
             self.file.close()
-        self.file = file(self.file_name, 'rb')
+        self.file = open(self.file_name, 'rb')
         import pickle
         self.load = pickle.Unpickler(self.file).load
         try:
@@ -270,7 +272,7 @@ class Pickle(File):
 class String(File):
 
     def open_write(self):
-        self.file = file(self.file_name, 'w')
+        self.file = open(self.file_name, 'w')
         self.end_of_file = True
 
     def write(self, record):
@@ -281,7 +283,7 @@ class String(File):
     def open_read(self):
         if self.file is not None:
             self.file.close()
-        self.file = file(self.file_name)
+        self.file = open(self.file_name)
         self.lines = iter(self.file)
         self.record = None
         self.end_of_file = False
@@ -292,7 +294,7 @@ class String(File):
             raise EOFError
         record = self.record
         try:
-            self.record = (self.lines.next()[:-1]
+            self.record = (next(self.lines)[:-1]
                            .replace('\\n', '\n').replace('\\\\', '\\'))
         except StopIteration:
             self.end_of_file = True
@@ -458,7 +460,7 @@ class Polyphase:
             if compare is None:
                 heap.sort()
             else:
-                heap.sort(compare)
+                heap.sort(key=functools.cmp_to_key(compare))
             for record in heap:
                 yield record
             return
@@ -494,7 +496,7 @@ class Polyphase:
             if compare is None:
                 heap.sort()
             else:
-                heap.sort(compare)
+                heap.sort(key=functools.cmp_to_key(compare))
             self.run_start = heap[0]
             file = self.output_file = self.bump_run()
             self.run_start = None
@@ -22,7 +22,6 @@
 __version__ = 'SPARK-0.7 (pre-alpha-7)'
 
 import re
-import string
 
 class Error(Exception): pass
 
@@ -61,7 +60,7 @@ class Scanner:
                                 rv.append(self.makeRE(name))
 
                 rv.append(self.makeRE('t_default'))
-                return string.join(rv, '|')
+                return '|'.join(rv)
 
         def error(self, s, pos):
                 raise ScannerError("Lexical error at position %s" % pos)
@@ -181,7 +180,7 @@ class Parser:
 
         def addRule(self, doc, func, _preprocess=1):
                 fn = func
-                rules = string.split(doc)
+                rules = doc.split()
 
                 index = []
                 for i in range(len(rules)):
@@ -835,9 +834,9 @@ def _dump(tokens, sets, states):
                         print('\t', item)
                         for (lhs, rhs), pos in states[item[0]].items:
                                 print('\t\t', lhs, '::=', end=' ')
-                                print(string.join(rhs[:pos]), end=' ')
+                                print(' '.join(rhs[:pos]), end=' ')
                                 print('.', end=' ')
-                                print(string.join(rhs[pos:]))
+                                print(' '.join(rhs[pos:]))
                 if i < len(tokens):
                         print()
                         print('token', str(tokens[i]))
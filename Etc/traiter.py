@@ -10,11 +10,14 @@ spéciales, orientées vers le langage Python, et de les exécuter, donnant
 ainsi l'illusion que ces pages HTML sont actives.
 
 Usage: traiter [OPTION]... [PAGE [AFFECTATION]...]]
+   or: traiter -F ADRESSE [-j N]
 
 Options:
   -c CONFIG   Utiliser le fichier CONFIG plutôt que `traiter.conf'.
   -p PROJET   Utiliser PROJET comme nom de projet.
   -w          Formatter la page produite via le programme `w3m'.
+  -F ADRESSE  Servir les pages en FastCGI sur ADRESSE, plutôt qu'une seule.
+  -j N        Avec -F, utiliser N processus (défaut: nombre de processeurs).
 
 La détermination du projet et de son fichier de configuration peut faire
 intervenir plusieurs cas de figure.
@@ -40,11 +43,47 @@ ou le décodage de l'entrée standard lorsque REQUEST_METHOD vaut POST.
 
 Un argument PAGE vide, par exemple donné comme '', n'est pas considéré comme
 fourni.  Le résultat est toujours produit sur la sortie standard.
+
+Avec -F, le programme dure et sert les requêtes d'un serveur Web en
+FastCGI, chaque requête étant traitée comme un appel CGI, où PAGE provient
+de PATH_TRANSLATED ou de SCRIPT_FILENAME.  ADRESSE vaut HÔTE:PORT pour une
+prise TCP, ou le nom d'une prise Unix.  Le mode FastCGI est aussi choisi
+quand le programme, lancé sans argument, reçoit une prise en attente
+sur son entrée standard.  La fonction `application' sert les pages de la
+même manière pour tout serveur WSGI.  La page y est envoyée au client par
+morceaux, dès que TRAITER_VIDAGE caractères sont prêts (8192 par défaut),
+et aussi à chaque directive Vider.  Une page qui tient en un seul morceau
+est envoyée avec sa taille.
+
+Une page compilée est gardée en mémoire, tout comme les pages qu'elle
+inclut, tant que son fichier conserve la même date de modification et la
+même taille, et que CHARSET ne change pas.  Si la variable d'environnement
+TRAITER_CACHE nomme un répertoire, le code compilé y est aussi sauvé au
+moyen de `marshal', ce qui évite aux appels CGI suivants de recompiler.
 """
 
 import cgi
+import hashlib
+import html
+import importlib.util
+import marshal
 import os
+import re
+import stat
+import struct
 import sys
+import threading
+
+# Version du format des gabarits sauvés sur disque.  L'augmenter rend
+# caduques toutes les sauvegardes existantes.
+version_gabarit = 2
+
+# GABARITS associe au nom absolu de chaque page déjà compilée un triplet
+# (NOM_FICHIER, SIGNATURE, CODE).  NOM_FICHIER est le nom tel que fourni,
+# SIGNATURE vaut (MTIME, TAILLE, CHARSET) et CODE est la liste d'instructions
+# produite par `Traiter.compiler'.  CODE n'est jamais modifié à l'exécution,
+# il est donc partagé par toutes les instances de Traiter qui l'utilisent.
+gabarits = {}
 
 
 # Exception qui suit la production d'une page d'erreur dans Traiter.  Elle
@@ -58,7 +97,14 @@ def main(*arguments):
     # Décoder l'appel.
     contexte = {}
     option_w3m = False
+    adresse = None
+    processus = None
     if len(arguments) == 0:
+        # Lancé par un serveur FastCGI, l'entrée standard est une prise en
+        # attente de connexions: servir alors les requêtes au fil de l'eau.
+        if est_prise_fastcgi():
+            servir_fastcgi('-')
+            return
         # On présume un appel en tant que script CGI.  Utiliser les variables
         # d'environnement pour déterminer la page à traiter et comment
         # retrouver le contenu du formulaire.
@@ -66,34 +112,71 @@ def main(*arguments):
         if fichier_a_traiter is None:
             sys.stdout.write(__doc__)
             sys.exit(0)
-        formulaire = cgi.FieldStorage()
-        for nom in list(formulaire.keys()):
-            valeurs = formulaire[nom]
-            if isinstance(valeurs, list):
-                # REVOIR!
-                #erreur("Le formulaire a fourni `%s' %d fois."
-                #            % (nom, len(valeurs)))
-                contexte[nom] = valeurs[-1].value
-            else:
-                contexte[nom] = valeurs.value
+        contexte.update(decoder_formulaire(cgi.FieldStorage()))
         # Produire le Content-Type immédiatement, pour que le fureteur soit
         # patient durant le traitement de la page.
         charset = os.environ.get('CHARSET', 'ISO-8859-1')
+        sys.stdout.reconfigure(encoding=charset, errors='xmlcharrefreplace')
         sys.stdout.write("Content-type: text/html; charset=%s\n\n" % charset)
         sys.stdout.flush()
     else:
         # L'appel se fait probablement via un shell interactif.  Étudier les
         # arguments fournis par l'utilisateur.
         import getopt
-        options, arguments = getopt.getopt(arguments, 'w')
+        options, arguments = getopt.getopt(arguments, 'F:j:w')
         for option, valeur in options:
-            if option == '-w':
+            if option == '-F':
+                adresse = valeur
+            elif option == '-j':
+                processus = int(valeur)
+            elif option == '-w':
                 option_w3m = True
+        if adresse is not None:
+            servir_fastcgi(adresse, processus)
+            return
         fichier_a_traiter = arguments[0]
         for argument in arguments[1:]:
             assert '=' in argument, argument
             nom, valeur = argument.split('=', 1)
             contexte[nom] = valeur
+    preparer_contexte(fichier_a_traiter, contexte)
+    # Déterminer comment écrire.
+    charset = os.environ.get('CHARSET', 'ISO-8859-1')
+    try:
+        if option_w3m:
+            output = os.popen('w3m -T text/html -dump', 'w')
+            try:
+                with open(fichier_a_traiter, encoding=charset) as fichier:
+                    Traiter(fichier, contexte, output.write,
+                            flush=output.flush)
+            finally:
+                output.close()  # Grrr!  REVOIR: pourquoi?
+        else:
+            sys.stdout.reconfigure(encoding=charset,
+                                   errors='xmlcharrefreplace')
+            with open(fichier_a_traiter, encoding=charset) as fichier:
+                Traiter(fichier, contexte, sys.stdout.write,
+                        flush=sys.stdout.flush)
+    except Interruption:
+        pass
+
+
+def decoder_formulaire(formulaire):
+    # Retourner un dictionnaire des champs de FORMULAIRE, un FieldStorage.
+    contexte = {}
+    for nom in list(formulaire.keys()):
+        valeurs = formulaire[nom]
+        if isinstance(valeurs, list):
+            # REVOIR!
+            #erreur("Le formulaire a fourni `%s' %d fois."
+            #            % (nom, len(valeurs)))
+            contexte[nom] = valeurs[-1].value
+        else:
+            contexte[nom] = valeurs.value
+    return contexte
+
+
+def preparer_contexte(fichier_a_traiter, contexte):
     # En cas de conflit, oblitérer les variables du formulaire par celles
     # provenant de la configuration.  Sans cet ordre des choses, il y
     # aurait un vice important de sécurité.
@@ -101,26 +184,16 @@ def main(*arguments):
     if config.has_section('contexte'):
         for option in config.options('contexte'):
             contexte[option] = config.get('contexte', option)
-    # Ajuster PATH.
+    # Ajuster PATH, une seule fois si le processus sert plusieurs pages.
     import configparser
     try:
         library = config.get('DEFAULT', 'Library')
     except configparser.NoOptionError:
         pass
     else:
-        os.environ['PATH'] = '%s:%s' % (library, os.environ['PATH'])
-    # Déterminer comment écrire.
-    try:
-        if option_w3m:
-            output = os.popen('w3m -T text/html -dump', 'w')
-            try:
-                Traiter(file(fichier_a_traiter), contexte, output.write)
-            finally:
-                output.close()  # Grrr!  REVOIR: pourquoi?
-        else:
-            Traiter(file(fichier_a_traiter), contexte, sys.stdout.write)
-    except Interruption:
-        pass
+        chemin = os.environ.get('PATH', '')
+        if library not in chemin.split(':'):
+            os.environ['PATH'] = '%s:%s' % (library, chemin)
 
 
 def get_config(repertoire=None,
@@ -135,16 +208,27 @@ def get_config(repertoire=None,
     # qui suit est une version simplifiée de `Local.commun.config()'.
     # Obtenir un contexte de `config.py', en cherchant d'abord dans
     # le répertoire du fichier à traiter, puis dans deux répertoires
-    # supérieurs au besoin.
-    en_examen = repertoire or os.getcwd()
+    # supérieurs au besoin.  La configuration obtenue est retenue dans
+    # CACHE, au nom du répertoire de départ, pour les appels suivants.
+    depart = en_examen = repertoire or os.getcwd()
+    config = cache.get(depart)
+    if config is not None:
+        return config
     for compteur in range(3):
-        config = cache.get(en_examen)
-        if config is not None:
-            return config
         if os.path.exists(en_examen + '/config.py'):
+            # Charger chaque `config.py' pour lui-même: un processus qui
+            # sert plusieurs répertoires ne doit pas réutiliser le module
+            # `config' d'un autre répertoire.
+            import importlib.util
+            spec = importlib.util.spec_from_file_location(
+                'config', en_examen + '/config.py')
+            module = importlib.util.module_from_spec(spec)
             sys.path.insert(0, en_examen)
-            from config import contexte
-            del sys.path[0]
+            try:
+                spec.loader.exec_module(module)
+            finally:
+                del sys.path[0]
+            contexte = module.contexte
             break
         en_examen = os.path.dirname(en_examen)
     else:
@@ -182,50 +266,104 @@ def get_config(repertoire=None,
     if chaine is not None:
         morceaux = chaine.split(':')
         morceaux.reverse()
-        for repertoire in morceaux:
-            if repertoire in sys.path:
-                sys.path.remove(repertoire)
-            if os.path.isdir(repertoire):
-                sys.path.insert(0, repertoire)
+        for morceau in morceaux:
+            if morceau in sys.path:
+                sys.path.remove(morceau)
+            if os.path.isdir(morceau):
+                sys.path.insert(0, morceau)
     # Retourner la configuration.
-    cache[repertoire] = config
+    cache[depart] = config
     return config
 
 
+def lire_gabarit(sauvegarde, nom_fichier, signature):
+    # Retourner le code sauvé dans le fichier SAUVEGARDE, s'il a été produit
+    # pour NOM_FICHIER avec la même SIGNATURE et par la même version de
+    # Python, ou None autrement.
+    try:
+        with open(sauvegarde, 'rb') as fichier:
+            donnees = fichier.read()
+    except OSError:
+        return None
+    magique = importlib.util.MAGIC_NUMBER
+    if not donnees.startswith(magique):
+        return None
+    try:
+        version, nom, signature_sauvee, code = marshal.loads(
+            donnees[len(magique):])
+        if (version, nom, signature_sauvee) != (version_gabarit,
+                                                nom_fichier, signature):
+            return None
+        return [(location, getattr(Traiter, processeur), arguments)
+                for location, processeur, arguments in code]
+    except (EOFError, ValueError, TypeError, AttributeError):
+        return None
+
+
+def ecrire_gabarit(sauvegarde, nom_fichier, signature, code):
+    # Sauver CODE, compilé depuis NOM_FICHIER de SIGNATURE donnée, dans le
+    # fichier SAUVEGARDE.  Les méthodes y sont représentées par leur nom.
+    # L'écriture passe par un fichier temporaire, pour que des processus
+    # concurrents ne lisent jamais une sauvegarde incomplète.
+    donnees = marshal.dumps(
+        (version_gabarit, nom_fichier, signature,
+         [(location, processeur.__name__, arguments)
+          for location, processeur, arguments in code]))
+    temporaire = '%s.%d' % (sauvegarde, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(sauvegarde), exist_ok=True)
+        with open(temporaire, 'wb') as fichier:
+            fichier.write(importlib.util.MAGIC_NUMBER + donnees)
+        os.replace(temporaire, sauvegarde)
+    except OSError:
+        # Une sauvegarde ratée ne coûte qu'une recompilation plus tard.
+        try:
+            os.remove(temporaire)
+        except OSError:
+            pass
+
+
 class Traiter:
 
-    def __init__(self, fichier, contexte, write, write_errors=None):
+    # Méthode de compilation pour chaque directive.
+    compilateurs = {
+        # Pré-traitement.
+        'Délimiter': 'compiler_delimiter',
+        # Énoncés simples.
+        'Inclure': 'compiler_inclure',
+        'Sauver': 'compiler_sauver',
+        'FinSauver': 'compiler_finsauver',
+        'Faire': 'compiler_faire',
+        'Afficher': 'compiler_afficher',
+        'Tracer': 'compiler_tracer',
+        'FinTracer': 'compiler_fintracer',
+        'Vider': 'compiler_vider',
+        # Structures conditionnelles.
+        'Si': 'compiler_si',
+        'SinonSi': 'compiler_sinonsi',
+        'Sinon': 'compiler_sinon',
+        'FinSi': 'compiler_finsi',
+        # Structures itératives.
+        'Chacun': 'compiler_chacun',
+        'FinChacun': 'compiler_finchacun',
+        'Tantque': 'compiler_tantque',
+        'FinTantque': 'compiler_fintantque',
+        'Suffit!': 'compiler_suffit',
+        }
+
+    def __init__(self, fichier, contexte, write, write_errors=None,
+                 flush=None):
         # Traiter la page HTML présente dans NOM_FICHIER.  CONTEXTE est un
         # dictionnaire représentant le contexte d'évaluation, il est transmis
         # à toute instance de Traiter résultant d'une directive Inclure.
         # Utiliser WRITE pour toute écriture dans la page résultante.
         # WRITE_ERRORS est utilisé en cas d'erreur, None implique WRITE.
-        self.compilateurs = {
-            # Pré-traitement.
-            'Délimiter': self.compiler_delimiter,
-            # Énoncés simples.
-            'Inclure': self.compiler_inclure,
-            'Sauver': self.compiler_sauver,
-            'FinSauver': self.compiler_finsauver,
-            'Faire': self.compiler_faire,
-            'Afficher': self.compiler_afficher,
-            'Tracer': self.compiler_tracer,
-            'FinTracer': self.compiler_fintracer,
-            # Structures conditionnelles.
-            'Si': self.compiler_si,
-            'SinonSi': self.compiler_sinonsi,
-            'Sinon': self.compiler_sinon,
-            'FinSi': self.compiler_finsi,
-            # Structures itératives.
-            'Chacun': self.compiler_chacun,
-            'FinChacun': self.compiler_finchacun,
-            'Tantque': self.compiler_tantque,
-            'FinTantque': self.compiler_fintantque,
-            'Suffit!': self.compiler_suffit,
-            }
+        # FLUSH, si non None, pousse vers le client ce qui a été écrit, et
+        # sert à chaque directive Vider.
         self.charset = os.environ.get('CHARSET', 'ISO-8859-1')
         self.write = write
         self.write_errors = write_errors or write
+        self.flush = flush
         self.dans_page_erreur = False
         self.contexte = contexte
         try:
@@ -234,13 +372,51 @@ class Traiter:
                 self.compiler(fichier, '<string>')
             else:
                 self.location = fichier.name, 0, None
-                self.compiler(fichier.read(), fichier.name)
+                self.charger(fichier)
             self.executer()
         except Interruption:
             raise
         except:
             self.erreur("Erreur durant le traitement!", True)
 
+    def charger(self, fichier):
+        # Obtenir dans CODE la compilation du contenu de FICHIER.  Pour un
+        # fichier ordinaire, réutiliser le code de GABARITS ou celui sauvé
+        # dans TRAITER_CACHE s'il est encore à jour, sinon compiler, puis
+        # retenir le résultat.  Un texte fautif n'est jamais retenu, puisque
+        # `erreur' interrompt alors la compilation.
+        nom_fichier = fichier.name
+        try:
+            etat = os.fstat(fichier.fileno())
+        except (AttributeError, OSError, ValueError):
+            etat = None
+        if (etat is None or not stat.S_ISREG(etat.st_mode)
+                or not isinstance(nom_fichier, str)):
+            self.compiler(fichier.read(), nom_fichier)
+            return
+        signature = etat.st_mtime_ns, etat.st_size, self.charset
+        cle = os.path.abspath(nom_fichier)
+        gabarit = gabarits.get(cle)
+        if gabarit is not None and gabarit[:2] == (nom_fichier, signature):
+            self.code = gabarit[2]
+            return
+        repertoire = os.environ.get('TRAITER_CACHE')
+        code = None
+        if repertoire:
+            sauvegarde = os.path.join(
+                repertoire,
+                hashlib.sha1(cle.encode('UTF-8', 'surrogateescape'))
+                .hexdigest())
+            code = lire_gabarit(sauvegarde, nom_fichier, signature)
+        if code is None:
+            self.compiler(fichier.read(), nom_fichier)
+            code = self.code
+            if repertoire:
+                ecrire_gabarit(sauvegarde, nom_fichier, signature, code)
+        else:
+            self.code = code
+        gabarits[cle] = nom_fichier, signature, code
+
     def compiler(self, texte, nom_fichier):
         # CODE, qui a la forme d'une liste d'instructions, est fabriqué à la
         # compilation et dirige l'exécution.  Toute adresse, comptée à partir
@@ -250,9 +426,12 @@ class Traiter:
         # en cas d'erreur: c'est un triplet donnant le nom du fichier, le
         # numéro de la ligne dans ce fichier, ainsi qu'un fragment, si non
         # None, du texte original représentant l'instruction.  FONCTION est la
-        # méthode à utiliser pour l'exécution de l'instruction.  ARGUMENTS
-        # contient, si non None, une liste des arguments à utiliser, sa
-        # constitution varie selon la nature de l'instruction.  Voici, mais
+        # méthode de la classe, non liée, qui exécute l'instruction, et qui
+        # reçoit l'instance en premier argument.  ARGUMENTS contient, si non
+        # None, une liste des arguments à utiliser, sa constitution varie
+        # selon la nature de l'instruction.  CODE étant partagé entre les
+        # instances au travers de GABARITS, rien n'y est modifié une fois la
+        # compilation terminée.  Voici, mais
         # uniquement pour les méthode d'exécution qui exigent des arguments,
         # ceux qui sont attendus, dans l'ordre:
         # ALLER_A
@@ -261,10 +440,12 @@ class Traiter:
         #   Adresse de la fin du bloc Chacun.
         #   Nom de la variable d'itération.
         #   Code Python compilé évaluant la liste d'itération.
-        #   Indice dans la liste d'itération de la valeur à utiliser.  Ou None.
-        #   Liste d'itération, lorsque bloc actif.  None si inactif.
         # COPIER
-        #   Texte à copier.
+        #   Texte à copier, qui contient des substitutions.
+        #   Liste des variables substituées, ou None si le texte utilise
+        #   d'autres formats que `%(NOM)'.
+        # ECRIRE
+        #   Texte à écrire tel quel.
         # FAIRE
         #   Code Python compilé qu'il faut exécuter.
         # INCLURE
@@ -330,6 +511,7 @@ class Traiter:
             fragments = fragment.split(None, 1)
             compilateur = self.compilateurs.get(fragments[0])
             if compilateur:
+                compilateur = getattr(self, compilateur)
                 if len(fragments) < 2:
                     compilateur('')
                 else:
@@ -344,13 +526,13 @@ class Traiter:
     def compiler_afficher(self, texte):
         texte = texte.lstrip()
         if texte == 'arguments':
-            afficheur = self.executer_afficher_arguments
+            afficheur = Traiter.executer_afficher_arguments
         elif texte == 'code':
-            afficheur = self.executer_afficher_code
+            afficheur = Traiter.executer_afficher_code
         elif texte == 'environnement':
-            afficheur = self.executer_afficher_environnement
+            afficheur = Traiter.executer_afficher_environnement
         elif texte == 'variables':
-            afficheur = self.executer_afficher_variables
+            afficheur = Traiter.executer_afficher_variables
         else:
             self.erreur("Requête invalide dans Afficher.")
             return
@@ -373,11 +555,28 @@ class Traiter:
             self.erreur("Expression invalide dans Chacun.", True)
             return
         self.empiler('Chacun')
-        self.code.append((self.location, self.executer_chacun,
-                          [None, nom, code, None, None]))
+        self.code.append((self.location, Traiter.executer_chacun,
+                          [None, nom, code]))
 
-    def compiler_copier(self, texte):
-        self.code.append((self.location, self.executer_copier, [texte]))
+    def compiler_copier(self, texte,
+                        formats=re.compile(r'%(?:(%)|\(([^()]*)\))?')):
+        # Classer le texte dès la compilation.  Sans substitution, il sera
+        # écrit tel quel.  Sinon, retenir les noms des variables utilisées
+        # si tous les formats sont de la forme `%(NOM)'.
+        noms = []
+        for trouve in formats.finditer(texte):
+            if trouve.group(2) is not None:
+                if trouve.group(2) not in noms:
+                    noms.append(trouve.group(2))
+            elif trouve.group(1) is None:
+                noms = None
+                break
+        if noms == []:
+            self.code.append((self.location, Traiter.executer_ecrire,
+                              [texte.replace('%%', '%')]))
+        else:
+            self.code.append((self.location, Traiter.executer_copier,
+                              [texte, noms]))
 
     def compiler_delimiter(self, texte):
         texte = texte.lstrip()
@@ -430,7 +629,7 @@ class Traiter:
         except:
             self.erreur("Énoncé invalide dans Faire.", True)
             return
-        self.code.append((self.location, self.executer_faire, [code]))
+        self.code.append((self.location, Traiter.executer_faire, [code]))
 
     def compiler_finchacun(self, texte):
         texte = texte.lstrip()
@@ -442,7 +641,7 @@ class Traiter:
             return
         # Retourner au début de la boucle.
         adresse = adresses[0]
-        self.code.append((self.location, self.executer_saut, [adresse]))
+        self.code.append((self.location, Traiter.executer_saut, [adresse]))
         # Ajuster le saut du test conditionel.
         arguments = self.code[adresse][2]
         arguments[0] = len(self.code)
@@ -486,7 +685,7 @@ class Traiter:
             return
         # Retourner au début de la boucle.
         adresse = adresses[0]
-        self.code.append((self.location, self.executer_saut, [adresse]))
+        self.code.append((self.location, Traiter.executer_saut, [adresse]))
         # Ajuster le saut du test conditionel.
         arguments = self.code[adresse][2]
         arguments[0] = len(self.code)
@@ -496,16 +695,18 @@ class Traiter:
         if texte:
             self.erreur("Texte intempestif dans FinTracer.")
             return
-        self.code.append((self.location, self.executer_fintracer, None))
+        self.code.append((self.location, Traiter.executer_fintracer, None))
 
     def compiler_inclure(self, texte):
         fichier = texte.lstrip()
-        self.code.append((self.location, self.executer_inclure, [fichier]))
+        self.code.append((self.location, Traiter.executer_inclure,
+                          [fichier]))
 
     def compiler_sauver(self, texte):
         nom = texte.lstrip()
         self.empiler('Sauver')
-        self.code.append((self.location, self.executer_sauver, [None, nom]))
+        self.code.append((self.location, Traiter.executer_sauver,
+                          [None, nom]))
 
     def compiler_si(self, texte):
         texte = texte.lstrip()
@@ -516,7 +717,7 @@ class Traiter:
             return
         # Préparer un saut conditionnel à compléter plus tard.
         self.empiler('Si')
-        self.code.append((self.location, self.executer_si, [None, code]))
+        self.code.append((self.location, Traiter.executer_si, [None, code]))
 
     def compiler_sinon(self, texte):
         texte = texte.lstrip()
@@ -528,7 +729,7 @@ class Traiter:
             return
         # Préparer un saut inconditionnel à compléter au FinSi.
         self.pile[-1].append(len(self.code))
-        self.code.append((self.location, self.executer_saut, [None]))
+        self.code.append((self.location, Traiter.executer_saut, [None]))
         # Ajuster le saut du test conditionel précédent.
         arguments = self.code[self.pile[-1][2]][2]
         arguments[0] = len(self.code)
@@ -546,13 +747,13 @@ class Traiter:
             return
         # Préparer un saut inconditionnel à compléter au FinSi.
         self.pile[-1].append(len(self.code))
-        self.code.append((self.location, self.executer_saut, [None]))
+        self.code.append((self.location, Traiter.executer_saut, [None]))
         # Ajuster le saut du test conditionel précédent.
         arguments = self.code[self.pile[-1][2]][2]
         arguments[0] = len(self.code)
         # Préparer un saut conditionnel à compléter plus tard.
         self.pile[-1][2] = len(self.code)
-        self.code.append((self.location, self.executer_si, [None, code]))
+        self.code.append((self.location, Traiter.executer_si, [None, code]))
 
     def compiler_suffit(self, texte):
         texte = texte.lstrip()
@@ -571,7 +772,7 @@ class Traiter:
         if texte:
             self.erreur("Texte intempestif dans Suffit!.")
             return
-        self.code.append((self.location, self.executer_suffit,
+        self.code.append((self.location, Traiter.executer_suffit,
                           [self.pile[compteur][2], chacun]))
 
     def compiler_tantque(self, texte):
@@ -583,14 +784,21 @@ class Traiter:
             return
         # Préparer un saut conditionnel à compléter plus tard.
         self.empiler('Tantque')
-        self.code.append((self.location, self.executer_si, [None, code]))
+        self.code.append((self.location, Traiter.executer_si, [None, code]))
 
     def compiler_tracer(self, texte):
         texte = texte.lstrip()
         if texte:
             self.erreur("Texte intempestif dans Tracer.")
             return
-        self.code.append((self.location, self.executer_tracer, None))
+        self.code.append((self.location, Traiter.executer_tracer, None))
+
+    def compiler_vider(self, texte):
+        texte = texte.lstrip()
+        if texte:
+            self.erreur("Texte intempestif dans Vider.")
+            return
+        self.code.append((self.location, Traiter.executer_vider, None))
 
     def depiler(self, bloc):
         if self.pile:
@@ -612,15 +820,19 @@ class Traiter:
                        directive, action)
 
     def executer(self):
+        # BOUCLES associe à l'adresse de chaque instruction CHACUN active un
+        # doublet [INDICE, VALEURS], où VALEURS est la liste d'itération et
+        # INDICE, la position dans VALEURS de la prochaine valeur à utiliser.
+        self.boucles = {}
         self.tracage = False
         self.curseur = 0
         while self.curseur < len(self.code):
             self.location, processeur, arguments = self.code[self.curseur]
             self.curseur += 1
             if arguments:
-                processeur(*arguments)
+                processeur(self, *arguments)
             else:
-                processeur()
+                processeur(self)
 
     def executer_afficher_arguments(self):
         write = self.write
@@ -630,22 +842,24 @@ class Traiter:
               "<th>Argument du programme</th></tr>\n")
         for compteur in range(len(sys.argv)):
             write('<tr><td align=right>%d.</td><td>%s</td></tr>\n'
-                  % (compteur, cgi.escape(repr(sys.argv[compteur]))))
+                  % (compteur, html.escape(repr(sys.argv[compteur]), False)))
         write('</table>\n'
               '<br>\n')
 
     def executer_afficher_code(self):
         nom_de_processeur = {
-            self.executer_chacun: 'Chacun',
-            self.executer_copier: 'Copier',
-            self.executer_faire: 'Faire',
-            self.executer_fintracer: 'FinTracer',
-            self.executer_inclure: 'Inclure',
-            self.executer_sauver: 'Sauver',
-            self.executer_saut: 'Saut',
-            self.executer_si: 'Si',
-            self.executer_suffit: 'Suffit!',
-            self.executer_tracer: 'Tracer'}
+            Traiter.executer_chacun: 'Chacun',
+            Traiter.executer_copier: 'Copier',
+            Traiter.executer_ecrire: 'Écrire',
+            Traiter.executer_faire: 'Faire',
+            Traiter.executer_fintracer: 'FinTracer',
+            Traiter.executer_inclure: 'Inclure',
+            Traiter.executer_sauver: 'Sauver',
+            Traiter.executer_saut: 'Saut',
+            Traiter.executer_si: 'Si',
+            Traiter.executer_suffit: 'Suffit!',
+            Traiter.executer_tracer: 'Tracer',
+            Traiter.executer_vider: 'Vider'}
         write = self.write
         write('<br>\n'
               '<table border=1>\n'
@@ -660,16 +874,16 @@ class Traiter:
             ((nom_fichier, ligne, texte),
              processeur, arguments) = self.code[compteur]
             write('<td align=right valign=top>%d</td>' % compteur)
-            if processeur == self.executer_afficher_arguments:
+            if processeur == Traiter.executer_afficher_arguments:
                 code = 'Afficher'
                 arguments = ['arguments']
-            elif processeur == self.executer_afficher_code:
+            elif processeur == Traiter.executer_afficher_code:
                 code = 'Afficher'
                 arguments = ['code']
-            elif processeur == self.executer_afficher_environnement:
+            elif processeur == Traiter.executer_afficher_environnement:
                 code = 'Afficher'
                 arguments = ['environnement']
-            elif processeur == self.executer_afficher_variables:
+            elif processeur == Traiter.executer_afficher_variables:
                 code = 'Afficher'
                 arguments = ['variables']
             else:
@@ -683,7 +897,7 @@ class Traiter:
             for argument in arguments:
                 if type(argument) is types.CodeType:
                     argument = texte
-                fragments.append(cgi.escape(repr(argument)))
+                fragments.append(html.escape(repr(argument), False))
             if fragments:
                 write('<td>%s.</td>' % '; '.join(fragments))
             else:
@@ -704,7 +918,7 @@ class Traiter:
               "<th>Dans l'environnement</th></tr>\n")
         for nom, valeur in items:
             write('<tr><td>%s</td><td>%s</td></tr>\n'
-                  % (nom, cgi.escape(repr(valeur))))
+                  % (nom, html.escape(repr(valeur), False)))
         write('</table>\n'
               '<br>\n')
 
@@ -718,24 +932,25 @@ class Traiter:
         items.sort()
         for nom, valeur in items:
             write('<tr><td>%s</td><td>%s</td></tr>\n'
-                  % (nom, cgi.escape(repr(valeur))))
+                  % (nom, html.escape(repr(valeur), False)))
         write('</table>\n'
               '<br>\n')
 
-    def executer_chacun(self, curseur, nom, code, compteur, valeurs):
-        arguments = self.code[self.curseur - 1][2]
-        if valeurs is None:
+    def executer_chacun(self, curseur, nom, code):
+        adresse = self.curseur - 1
+        boucle = self.boucles.get(adresse)
+        if boucle is None:
             # Entrée initiale dans la boucle, fixer la liste de valeurs.
             try:
                 valeurs = eval(code, globals(), self.contexte)
             except:
                 self.erreur("Erreur à l'exécution dans Chacun.", True)
                 return
-            compteur = 0
-            arguments[4] = valeurs
+            boucle = self.boucles[adresse] = [0, valeurs]
+        compteur, valeurs = boucle
         if compteur == len(valeurs):
             # Toutes les valeurs ont été vues, sauter hors de la boucle.
-            arguments[4] = None
+            del self.boucles[adresse]
             if self.tracage:
                 self.tracer("Saut [%d]" % curseur)
             if curseur is not None:
@@ -746,9 +961,9 @@ class Traiter:
         if self.tracage:
             self.tracer("`%s' reçoit `%s'" % (nom, valeur))
         self.contexte[nom] = valeur
-        arguments[3] = compteur + 1
+        boucle[0] = compteur + 1
 
-    def executer_copier(self, texte):
+    def executer_copier(self, texte, noms):
         while True:
             try:
                 self.write(texte % self.contexte)
@@ -760,11 +975,30 @@ class Traiter:
                     if isinstance(valeur, str):
                         self.contexte[nom] = valeur.encode('UTF-8')
             except KeyError as exception:
-                nom = exception.args[0]
-                self.contexte[nom] = "@@@ `%s' inconnu! @@@" % nom
+                # Avec NOMS, combler d'un coup toutes les variables absentes,
+                # plutôt que de reprendre le formatage pour chacune.  Si
+                # aucune ne manquait, la KeyError vient d'ailleurs, d'un
+                # `__str__' par exemple: remplacer alors, comme toujours,
+                # la variable qu'elle nomme.  Si c'est déjà fait, reprendre
+                # ne mènerait à rien: signaler l'erreur.
+                comble = False
+                for nom in noms or ():
+                    if nom not in self.contexte:
+                        self.contexte[nom] = "@@@ `%s' inconnu! @@@" % nom
+                        comble = True
+                if not comble:
+                    nom = exception.args[0]
+                    inconnu = "@@@ `%s' inconnu! @@@" % nom
+                    if self.contexte.get(nom) == inconnu:
+                        self.erreur("Erreur à la substitution.", True)
+                        return
+                    self.contexte[nom] = inconnu
             else:
                 return
 
+    def executer_ecrire(self, texte):
+        self.write(texte)
+
     def executer_faire(self, code):
         if self.tracage:
             self.tracer()
@@ -776,28 +1010,35 @@ class Traiter:
     def executer_fintracer(self):
         self.tracage = False
 
-    def executer_inclure(self, nom_fichier):
-        nom_fichier = self.resoudre_nom_fichier(nom_fichier % self.contexte)
+    def executer_inclure(self, nom):
+        nom = nom % self.contexte
+        nom_fichier = self.resoudre_nom_fichier(nom)
         if nom_fichier is None:
-            self.erreur("Ne peut lire le fichier `%s'." % nom_fichier)
+            self.erreur("Ne peut lire le fichier `%s'." % nom)
             return
-        Traiter(file(nom_fichier), self.contexte,
-                self.write, self.write_errors)
+        with open(nom_fichier, encoding=self.charset) as fichier:
+            Traiter(fichier, self.contexte, self.write, self.write_errors,
+                    self.flush)
 
     def executer_sauver(self, limite, nom):
+        # Le texte sauvé n'est pas encore destiné au client: aucun Vider
+        # n'a d'effet jusqu'à la fin du bloc.
         write_sauve = self.write
+        flush_sauve = self.flush
         try:
             fragments = []
             self.write = fragments.append
+            self.flush = None
             while self.curseur < limite:
                 self.location, processeur, arguments = self.code[self.curseur]
                 self.curseur += 1
                 if arguments:
-                    processeur(*arguments)
+                    processeur(self, *arguments)
                 else:
-                    processeur()
+                    processeur(self)
         finally:
             self.write = write_sauve
+            self.flush = flush_sauve
         self.contexte[nom] = ''.join(fragments)
 
     def executer_saut(self, curseur):
@@ -820,18 +1061,21 @@ class Traiter:
                 self.curseur = curseur
 
     def executer_suffit(self, adresse, chacun):
-        arguments = self.code[adresse][2]
-        curseur = arguments[0]
+        curseur = self.code[adresse][2][0]
         if self.tracage:
             self.tracer('Saut [%d]' % curseur)
         if curseur is not None:
             self.curseur = curseur
         if chacun:
-            arguments[4] = None
+            self.boucles.pop(adresse, None)
 
     def executer_tracer(self):
         self.tracage = True
 
+    def executer_vider(self):
+        if self.flush is not None:
+            self.flush()
+
     def tracer(self, message=None):
         adresse = self.curseur - 1
         nom_fichier, ligne, texte = self.location
@@ -913,13 +1157,13 @@ class Traiter:
                        " <head><title>Page d'erreur</title></head>\n"
                        " <body><pre>%s</pre></body>\n"
                        "</html>\n"
-                       % cgi.escape(tampon.getvalue()))
+                       % html.escape(tampon.getvalue(), False))
         else:
             self.dans_page_erreur = True
             self.contexte['petit_diagnostic'] = petit_diagnostic
             self.contexte['gros_diagnostic'] = tampon.getvalue()
-            self.compiler(file(nom_fichier).read(),
-                          nom_fichier)
+            with open(nom_fichier, encoding=self.charset) as fichier:
+                self.charger(fichier)
             self.executer()
         raise Interruption
 
@@ -929,5 +1173,431 @@ class Traiter:
         if os.access(nom_fichier, os.R_OK):
             return nom_fichier
 
+
+## Mode serveur.
+
+# Un processus qui dure évite, à chaque page, le démarrage de Python,
+# l'importation des modules, la lecture de la configuration et la
+# compilation des pages, tous retenus d'une requête à l'autre.
+# `application' sert une page selon WSGI, `servir_fastcgi' répartit les
+# connexions FastCGI entre plusieurs processus qui l'utilisent.  Chaque
+# processus ne traite qu'une requête à la fois, comme le ferait un appel
+# CGI: l'environnement de la requête est installé dans `os.environ' le
+# temps de la traiter, puis retiré.  Comme `os.environ' est partagé par
+# tous les fils d'un processus, VERROU_REQUETE y sérialise les requêtes:
+# sous un serveur WSGI à plusieurs fils (`wsgi.multithread' vrai), un
+# processus ne traite donc toujours qu'une page à la fois, et c'est plutôt
+# le nombre de processus qu'il faut augmenter.
+
+verrou_requete = threading.Lock()
+
+
+def application(environ, start_response):
+    # Traiter, pour un serveur WSGI, la page que nomme PATH_TRANSLATED, ou à
+    # défaut SCRIPT_FILENAME.  Les variables du formulaire et celles de la
+    # configuration sont réunies dans un contexte neuf pour chaque requête.
+    fichier_a_traiter = (environ.get('PATH_TRANSLATED')
+                         or environ.get('SCRIPT_FILENAME'))
+    if fichier_a_traiter:
+        fichier_a_traiter = os.fsdecode(fichier_a_traiter.encode('latin-1'))
+    if not fichier_a_traiter or not os.path.isfile(fichier_a_traiter):
+        start_response('404 Not Found',
+                       [('Content-Type', 'text/plain; charset=UTF-8')])
+        return [b"Page introuvable.\n"]
+    with verrou_requete:
+        return traiter_requete(environ, start_response, fichier_a_traiter)
+
+
+def traiter_requete(environ, start_response, fichier_a_traiter):
+    # Servir FICHIER_A_TRAITER, sous VERROU_REQUETE.
+    sauvegarde = {}
+    for nom, valeur in environ.items():
+        if '.' not in nom and isinstance(valeur, str):
+            sauvegarde[nom] = os.environ.get(nom)
+            os.environ[nom] = valeur
+    try:
+        formulaire = cgi.FieldStorage(fp=environ['wsgi.input'],
+                                      environ=environ)
+        contexte = decoder_formulaire(formulaire)
+        preparer_contexte(fichier_a_traiter, contexte)
+        charset = os.environ.get('CHARSET', 'ISO-8859-1')
+        entetes = [('Content-Type', 'text/html; charset=%s' % charset)]
+        tampon = Tampon(
+            charset, int(os.environ.get('TRAITER_VIDAGE', 8192)),
+            lambda: start_response('200 OK', entetes))
+        try:
+            with open(fichier_a_traiter, encoding=charset) as fichier:
+                Traiter(fichier, contexte, tampon.write, flush=tampon.flush)
+        except Interruption:
+            pass
+    finally:
+        for nom, valeur in sauvegarde.items():
+            if valeur is None:
+                del os.environ[nom]
+            else:
+                os.environ[nom] = valeur
+    if tampon.ecrire is None:
+        # La page tient dans le tampon: la livrer d'un bloc, avec sa taille.
+        corps = tampon.vider()
+        entetes.append(('Content-Length', str(len(corps))))
+        start_response('200 OK', entetes)
+        return [corps]
+    tampon.flush()
+    return []
+
+
+class Tampon:
+    # Accumuler le texte d'une page et le pousser vers le client dès que
+    # TAILLE caractères sont en attente, ou sur demande, codé selon CHARSET.
+    # DEMARRER est appelé à la première poussée, et retourne la fonction
+    # `write' de WSGI qui transmet les octets au client.  Tant que rien
+    # n'est poussé, ECRIRE vaut None.
+
+    def __init__(self, charset, taille, demarrer):
+        self.charset = charset
+        self.taille = taille
+        self.demarrer = demarrer
+        self.ecrire = None
+        self.morceaux = []
+        self.attente = 0
+
+    def write(self, texte):
+        self.morceaux.append(texte)
+        self.attente += len(texte)
+        if self.attente >= self.taille:
+            self.flush()
+
+    def flush(self):
+        if self.morceaux:
+            if self.ecrire is None:
+                self.ecrire = self.demarrer()
+            self.ecrire(self.vider())
+
+    def vider(self):
+        # Retourner, codé, tout le texte en attente, et l'oublier.
+        texte = ''.join(self.morceaux)
+        self.morceaux = []
+        self.attente = 0
+        return texte.encode(self.charset, 'xmlcharrefreplace')
+
+
+def est_prise_fastcgi():
+    # Dire si l'entrée standard est une prise en attente de connexions, ce
+    # qui est la manière FastCGI de lancer une application.
+    import socket
+    try:
+        if not stat.S_ISSOCK(os.fstat(0).st_mode):
+            return False
+        prise = socket.socket(fileno=os.dup(0))
+    except OSError:
+        return False
+    try:
+        return bool(prise.getsockopt(socket.SOL_SOCKET,
+                                     socket.SO_ACCEPTCONN))
+    except OSError:
+        return False
+    finally:
+        prise.close()
+
+
+# Un processus qui meurt en erreur moins de DUREE_ECHEC_RAPIDE secondes
+# après son démarrage est relancé après un délai croissant, plafonné à
+# ATTENTE_MAXIMUM secondes.
+duree_echec_rapide = 10
+attente_maximum = 30
+
+
+def servir_fastcgi(adresse, processus=None, application=application):
+    # Servir APPLICATION en FastCGI sur ADRESSE, qui vaut `-' pour une prise
+    # héritée sur l'entrée standard, HÔTE:PORT pour TCP, ou sinon le nom
+    # d'une prise Unix.  PROCESSUS, par défaut le nombre de processeurs,
+    # est le nombre de processus qui acceptent les connexions.  Tout
+    # processus qui meurt est remplacé, après un délai s'il a échoué
+    # rapidement, pour ne pas relancer sans fin un processus qui échoue dès
+    # son démarrage.
+    import signal
+    import socket
+    import time
+    chemin = None
+    if adresse == '-':
+        prise = socket.socket(fileno=0)
+    elif ':' in adresse:
+        hote, port = adresse.rsplit(':', 1)
+        prise = socket.create_server((hote, int(port)), backlog=128)
+    else:
+        if os.path.exists(adresse):
+            os.remove(adresse)
+        prise = socket.socket(socket.AF_UNIX)
+        prise.bind(adresse)
+        prise.listen(128)
+        chemin = adresse
+    processus = processus or os.cpu_count() or 1
+    signal.signal(signal.SIGTERM, lambda *arguments: sys.exit(0))
+    # ENFANTS associe à chaque processus le moment de son démarrage.
+    enfants = {}
+    attente = 0
+    try:
+        while True:
+            while len(enfants) < processus:
+                pid = os.fork()
+                if pid == 0:
+                    statut = 0
+                    try:
+                        boucle_fastcgi(prise, application)
+                    except (KeyboardInterrupt, SystemExit):
+                        pass
+                    except BaseException:
+                        import traceback
+                        traceback.print_exc()
+                        statut = 1
+                    finally:
+                        os._exit(statut)
+                enfants[pid] = time.monotonic()
+            pid, statut = os.wait()
+            depart = enfants.pop(pid, None)
+            if (statut == 0 or depart is None
+                    or time.monotonic() - depart > duree_echec_rapide):
+                attente = 0
+            else:
+                attente = min(2 * attente or .1, attente_maximum)
+                time.sleep(attente)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in enfants:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        prise.close()
+        if chemin is not None:
+            try:
+                os.remove(chemin)
+            except OSError:
+                pass
+
+
+# Constantes du protocole FastCGI.
+FCGI_BEGIN_REQUEST = 1
+FCGI_ABORT_REQUEST = 2
+FCGI_END_REQUEST = 3
+FCGI_PARAMS = 4
+FCGI_STDIN = 5
+FCGI_STDOUT = 6
+FCGI_STDERR = 7
+FCGI_GET_VALUES = 9
+FCGI_GET_VALUES_RESULT = 10
+FCGI_UNKNOWN_TYPE = 11
+FCGI_RESPONDER = 1
+FCGI_KEEP_CONN = 1
+FCGI_REQUEST_COMPLETE = 0
+FCGI_CANT_MPX_CONN = 1
+FCGI_UNKNOWN_ROLE = 3
+
+# Réponses aux questions d'un serveur FastCGI sur nos capacités.
+valeurs_fastcgi = {'FCGI_MPXS_CONNS': '0'}
+
+
+def boucle_fastcgi(prise, application):
+    # Accepter sans fin les connexions sur PRISE, et les servir.
+    while True:
+        connexion, adresse = prise.accept()
+        try:
+            servir_connexion(connexion, application)
+        except OSError:
+            # Le serveur Web a abandonné la connexion.
+            pass
+        except (ValueError, struct.error) as exception:
+            # Enregistrement mal formé: abandonner cette connexion
+            # seulement, le processus continue de servir les autres.
+            sys.stderr.write("Connexion FastCGI abandonnée: %s\n"
+                             % exception)
+        finally:
+            connexion.close()
+
+
+def servir_connexion(connexion, application):
+    # Servir les requêtes FastCGI reçues sur CONNEXION, une à la fois.
+    entree = connexion.makefile('rb')
+    sortie = connexion.sendall
+    requete = None
+    while True:
+        enregistrement = lire_enregistrement(entree)
+        if enregistrement is None:
+            return
+        type, numero, contenu = enregistrement
+        if numero == 0:
+            if type == FCGI_GET_VALUES:
+                valeurs = {nom: valeurs_fastcgi[nom]
+                           for nom in decoder_paires(contenu)
+                           if nom in valeurs_fastcgi}
+                ecrire_enregistrement(sortie, FCGI_GET_VALUES_RESULT, 0,
+                                      coder_paires(valeurs))
+            else:
+                ecrire_enregistrement(sortie, FCGI_UNKNOWN_TYPE, 0,
+                                      struct.pack('!B7x', type))
+        elif type == FCGI_BEGIN_REQUEST:
+            role, drapeaux = struct.unpack('!HB5x', contenu)
+            if requete is not None:
+                terminer_requete(sortie, numero, FCGI_CANT_MPX_CONN)
+            elif role != FCGI_RESPONDER:
+                terminer_requete(sortie, numero, FCGI_UNKNOWN_ROLE)
+            else:
+                requete = numero
+                garder = drapeaux & FCGI_KEEP_CONN
+                parametres = []
+                donnees = []
+        elif numero != requete:
+            pass
+        elif type == FCGI_PARAMS:
+            parametres.append(contenu)
+        elif type == FCGI_STDIN and contenu:
+            donnees.append(contenu)
+        elif type in (FCGI_STDIN, FCGI_ABORT_REQUEST):
+            if type == FCGI_STDIN:
+                repondre(sortie, numero,
+                         decoder_paires(b''.join(parametres)),
+                         b''.join(donnees), application)
+            terminer_requete(sortie, numero, FCGI_REQUEST_COMPLETE)
+            requete = None
+            if not garder:
+                return
+
+
+def repondre(sortie, numero, environ, donnees, application):
+    # Produire sur SORTIE, pour la requête NUMERO, la réponse d'APPLICATION
+    # étant donné ENVIRON, les paramètres de la requête, et DONNEES, le
+    # contenu de son entrée standard.
+    import io
+    environ['wsgi.version'] = 1, 0
+    environ['wsgi.input'] = io.BytesIO(donnees)
+    environ['wsgi.errors'] = sys.stderr
+    environ['wsgi.multithread'] = False
+    environ['wsgi.multiprocess'] = True
+    environ['wsgi.run_once'] = False
+    if environ.get('HTTPS', 'off').lower() in ('on', '1'):
+        environ['wsgi.url_scheme'] = 'https'
+    else:
+        environ['wsgi.url_scheme'] = 'http'
+    entete = []
+    envoye = False
+
+    def start_response(statut, entetes, exc_info=None):
+        if exc_info and envoye:
+            raise exc_info[1].with_traceback(exc_info[2])
+        entete[:] = ['Status: %s\r\n' % statut]
+        entete.extend('%s: %s\r\n' % paire for paire in entetes)
+        entete.append('\r\n')
+        return write
+
+    def write(morceau):
+        nonlocal envoye
+        if not envoye:
+            morceau = ''.join(entete).encode('latin-1') + morceau
+            envoye = True
+        if morceau:
+            ecrire_enregistrement(sortie, FCGI_STDOUT, numero, morceau)
+
+    try:
+        resultat = application(environ, start_response)
+        try:
+            for morceau in resultat:
+                write(morceau)
+            if not envoye:
+                write(b'')
+        finally:
+            if hasattr(resultat, 'close'):
+                resultat.close()
+    except ConnectionError:
+        raise
+    except Exception:
+        import traceback
+        ecrire_enregistrement(sortie, FCGI_STDERR, numero,
+                              traceback.format_exc().encode('UTF-8'))
+        if not envoye:
+            start_response('500 Internal Server Error',
+                           [('Content-Type', 'text/plain; charset=UTF-8')])
+            write("Erreur interne.\n".encode('UTF-8'))
+    ecrire_enregistrement(sortie, FCGI_STDOUT, numero)
+
+
+def terminer_requete(sortie, numero, statut):
+    ecrire_enregistrement(sortie, FCGI_END_REQUEST, numero,
+                          struct.pack('!LB3x', 0, statut))
+
+
+def lire_enregistrement(entree):
+    # Lire un enregistrement FastCGI d'ENTREE, retourner un triplet (TYPE,
+    # NUMERO, CONTENU), ou None si la connexion est fermée.
+    entete = entree.read(8)
+    if len(entete) < 8:
+        return None
+    version, type, numero, longueur, remplissage = struct.unpack(
+        '!BBHHBx', entete)
+    contenu = entree.read(longueur + remplissage)
+    if len(contenu) < longueur + remplissage:
+        return None
+    return type, numero, contenu[:longueur]
+
+
+def ecrire_enregistrement(sortie, type, numero, contenu=b''):
+    # Écrire CONTENU via SORTIE, en autant d'enregistrements FastCGI que
+    # sa longueur l'exige.  Un CONTENU vide produit un seul enregistrement
+    # vide, qui marque la fin d'un flot.
+    morceaux = []
+    debut = 0
+    while True:
+        morceau = contenu[debut:debut + 65535]
+        morceaux.append(struct.pack('!BBHHBx', 1, type, numero,
+                                    len(morceau), 0))
+        morceaux.append(morceau)
+        debut += 65535
+        if debut >= len(contenu):
+            break
+    sortie(b''.join(morceaux))
+
+
+def decoder_paires(contenu):
+    # Décoder les paires nom-valeur FastCGI de CONTENU en un dictionnaire,
+    # dont les chaînes sont décodées en Latin-1 comme le veut WSGI.  Lève
+    # ValueError si CONTENU est tronqué.
+    paires = {}
+    position = 0
+    while position < len(contenu):
+        longueurs = []
+        for compteur in range(2):
+            if position >= len(contenu):
+                raise ValueError("Paire FastCGI tronquée.")
+            longueur = contenu[position]
+            if longueur & 0x80:
+                longueur, = struct.unpack(
+                    '!L', contenu[position:position + 4])
+                longueur &= 0x7fffffff
+                position += 4
+            else:
+                position += 1
+            longueurs.append(longueur)
+        if position + longueurs[0] + longueurs[1] > len(contenu):
+            raise ValueError("Paire FastCGI tronquée.")
+        nom = contenu[position:position + longueurs[0]]
+        position += longueurs[0]
+        valeur = contenu[position:position + longueurs[1]]
+        position += longueurs[1]
+        paires[nom.decode('latin-1')] = valeur.decode('latin-1')
+    return paires
+
+
+def coder_paires(paires):
+    # Coder le dictionnaire PAIRES en paires nom-valeur FastCGI.
+    morceaux = []
+    for nom, valeur in paires.items():
+        for chaine in nom, valeur:
+            if len(chaine) < 128:
+                morceaux.append(struct.pack('!B', len(chaine)))
+            else:
+                morceaux.append(struct.pack('!L', len(chaine) | 0x80000000))
+        morceaux.append(nom.encode('latin-1') + valeur.encode('latin-1'))
+    return b''.join(morceaux)
+
 if __name__ == '__main__':
     main(*sys.argv[1:])
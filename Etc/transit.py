@@ -4,16 +4,31 @@
 
 """\
 Transmission de structures Python sur le réseau.
+
+Chaque structure voyage sous forme `marshal', précédée de sa longueur.
+Les fonctions `envoyer' et `recevoir' travaillent sur une prise (socket)
+bloquante.  Les coroutines `envoyer_async' et `recevoir_async' font de
+même sur une paire `asyncio.StreamReader' / `asyncio.StreamWriter', et
+la classe `Serveur' permet à un seul processus de desservir un grand
+nombre de clients simultanés, sans fil d'exécution par client.
 """
 
+import asyncio
 import marshal
 import struct
+import time
 #import sys
 
 format_prefixe = '!I'
 grandeur_fragment = 30000
+# Longueur maximale, en octets, d'un message reçu par `recevoir_async'.
+# Le préfixe vient du client: sans limite, un seul client pourrait faire
+# allouer au serveur jusqu'à quatre gigaoctets.
+grandeur_maximale = 1 << 26
+
 
-Erreur = 'Erreur'
+class Erreur(Exception):
+    pass
 
 
 def envoyer(socket, structure):
@@ -31,7 +46,7 @@ def envoyer(socket, structure):
 def recevoir(socket):
     #sys.stderr.write('Recevoir!\n')
     attendu = struct.calcsize(format_prefixe)
-    chaine = ''
+    chaine = b''
     while len(chaine) < attendu:
         fragment = socket.recv(grandeur_fragment)
         #sys.stderr.write('Réception %d de %d\n' % (len(fragment), attendu))
@@ -48,3 +63,215 @@ def recevoir(socket):
             raise Erreur("Connection rompue (vu par le récipiendaire).")
         chaine += fragment
     return marshal.loads(chaine)
+
+
+## Variante asynchrone.
+
+def coder(structure):
+    # Retourner STRUCTURE sous forme `marshal', précédée de sa longueur.
+    # Lève ValueError si STRUCTURE contient un objet non transmissible.
+    chaine = marshal.dumps(structure)
+    return struct.pack(format_prefixe, len(chaine)) + chaine
+
+
+async def envoyer_async(writer, structure):
+    writer.write(coder(structure))
+    await writer.drain()
+
+
+async def recevoir_async(reader, maximum=None):
+    # Retourne None si le client ferme proprement entre deux messages.
+    # Un message de plus de MAXIMUM octets, par défaut `grandeur_maximale',
+    # ou illisible, lève Erreur.
+    if maximum is None:
+        maximum = grandeur_maximale
+    try:
+        entete = await reader.readexactly(struct.calcsize(format_prefixe))
+    except asyncio.IncompleteReadError as exception:
+        if not exception.partial:
+            return None
+        raise Erreur("Connection rompue (vu par le récipiendaire).")
+    except ConnectionError:
+        raise Erreur("Connection rompue (vu par le récipiendaire).")
+    attendu, = struct.unpack(format_prefixe, entete)
+    if attendu > maximum:
+        raise Erreur("Message de %d octets, au-delà de %d."
+                     % (attendu, maximum))
+    try:
+        chaine = await reader.readexactly(attendu)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        raise Erreur("Connection rompue (vu par le récipiendaire).")
+    try:
+        return marshal.loads(chaine)
+    except (EOFError, ValueError, TypeError):
+        raise Erreur("Message illisible.")
+
+
+class Statistique:
+    # Latences cumulées, en secondes, pour un même nom de traiteur.
+
+    def __init__(self):
+        self.compte = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = 0.0
+
+    def ajouter(self, duree):
+        self.compte += 1
+        self.total += duree
+        if self.minimum is None or duree < self.minimum:
+            self.minimum = duree
+        if duree > self.maximum:
+            self.maximum = duree
+
+    def moyenne(self):
+        if self.compte:
+            return self.total / self.compte
+        return 0.0
+
+    def __repr__(self):
+        return ('<Statistique %d messages, moyenne %.6f s, maximum %.6f s>'
+                % (self.compte, self.moyenne(), self.maximum))
+
+
+class Serveur:
+    # Un serveur asyncio qui aiguille chaque message reçu vers un traiteur.
+    # Un message est un tuple (NOM, ARGUMENT...).  Le traiteur enregistré
+    # sous NOM, fonction ordinaire ou coroutine, reçoit les ARGUMENTs;
+    # sa valeur de retour est renvoyée au client, précédée de True.  Si le
+    # traiteur lève une exception, le client reçoit plutôt (False, TEXTE).
+    # Au-delà de MAXIMUM_CONNEXIONS clients simultanés, les connexions
+    # nouvelles sont refermées aussitôt.  Un client qui envoie un message
+    # illisible, ou de plus de MAXIMUM_MESSAGE octets, est déconnecté.
+
+    def __init__(self, traiteurs=None, maximum_connexions=10000,
+                 maximum_message=grandeur_maximale):
+        self.traiteurs = dict(traiteurs or {})
+        self.maximum_connexions = maximum_connexions
+        self.maximum_message = maximum_message
+        self.connexions = 0
+        self.refusees = 0
+        self.statistiques = {}
+        self.serveur = None
+
+    def enregistrer(self, nom, traiteur=None):
+        # S'utilise directement, ou comme décorateur: @serveur.enregistrer(NOM)
+        if traiteur is None:
+            def decorateur(traiteur):
+                self.traiteurs[nom] = traiteur
+                return traiteur
+            return decorateur
+        self.traiteurs[nom] = traiteur
+        return traiteur
+
+    async def demarrer(self, hote=None, port=0, **options):
+        self.serveur = await asyncio.start_server(
+            self.desservir, hote, port, **options)
+        return self.serveur
+
+    async def demarrer_unix(self, chemin, **options):
+        self.serveur = await asyncio.start_unix_server(
+            self.desservir, chemin, **options)
+        return self.serveur
+
+    async def servir(self, hote=None, port=0, **options):
+        serveur = await self.demarrer(hote, port, **options)
+        async with serveur:
+            await serveur.serve_forever()
+
+    def fermer(self):
+        if self.serveur is not None:
+            self.serveur.close()
+
+    async def desservir(self, reader, writer):
+        if self.connexions >= self.maximum_connexions:
+            self.refusees += 1
+            writer.close()
+            return
+        self.connexions += 1
+        try:
+            while True:
+                try:
+                    message = await recevoir_async(reader,
+                                                   self.maximum_message)
+                except Erreur:
+                    break
+                if message is None:
+                    break
+                writer.write(await self.traiter(message))
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    break
+        finally:
+            self.connexions -= 1
+            writer.close()
+
+    async def traiter(self, message):
+        # Retourner la réponse à MESSAGE, déjà codée par `coder'.
+        depart = time.perf_counter()
+        try:
+            nom, arguments = message[0], message[1:]
+        except (TypeError, IndexError):
+            nom = None
+            reponse = False, "Message mal formé: %r" % (message,)
+        else:
+            traiteur = self.traiteurs.get(nom)
+            if traiteur is None:
+                reponse = False, "Traiteur inconnu: %r" % (nom,)
+                # Les erreurs de protocole sont comptées ensemble.
+                nom = None
+            else:
+                try:
+                    resultat = traiteur(*arguments)
+                    if asyncio.iscoroutine(resultat):
+                        resultat = await resultat
+                except Exception as exception:
+                    reponse = False, '%s: %s' % (type(exception).__name__,
+                                                 exception)
+                else:
+                    reponse = True, resultat
+        try:
+            chaine = coder(reponse)
+        except ValueError as exception:
+            chaine = coder((False, "Réponse non transmissible: %s"
+                            % exception))
+        statistique = self.statistiques.get(nom)
+        if statistique is None:
+            statistique = self.statistiques[nom] = Statistique()
+        statistique.ajouter(time.perf_counter() - depart)
+        return chaine
+
+
+class Client:
+    # Client asynchrone pour un `Serveur'.  `await client.appeler(NOM,
+    # ARGUMENT...)' retourne le résultat du traiteur, ou lève Erreur.
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connecter(cls, hote, port, **options):
+        reader, writer = await asyncio.open_connection(hote, port, **options)
+        return cls(reader, writer)
+
+    async def appeler(self, nom, *arguments):
+        try:
+            await envoyer_async(self.writer, (nom,) + arguments)
+        except ConnectionError:
+            raise Erreur("Connection rompue (vu par l'envoyeur).")
+        reponse = await recevoir_async(self.reader)
+        if reponse is None:
+            raise Erreur("Connection rompue (vu par le client).")
+        succes, valeur = reponse
+        if not succes:
+            raise Erreur(valeur)
+        return valeur
+
+    async def fermer(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
@@ -0,0 +1,42 @@
+# Copyright © 2026 Progiciels Bourbeau-Pinard inc.
+
+"""\
+Benchmark suite for the hot paths of the `Etc' modules.
+
+Each module of this package has a `cases(sizes)' generator, yielding
+(NAME, FUNCTION, PARAMETERS) triples as understood by `Etc.benchmark.main'.
+Input data is generated, with a fixed seed, only when the case comes up,
+and PARAMETERS holds its `size', so timings may be followed over a range
+of sizes and not at a single point.  Run the suite with:
+
+    python3 -m benchmarks [-q] [-k WORD]... [-s FILE] [-c FILE]
+
+`-q' only uses the smaller sizes, `-k WORD' only keeps cases which name
+contains WORD, `-s FILE' saves a baseline and `-c FILE' compares with one.
+"""
+
+import importlib
+
+# Modules of this package, in running order.
+modules = ('heap', 'sort', 'spark', 'isodate', 'allout', 'nospam',
+           'folder', 'transit', 'pylog', 'traiter', 'memoire')
+
+
+def cases(quick=False, words=()):
+    """\
+Generate all benchmark cases, maybe only the QUICK ones, and only those
+whose name contains one of WORDS, if any.
+"""
+    for name in modules:
+        module = importlib.import_module('benchmarks.' + name)
+        sizes = module.SIZES
+        if quick:
+            sizes = sizes[:2]
+        for case in module.cases(sizes):
+            if not words or any(word in case[0] for word in words):
+                yield case
+
+
+def label(name, size):
+    # Name a case after its family NAME and its SIZE.
+    return '%s[%d]' % (name, size)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# Copyright © 2026 Progiciels Bourbeau-Pinard inc.
+
+"""\
+Run the benchmark suite.
+
+Usage: python3 -m benchmarks [OPTION]...
+
+  -q        only use the two smallest sizes of each case
+  -k WORD   only run cases which name contains WORD, may be repeated
+  -s FILE   save results as a JSON baseline into FILE
+  -c FILE   compare results with the JSON baseline in FILE
+"""
+
+import getopt
+import sys
+
+from Etc import benchmark
+
+import benchmarks
+
+
+def main(*arguments):
+    options, arguments = getopt.getopt(arguments, 'c:k:qs:')
+    quick = False
+    words = []
+    passed = []
+    for option, value in options:
+        if option == '-k':
+            words.append(value)
+        elif option == '-q':
+            quick = True
+        else:
+            passed += [option, value]
+    if arguments:
+        sys.stderr.write(__doc__)
+        return 2
+    return benchmark.main(benchmarks.cases(quick, words), passed)
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
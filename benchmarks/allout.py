@@ -0,0 +1,128 @@
+"""\
+Benchmark `Etc.Allout.allout' reading of generated outlines, each node
+having a few lines of text and a random number of sub-nodes: building the
+whole tree, only streaming the events, and streaming them into a listing.
+Both tree representations are compared: nested lists, and the flat arrays
+of `allout.Outline', when built and when walked to write a listing.
+Before any timing, a few outlines known to be tricky are read through
+both representations, and checked against the trees the nested list
+reader has always produced for them.  Run this module alone to compare
+their memory footprints:
+
+    python3 -m benchmarks.allout [SIZE]...
+"""
+
+import io
+import random
+import sys
+import tracemalloc
+
+from Etc.Allout import allout, listing
+
+from benchmarks import label
+
+SIZES = 100, 1000, 10000
+
+bullets = '*+-@.:,;'
+
+# Outlines where a single-line unlabelled node collapses into its parent,
+# possibly through implicit nodes of skipped levels, with their trees.
+samples = (
+    ('* top\ntext\n. +\n    indented\n', ['top', 'text', '    indented']),
+    ('* \n   t0\n.* \n.*\n     t0\n* a\n',
+     ['', ['', 't0', [''], '  t0'], ['a']]),
+    ('Title\n.* \n  t0\n', ['Title', '  t0']),
+    ('* a\n  x\n. +\n  y\n.. b\n', ['a', 'x', 'y', ['b']]),
+    )
+
+
+def check():
+    # Verify that both representations read each sample as expected.
+    for text, expected in samples:
+        tree = allout.read(io.StringIO(text))
+        flat = allout.build(
+            allout.Outline(allout.events(io.StringIO(text))).events())
+        if tree != expected or flat != expected:
+            raise AssertionError('%r read as %r and %r, not %r'
+                                 % (text, tree, flat, expected))
+
+
+def outline(generator, size):
+    # Return the text of an allout file of about SIZE nodes.
+    lines = ['Generated outline', '']
+    level = 0
+    for counter in range(size):
+        level = generator.randrange(max(1, level - 2), min(level + 2, 8))
+        if level == 1:
+            lines.append('* Node %d' % counter)
+        else:
+            lines.append('.%s%s Node %d' % (' ' * (level - 2),
+                                            bullets[(level - 2) % 8],
+                                            counter))
+        for line in range(generator.randrange(4)):
+            lines.append('%*s Text line %d of node %d.'
+                         % (level + 2, '', line, counter))
+        if generator.random() < 0.3:
+            lines.append('')
+    return '\n'.join(lines) + '\n'
+
+
+def cases(sizes):
+    check()
+    for size in sizes:
+        text = outline(random.Random(size), size)
+        parameters = {'size': size}
+
+        def stream(text=text):
+            for event in allout.events(io.StringIO(text)):
+                pass
+
+        def list_stream(text=text):
+            listing.write_listing_events(allout.events(io.StringIO(text)),
+                                         io.StringIO().write)
+
+        yield (label('allout.read', size),
+               lambda text=text: allout.read(io.StringIO(text)), parameters)
+        yield label('allout.events', size), stream, parameters
+        def outline_build(text=text):
+            allout.Outline(allout.events(io.StringIO(text)))
+
+        tree = allout.read(io.StringIO(text))
+        flat = allout.Outline(allout.events(io.StringIO(text)))
+
+        def list_tree(tree=tree):
+            listing.write_listing(tree, io.StringIO().write)
+
+        def list_outline(flat=flat):
+            listing.write_listing_events(flat.events(), io.StringIO().write)
+
+        yield label('allout.listing', size), list_stream, parameters
+        yield label('allout.outline', size), outline_build, parameters
+        yield label('allout.listing_tree', size), list_tree, parameters
+        yield label('allout.listing_outline', size), list_outline, parameters
+
+
+def footprint(build, text):
+    # Return the bytes still allocated by what BUILD makes from TEXT.
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build(io.StringIO(text))
+        return tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def memory(sizes, write=sys.stdout.write):
+    # Report the memory held by both representations, for each of SIZES.
+    write('%10s %12s %12s %6s\n' % ('size', 'lists', 'outline', 'ratio'))
+    for size in sizes:
+        text = outline(random.Random(size), size)
+        lists = footprint(allout.read, text)
+        flat = footprint(
+            lambda input: allout.Outline(allout.events(input)), text)
+        write('%10d %12d %12d %6.2f\n' % (size, lists, flat, lists / flat))
+
+
+if __name__ == '__main__':
+    memory([int(argument) for argument in sys.argv[1:]] or SIZES)
@@ -0,0 +1,78 @@
+"""\
+Benchmark `Etc.folder' on generated mbox and Babyl files: opening a
+folder, which splits it into messages, then parsing all message headers.
+"""
+
+import os
+import random
+import shutil
+import tempfile
+
+from Etc import folder
+
+from benchmarks import label
+
+SIZES = 100, 1000, 10000
+
+
+def message(generator, counter):
+    # Return the head and body of one message.
+    head = ('From: sender%d@example.com\n'
+            'To: receiver@example.com\n'
+            'Subject: Message number %d\n'
+            'Date: Mon, 12 Jan 2004 10:%02d:%02d -0500\n'
+            'Message-Id: <%d.%x@example.com>\n'
+            % (counter % 37, counter, counter % 60, counter * 7 % 60,
+               counter, generator.getrandbits(32)))
+    lines = []
+    for line in range(generator.randrange(5, 40)):
+        lines.append('Line %d of message %d, with some filler text.\n'
+                     % (line, counter))
+        if generator.random() < 0.02:
+            lines.append('From here, a line which mbox needs to quote.\n')
+    return head, ''.join(lines)
+
+
+def write_folders(directory, size):
+    # Write SIZE messages in both formats, return both file names.
+    generator = random.Random(size)
+    mbox_name = os.path.join(directory, 'mbox')
+    babyl_name = os.path.join(directory, 'babyl')
+    mbox = open(mbox_name, 'w')
+    babyl = open(babyl_name, 'w')
+    babyl.write(folder.Babyl.folder_prefix)
+    for counter in range(size):
+        head, body = message(generator, counter)
+        mbox.write('From sender%d@example.com Mon Jan 12 10:00:00 2004\n'
+                   % (counter % 37))
+        mbox.write(head + '\n')
+        mbox.write(body.replace('\nFrom', '\n>From') + '\n')
+        babyl.write('\f' + folder.Babyl.article_prefix
+                    + head + '\n' + body + '\37')
+    mbox.close()
+    babyl.close()
+    return mbox_name, babyl_name
+
+
+def headers(file_name):
+    instance = folder.folder(file_name)
+    for index in range(len(instance)):
+        instance.message_headers(index)
+
+
+def cases(sizes):
+    directory = tempfile.mkdtemp()
+    try:
+        for size in sizes:
+            mbox_name, babyl_name = write_folders(directory, size)
+            parameters = {'size': size}
+            yield (label('folder.open_mbox', size),
+                   lambda: folder.folder(mbox_name), parameters)
+            yield (label('folder.open_babyl', size),
+                   lambda: folder.folder(babyl_name), parameters)
+            yield (label('folder.headers_mbox', size),
+                   lambda: headers(mbox_name), parameters)
+            yield (label('folder.headers_babyl', size),
+                   lambda: headers(babyl_name), parameters)
+    finally:
+        shutil.rmtree(directory)
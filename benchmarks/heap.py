@@ -0,0 +1,27 @@
+"""\
+Benchmark `Etc.heap': filling a heap with random items, then emptying it.
+"""
+
+import random
+
+from Etc import heap
+
+from benchmarks import label
+
+SIZES = 1000, 10000, 100000
+
+
+def cases(sizes):
+    for size in sizes:
+        items = random.Random(size).sample(range(size * 10), size)
+
+        def push_pop(items=items):
+            instance = heap.Heap()
+            push = instance.push
+            for item in items:
+                push(item)
+            pop = instance.pop
+            for counter in range(len(items)):
+                pop()
+
+        yield label('heap.push_pop', size), push_pop, {'size': size}
@@ -0,0 +1,129 @@
+"""\
+Benchmark `Etc.isodate' normalisation over a generated text, where lines
+holding dates in various American formats are mixed with plain lines, for
+the whole text at once or streamed by blocks.
+
+Also parse lists of `Date:' headers in bulk, a hundred headers per size
+unit, about half of them repeated.  If ISODATE_HEADERS names a file with
+one real header per line, its whole contents is parsed as well.  Parse
+results are first checked against `email.utils.parsedate_tz'.
+"""
+
+import email.utils
+import io
+import os
+import random
+
+from Etc import isodate
+
+from benchmarks import label
+
+SIZES = 100, 1000, 10000
+
+months = 'Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec'.split()
+days = 'Sun Mon Tue Wed Thu Fri Sat'.split()
+zones = 'EST', 'PDT', 'GMT', 'UT', '-0500', '+0100', '+0545'
+
+# Dates which `email.utils.parsedate_tz' also reads.
+samples = (
+    '5 Aug 2004 10:17:17 -0500',
+    'Thu, 5 Aug 2004 10:17:17 +0545',
+    'Thu, 05 Aug 2004 10:17:17 GMT',
+    '05 Aug 2004 10:17 -0930',
+    'Thu Aug  5 10:17:17 2004',
+    )
+
+
+def check(texts):
+    # Verify that TEXTS give the POSIX time `email.utils.parsedate_tz'
+    # implies, a missing zone meaning UTC for both.
+    for text in texts:
+        expected = email.utils.parsedate_tz(text)
+        expected = email.utils.mktime_tz(expected[:9] + (expected[9] or 0,))
+        if isodate.parser.epoch(text) != expected:
+            raise AssertionError('%r parsed as %r, not %r'
+                                 % (text, isodate.parse(text), expected))
+
+
+def line(generator):
+    # Return one line of text, with a date three times out of four.
+    month = generator.choice(months)
+    day = generator.randrange(1, 29)
+    year = generator.randrange(1990, 2010)
+    time = '%02d:%02d:%02d' % (generator.randrange(24),
+                               generator.randrange(60),
+                               generator.randrange(60))
+    choice = generator.randrange(4)
+    if choice == 0:
+        return 'Date: %s, %02d %s %d %s %s' % (
+            generator.choice(days), day, month, year, time,
+            generator.choice(zones))
+    if choice == 1:
+        return 'Created %s %s %2d %s %d by someone.' % (
+            generator.choice(days), month, day, time, year)
+    if choice == 2:
+        return 'Seen on %d/%d/%02d, then forgotten.' % (
+            months.index(month) + 1, day, year % 100)
+    return 'A line of text without any date within it.'
+
+
+def header(generator):
+    # Return one generated mail `Date:' header.
+    choice = generator.randrange(10)
+    month = generator.choice(months)
+    day = generator.randrange(1, 29)
+    year = generator.randrange(1995, 2010)
+    time = '%02d:%02d:%02d' % (generator.randrange(24),
+                               generator.randrange(60),
+                               generator.randrange(60))
+    if choice < 7:
+        return 'Date: %s, %02d %s %d %s %s' % (
+            generator.choice(days), day, month, year, time,
+            generator.choice(zones))
+    if choice < 9:
+        return 'Date: %02d %s %d %s %s' % (
+            day, month, year, time, generator.choice(zones))
+    return 'Date: %s %s %2d %s %d' % (
+        generator.choice(days), month, day, time, year)
+
+
+def headers(generator, count):
+    # Return COUNT headers, about half of them repeating earlier ones.
+    result = []
+    for counter in range(count):
+        if result and generator.random() < 0.5:
+            result.append(generator.choice(result))
+        else:
+            result.append(header(generator))
+    return result
+
+
+def cases(sizes):
+    check(samples)
+    check([text[6:] for text in headers(random.Random(0), 1000)])
+    for size in sizes:
+        generator = random.Random(size)
+        text = '\n'.join([line(generator) for counter in range(size)])
+        parameters = {'size': size}
+        yield (label('isodate.normalize', size),
+               lambda text=text: isodate.normalize(text), parameters)
+        yield (label('isodate.normalize_stream', size),
+               lambda text=text: stream(text), parameters)
+    for size in sizes:
+        texts = headers(random.Random(size), size * 100)
+        parameters = {'size': len(texts)}
+        yield (label('isodate.parse_many', len(texts)),
+               lambda texts=texts: isodate.parse_many(texts), parameters)
+        yield (label('isodate.epochs', len(texts)),
+               lambda texts=texts: isodate.epochs(texts), parameters)
+    file_name = os.environ.get('ISODATE_HEADERS')
+    if file_name:
+        with open(file_name, errors='replace') as file:
+            texts = file.read().splitlines()
+        yield ('isodate.epochs_real', lambda: isodate.epochs(texts),
+               {'size': len(texts)})
+
+
+def stream(text):
+    for block in isodate.normalize_stream(io.StringIO(text), size=1 << 16):
+        pass
@@ -0,0 +1,55 @@
+"""\
+Benchmark the costs which make up the overhead of
+`Etc.Memoire.Inventaire_Echantillon'.  An allocation heavy loop, building
+as many small linked objects as the size, runs plainly and then while
+`tracemalloc' traces it: the traced loop runs only during a fraction TAUX
+of the time.  Counting all objects by type is timed with as many extra
+objects alive as the size: it happens once every 1/TAUX calls.  With the
+default TAUX of 0.01 and one call per second, the overhead is about
+TAUX * (traced / plain - 1) + TAUX * count time, in seconds.
+"""
+
+import tracemalloc
+
+from Etc import Memoire
+
+from benchmarks import label
+
+SIZES = 10000, 100000, 1000000
+
+
+class Node:
+    __slots__ = 'value', 'next'
+
+    def __init__(self, value, next):
+        self.value = value
+        self.next = next
+
+
+def allocate(size):
+    head = None
+    for counter in range(size):
+        head = Node({'counter': counter}, head)
+    return head
+
+
+def allocate_traced(size):
+    tracemalloc.start(1)
+    try:
+        return allocate(size)
+    finally:
+        tracemalloc.stop()
+
+
+def cases(sizes):
+    inventory = Memoire.Inventaire_Echantillon()
+    for size in sizes:
+        parameters = {'size': size}
+        yield (label('memoire.allocate', size),
+               lambda size=size: allocate(size), parameters)
+        yield (label('memoire.allocate_traced', size),
+               lambda size=size: allocate_traced(size), parameters)
+        alive = allocate(size)
+        yield (label('memoire.count', size), inventory.compter_objets,
+               parameters)
+        del alive
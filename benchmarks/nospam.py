@@ -0,0 +1,59 @@
+"""\
+Benchmark the text classification of `Etc.NoSpam': word extraction, then
+natural language guessing, over a synthetic corpus of message bodies.
+Each body mostly draws its words from the hints of a single language, and
+mixes in some noise words, so the guesser has real work to do.
+"""
+
+import random
+
+from Etc.NoSpam import lingua, tools
+
+from benchmarks import label
+
+SIZES = 10, 100, 1000
+
+noise = ('xyzzy', 'qwerty', 'foo-bar', 'http', 'www', 'zzz', '$$$',
+         'Click!', 'FREE', '12345')
+
+
+def corpus(generator, size, words_per_message=120):
+    # Return SIZE message bodies.
+    by_language = {}
+    for word, languages in lingua.compiled_hints['words'].items():
+        for language in languages:
+            by_language.setdefault(language, []).append(word)
+    languages = sorted(by_language)
+    for words in by_language.values():
+        words.sort()
+    messages = []
+    for counter in range(size):
+        words = by_language[generator.choice(languages)]
+        fragments = []
+        for position in range(words_per_message):
+            if generator.random() < 0.15:
+                fragments.append(generator.choice(noise))
+            else:
+                fragments.append(generator.choice(words))
+            if position % 12 == 11:
+                fragments[-1] += '.\n'
+        messages.append(' '.join(fragments))
+    return messages
+
+
+def cases(sizes):
+    guesser = lingua.Guesser()
+    for size in sizes:
+        messages = corpus(random.Random(size), size)
+        parameters = {'size': size}
+
+        def find_words(messages=messages):
+            for message in messages:
+                tools.find_words(message)
+
+        def classify(messages=messages):
+            for message in messages:
+                guesser.language(message)
+
+        yield label('nospam.find_words', size), find_words, parameters
+        yield label('nospam.classify', size), classify, parameters
@@ -0,0 +1,85 @@
+"""\
+Benchmark `Etc.pylog' producers: logging to a line buffered file on the
+caller's thread, against logging through a Queued consumer, where the
+caller only appends to a queue.  Also time disabled log calls, with plain
+and lazy arguments, guarded or not by the `enabled' attribute, for both
+producers and logger processors; the loop overhead is measured alone, so
+it may be subtracted.
+"""
+
+import os
+import shutil
+import tempfile
+
+from Etc import pylog
+
+from benchmarks import label
+
+SIZES = 100, 1000, 10000
+
+
+def cases(sizes):
+    directory = tempfile.mkdtemp()
+    state = pylog._getstate()
+    enabled = pylog.Producer.keywords2enabled.copy()
+    try:
+        direct = pylog.Path(os.path.join(directory, 'direct.log'))
+        queued = pylog.Queued(os.path.join(directory, 'queued.log'),
+                              maximum=100000)
+        pylog.setconsumer('bench.direct', direct)
+        pylog.setconsumer('bench.queued', queued)
+        pylog.setconsumer('bench.disabled', direct)
+        pylog.disable('bench.disabled')
+        producer = pylog.Producer('bench')
+        logger = pylog.get('bench', disabled=direct)
+        pylog.disable(('bench', 'disabled'))
+        for size in sizes:
+            parameters = {'size': size}
+
+            def direct_calls(log=producer.direct, size=size):
+                for counter in range(size):
+                    log('message', counter, 'of', size)
+
+            def queued_calls(log=producer.queued, size=size):
+                for counter in range(size):
+                    log('message', counter, 'of', size)
+
+            def loop_only(size=size):
+                for counter in range(size):
+                    pass
+
+            def disabled_calls(log=producer.disabled, size=size):
+                for counter in range(size):
+                    log('message', counter, 'of', size)
+
+            def disabled_guarded_calls(log=producer.disabled, size=size):
+                for counter in range(size):
+                    if log.enabled:
+                        log('message', counter, 'of', size)
+
+            def disabled_lazy_calls(log=producer.disabled, size=size,
+                                    lazy=pylog.Lazy):
+                for counter in range(size):
+                    log('message', lazy(hex, counter))
+
+            def disabled_processor_calls(log=logger.disabled, size=size):
+                for counter in range(size):
+                    log('message', counter, 'of', size)
+
+            yield label('pylog.direct', size), direct_calls, parameters
+            yield label('pylog.queued', size), queued_calls, parameters
+            yield label('pylog.loop_only', size), loop_only, parameters
+            yield label('pylog.disabled', size), disabled_calls, parameters
+            yield (label('pylog.disabled_guarded', size),
+                   disabled_guarded_calls, parameters)
+            yield (label('pylog.disabled_lazy', size), disabled_lazy_calls,
+                   parameters)
+            yield (label('pylog.disabled_processor', size),
+                   disabled_processor_calls, parameters)
+        queued.close()
+        direct.close()
+    finally:
+        pylog.Producer.keywords2enabled.clear()
+        pylog.Producer.keywords2enabled.update(enabled)
+        pylog._setstate(state)
+        shutil.rmtree(directory)
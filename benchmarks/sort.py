@@ -0,0 +1,57 @@
+"""\
+Benchmark `Etc.sort.Polyphase', both as an in-memory sort and as a disk
+sort.  For the disk sort, the heap is kept to a tenth of the input, so
+runs are written to work files then merged.
+"""
+
+import random
+
+from Etc import sort
+
+from benchmarks import label
+
+SIZES = 1000, 10000, 100000
+
+
+def polyphase(records, **keywords):
+    # Sort RECORDS and consume the result.
+    instance = sort.Polyphase(verbose=False, **keywords)
+    instance.put_all(records)
+    for record in instance.get_all():
+        pass
+
+
+def cases(sizes):
+    for size in sizes:
+        generator = random.Random(size)
+        numbers = [generator.random() for counter in range(size)]
+        strings = ['%08x line of text' % generator.getrandbits(32)
+                   for counter in range(size)]
+        disk = max(size // 10, 10)
+        parameters = {'size': size}
+        yield (label('sort.memory', size),
+               lambda numbers=numbers, size=size:
+                   polyphase(numbers, heap_size=size),
+               parameters)
+        yield (label('sort.memory_compare', size),
+               lambda numbers=numbers, size=size:
+                   polyphase(numbers, heap_size=size, compare=compare),
+               parameters)
+        yield (label('sort.disk_pickle', size),
+               lambda numbers=numbers, disk=disk:
+                   polyphase(numbers, heap_size=disk),
+               parameters)
+        yield (label('sort.disk_marshall', size),
+               lambda numbers=numbers, disk=disk:
+                   polyphase(numbers, heap_size=disk,
+                             file_maker=sort.Marshall),
+               parameters)
+        yield (label('sort.disk_string', size),
+               lambda strings=strings, disk=disk:
+                   polyphase(strings, heap_size=disk,
+                             file_maker=sort.String),
+               parameters)
+
+
+def compare(first, second):
+    return (first > second) - (first < second)
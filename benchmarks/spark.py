@@ -0,0 +1,108 @@
+"""\
+Benchmark `Etc.spark' on a small arithmetic grammar: scanning alone, then
+scanning and parsing, over generated expressions of increasing length.
+"""
+
+import random
+
+from Etc import spark
+
+from benchmarks import label
+
+SIZES = 100, 1000, 5000
+
+
+class Token:
+    def __init__(self, type, value=None):
+        self.type = type
+        self.value = value
+
+    def __str__(self):
+        return self.type
+
+
+class Scanner(spark.Scanner):
+
+    def tokenize(self, text):
+        self.tokens = []
+        spark.Scanner.tokenize(self, text)
+        return self.tokens
+
+    def t_whitespace(self, text):
+        r' \s+ '
+
+    def t_number(self, text):
+        r' \d+ '
+        self.tokens.append(Token('number', int(text)))
+
+    def t_operator(self, text):
+        r' [-+*/()] '
+        self.tokens.append(Token(text))
+
+
+class Parser(spark.Parser):
+
+    def __init__(self):
+        spark.Parser.__init__(self, 'expression')
+
+    def typestring(self, token):
+        return token.type
+
+    def p_expression_sum(self, arguments):
+        ' expression ::= expression + term '
+        return arguments[0] + arguments[2]
+
+    def p_expression_difference(self, arguments):
+        ' expression ::= expression - term '
+        return arguments[0] - arguments[2]
+
+    def p_expression_term(self, arguments):
+        ' expression ::= term '
+        return arguments[0]
+
+    def p_term_product(self, arguments):
+        ' term ::= term * factor '
+        return arguments[0] * arguments[2]
+
+    def p_term_quotient(self, arguments):
+        ' term ::= term / factor '
+        return arguments[0] // arguments[2]
+
+    def p_term_factor(self, arguments):
+        ' term ::= factor '
+        return arguments[0]
+
+    def p_factor_number(self, arguments):
+        ' factor ::= number '
+        return arguments[0].value
+
+    def p_factor_group(self, arguments):
+        ' factor ::= ( expression ) '
+        return arguments[1]
+
+
+def expression(generator, size):
+    # Return an arithmetic expression of about SIZE tokens.
+    fragments = [str(generator.randrange(1, 1000))]
+    while len(fragments) < size:
+        operator = generator.choice('+-*/')
+        if generator.random() < 0.2:
+            fragments += [operator, '(', str(generator.randrange(1, 1000)),
+                          generator.choice('+-*'),
+                          str(generator.randrange(1, 1000)), ')']
+        else:
+            fragments += [operator, str(generator.randrange(1, 1000))]
+    return ' '.join(fragments)
+
+
+def cases(sizes):
+    scanner = Scanner()
+    parser = Parser()
+    for size in sizes:
+        text = expression(random.Random(size), size)
+        parameters = {'size': size}
+        yield (label('spark.scan', size),
+               lambda text=text: scanner.tokenize(text), parameters)
+        yield (label('spark.parse', size),
+               lambda text=text: parser.parse(scanner.tokenize(text)),
+               parameters)
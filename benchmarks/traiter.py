@@ -0,0 +1,130 @@
+"""\
+Benchmark `Etc.traiter' on a generated page which includes as many small
+templates as the size, each with a few directives.  The page is rendered
+after forgetting all compiled templates, so everything gets compiled as
+each CGI hit used to; then with only the in-process cache forgotten, so
+templates are reloaded from their marshalled copies on disk, as a cold
+CGI process would do; and finally with the in-process cache kept warm.
+The page is also served through the WSGI application, as a persistent
+worker does for each request, form decoding and configuration included.
+Another page, made of as many large literal blocks as the size, each
+followed by a single substitution, times the copying of literal text.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+
+from Etc import traiter
+
+from benchmarks import label
+
+SIZES = 10, 50, 200
+
+FRAGMENT = '''\
+<div class="bloc%(numero)d">
+<!--: Faire total = total + %(numero)d :-->
+<!--: Si total %% 2 :-->
+<b>%%(titre)s</b> impair
+<!--: Sinon :-->
+<i>%%(titre)s</i> pair
+<!--: FinSi :-->
+<ul>
+<!--: Chacun item: items :-->
+<li>%%(item)s, total %%(total)s</li>
+<!--: FinChacun :-->
+</ul>
+</div>
+'''
+
+
+def write_page(directory, size):
+    # Write a page including SIZE templates, return its file name.
+    lines = ['<html><body>\n',
+             "<!--: Faire total = 0; items = ['un', 'deux', 'trois'] :-->\n"]
+    for numero in range(size):
+        name = 'fragment%d.html' % numero
+        with open(os.path.join(directory, name), 'w') as fichier:
+            fichier.write(FRAGMENT % {'numero': numero})
+        lines.append('<!--: Inclure %s :-->\n' % name)
+    lines.append('</body></html>\n')
+    page = os.path.join(directory, 'page%d.html' % size)
+    with open(page, 'w') as fichier:
+        fichier.write(''.join(lines))
+    return page
+
+
+def write_literal_page(directory, size):
+    # Write a page of SIZE large literal blocks, return its file name.
+    block = '<tr><td class="cellule">Texte sans substitution.</td></tr>\n'
+    lines = ["<!--: Faire total = 0 :-->\n"]
+    for numero in range(size):
+        lines.append(block * 60)
+        lines.append('<!--: Faire total = total + 1 :-->\n'
+                     '<tr><td>%(total)s</td></tr>\n')
+    page = os.path.join(directory, 'literal%d.html' % size)
+    with open(page, 'w') as fichier:
+        fichier.write(''.join(lines))
+    return page
+
+
+def render(page, cache=None, forget=True):
+    # Render PAGE, maybe using the CACHE directory, and maybe after
+    # forgetting all templates compiled in this process.
+    if forget:
+        traiter.gabarits.clear()
+    if cache is not None:
+        os.environ['TRAITER_CACHE'] = cache
+    try:
+        fragments = []
+        with open(page, encoding='ISO-8859-1') as fichier:
+            traiter.Traiter(fichier, {'titre': 'Titre'}, fragments.append)
+    finally:
+        if cache is not None:
+            del os.environ['TRAITER_CACHE']
+    return ''.join(fragments)
+
+
+def serve(page):
+    # Serve PAGE through the WSGI application, return the response body,
+    # whether it comes streamed through `write' or as the returned value.
+    chunks = []
+
+    def start_response(status, headers):
+        return chunks.append
+
+    environ = {'PATH_TRANSLATED': page, 'REQUEST_METHOD': 'GET',
+               'QUERY_STRING': 'titre=Titre', 'wsgi.input': io.BytesIO()}
+    chunks.extend(traiter.application(environ, start_response))
+    return b''.join(chunks)
+
+
+def cases(sizes):
+    directory = tempfile.mkdtemp()
+    cache = os.path.join(directory, 'cache')
+    saved = os.environ.pop('TRAITER_CACHE', None)
+    try:
+        for size in sizes:
+            page = write_page(directory, size)
+            parameters = {'size': size}
+            render(page, cache)
+            yield (label('traiter.compile', size), lambda: render(page),
+                   parameters)
+            yield (label('traiter.marshal', size),
+                   lambda: render(page, cache), parameters)
+            yield (label('traiter.warm', size),
+                   lambda: render(page, forget=False), parameters)
+            expected = render(page, forget=False).encode('ISO-8859-1')
+            if serve(page) != expected:
+                raise AssertionError('WSGI page differs from %s' % page)
+            yield (label('traiter.wsgi', size), lambda: serve(page),
+                   parameters)
+            literal = write_literal_page(directory, size)
+            yield (label('traiter.literal', size),
+                   lambda: render(literal, forget=False), parameters)
+    finally:
+        traiter.gabarits.clear()
+        if saved is not None:
+            os.environ['TRAITER_CACHE'] = saved
+        shutil.rmtree(directory)
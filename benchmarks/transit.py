@@ -0,0 +1,46 @@
+"""\
+Benchmark `Etc.transit' round trips over a socket pair: a structure is
+sent, echoed back by a thread at the other end, then received.  The size
+is the number of items in the transmitted structure.
+"""
+
+import socket
+import threading
+
+from Etc import transit
+
+from benchmarks import label
+
+SIZES = 10, 1000, 100000
+
+
+def echo(prise):
+    # Send back each structure received on PRISE, until it gets closed.
+    try:
+        while True:
+            transit.envoyer(prise, transit.recevoir(prise))
+    except transit.Erreur:
+        pass
+    finally:
+        prise.close()
+
+
+def cases(sizes):
+    for size in sizes:
+        structure = [(counter, 'item %d' % counter, counter * 0.5)
+                     for counter in range(size)]
+        client, serveur = socket.socketpair()
+        thread = threading.Thread(target=echo, args=(serveur,), daemon=True)
+        thread.start()
+
+        def round_trip(client=client, structure=structure):
+            transit.envoyer(client, structure)
+            transit.recevoir(client)
+
+        try:
+            yield (label('transit.round_trip', size), round_trip,
+                   {'size': size})
+        finally:
+            client.shutdown(socket.SHUT_RDWR)
+            client.close()
+            thread.join()